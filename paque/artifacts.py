@@ -0,0 +1,233 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from paque.fingerprint import FingerprintStore
+from paque.state import state_path
+from paque.task import Task
+
+logger = logging.getLogger("paque.artifacts")
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+# Objects no entry refers to are only removed after a while: another runner
+# sharing the store may be saving the entry for them
+ORPHAN_GRACE = 3600
+
+FICLONE = 0x40049409  # From linux/fs.h
+
+CHUNK = 1 << 20
+
+
+def _digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as contents:
+        for chunk in iter(lambda: contents.read(CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _reflink(source: str, target: str) -> bool:
+    """Makes target share the blocks of source, on filesystems that can (btrfs,
+XFS). Copies are needed elsewhere"""
+    try:
+        import fcntl
+
+        with open(source, "rb") as src, open(target, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except (ImportError, OSError):
+        return False
+
+
+def _clone(source: str, target: str) -> None:
+    """Replaces target with a copy of source at once, so nobody (this or another
+runner) ever sees half of it. Hardlinks would be cheaper, but a task appending to
+an output it restored would then change what is stored"""
+    temporary = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if not _reflink(source, temporary):
+            shutil.copyfile(source, temporary)
+        shutil.copymode(source, temporary)
+        os.replace(temporary, target)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+class ArtifactStore:
+    """Outputs of tasks, saved after they run and restored instead of running
+them again when their fingerprint (command, inputs and dependencies) matches a
+previous run. Files are stored by the hash of their content (in objects/), and
+each fingerprint has an entry (in entries/) listing the files of its outputs.
+Everything is written to a temporary file first and renamed, so a store can be
+shared between runners (for instance over NFS).
+
+Once the objects go over max_bytes, the least recently used entries (the ones
+saved or restored longest ago) are evicted, with the objects only they used"""
+
+    def __init__(
+        self, path: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES
+    ) -> None:
+        self._path = path if path is not None else state_path("artifacts")
+        self._max_bytes = max_bytes
+        for folder in ["objects", "entries"]:
+            os.makedirs(os.path.join(self._path, folder), exist_ok=True)
+
+    def _object(self, digest: str) -> str:
+        return os.path.join(self._path, "objects", digest[:2], digest[2:])
+
+    def _entry(self, fingerprint: str) -> str:
+        return os.path.join(self._path, "entries", fingerprint + ".json")
+
+    @staticmethod
+    def _read_entry(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path) as entry:
+                return json.load(entry)
+        except FileNotFoundError:
+            return None
+        except ValueError as exc:
+            logger.warning("Ignoring unreadable artifact entry %s: %s", path, exc)
+            return None
+
+    def save(self, task: Task, fingerprint: str) -> None:
+        """Saving is best effort, a task that ran fine does not fail because of it"""
+        try:
+            self._save(task, fingerprint)
+        except OSError as exc:
+            logger.warning("Could not save the outputs of %s: %s", task.name, exc)
+
+    def _save(self, task: Task, fingerprint: str) -> None:
+        files = []
+        for path in FingerprintStore.expand(task.outputs):
+            digest = _digest(path)
+            stored = self._object(digest)
+            if not os.path.exists(stored):
+                os.makedirs(os.path.dirname(stored), exist_ok=True)
+                _clone(path, stored)
+            files.append([path, digest, os.stat(path).st_mode & 0o7777])
+        if len(files) == 0:
+            return
+        entry = self._entry(fingerprint)
+        temporary = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "w") as stored_entry:
+            json.dump({"task": Task.id_of(task.key), "files": files}, stored_entry)
+        os.replace(temporary, entry)
+        logger.debug("Saved %s output(s) of %s", len(files), task.name)
+
+    def restore(self, task: Task, fingerprint: str) -> bool:
+        """Whether the outputs of a run with this fingerprint were stored (and are
+now back in place)"""
+        entry_path = self._entry(fingerprint)
+        entry = self._read_entry(entry_path)
+        if entry is None:
+            return False
+        files = entry["files"]
+        if not all(os.path.exists(self._object(digest)) for _, digest, _ in files):
+            return False  # Evicted meanwhile
+        for path, digest, mode in files:
+            folder = os.path.dirname(path)
+            if folder != "":
+                os.makedirs(folder, exist_ok=True)
+            _clone(self._object(digest), path)
+            os.chmod(path, mode)
+        try:
+            os.utime(entry_path)
+        except FileNotFoundError:
+            pass
+        logger.info("Restored %s output(s) of %s", len(files), task.name)
+        return True
+
+    def _entries(self) -> List[Tuple[float, str, List[str]]]:
+        """Last use, path and objects of each entry, least recently used first"""
+        entries = []
+        folder = os.path.join(self._path, "entries")
+        for name in os.listdir(folder):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(folder, name)
+            try:
+                used = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            entry = self._read_entry(path)
+            if entry is not None:
+                entries.append(
+                    (used, path, [digest for _, digest, _ in entry["files"]])
+                )
+        return sorted(entries)
+
+    def _objects(self) -> Dict[str, Tuple[int, float]]:
+        """Size and modification time of each object, by digest"""
+        objects = {}
+        folder = os.path.join(self._path, "objects")
+        for prefix in os.listdir(folder):
+            for rest in os.listdir(os.path.join(folder, prefix)):
+                if rest.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(folder, prefix, rest))
+                except FileNotFoundError:
+                    continue
+                objects[prefix + rest] = (stat.st_size, stat.st_mtime)
+        return objects
+
+    def stats(self) -> Dict[str, int]:
+        objects = self._objects()
+        return {
+            "entries": len(self._entries()),
+            "objects": len(objects),
+            "bytes": sum(size for size, _ in objects.values()),
+            "max_bytes": self._max_bytes,
+        }
+
+    def _remove_object(self, digest: str) -> None:
+        try:
+            os.remove(self._object(digest))
+        except FileNotFoundError:
+            pass
+
+    def prune(self, max_bytes: Optional[int] = None) -> Tuple[int, int]:
+        """Evicts entries until the objects fit in max_bytes (by default, the one
+of the store), returning how many entries and bytes were removed"""
+        limit = self._max_bytes if max_bytes is None else max_bytes
+        entries = self._entries()
+        objects = self._objects()
+        users: Dict[str, int] = {}
+        for _, _, digests in entries:
+            for digest in set(digests):
+                users[digest] = users.get(digest, 0) + 1
+        removed = 0
+        now = time.time()
+        for digest, (size, modified) in objects.items():
+            if digest not in users and now - modified > ORPHAN_GRACE:
+                self._remove_object(digest)
+                removed += size
+        total = sum(size for digest, (size, _) in objects.items() if digest in users)
+        evicted = 0
+        for _, path, digests in entries:
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            evicted += 1
+            for digest in set(digests):
+                users[digest] -= 1
+                if users[digest] == 0 and digest in objects:
+                    self._remove_object(digest)
+                    removed += objects[digest][0]
+                    total -= objects[digest][0]
+        if evicted > 0:
+            logger.info(
+                "Evicted %s artifact entries, %s bytes removed", evicted, removed
+            )
+        return evicted, removed
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Any, BinaryIO, Dict, List, Optional, Set, Tuple
+
+from paque.executor import Executor
+from paque.probe import Probe
+from paque.scheduler import Scheduler
+from paque.spool import Tail
+from paque.task import Task, TaskKey
+
+logger = logging.getLogger("paque.async_executor")
+
+CHUNK = 1 << 16
+
+
+class AsyncExecutor(Executor):
+    """Runs the plan on an asyncio event loop instead of a pool of threads, so a
+single process can drive hundreds of (mostly waiting) children. Their output
+is streamed line by line, prefixed with the name of the task. Every child runs
+in its own process group, which is killed if the run is cancelled"""
+
+    def __init__(self, plan: List[Any], jobs: int = 1, **kwargs) -> None:
+        super().__init__(plan, jobs=jobs, **kwargs)
+        self._stdout: BinaryIO = self._output or sys.stdout.buffer
+        self._stderr: BinaryIO = self._output or sys.stderr.buffer
+        self._lanes: List[int] = []
+
+    def _run_plan(self) -> None:
+        asyncio.run(self._schedule())
+
+    async def _schedule(self) -> None:
+        """Same as Executor._run_parallel: start what is ready (as long as it fits
+in the budget), drain what is running on the first failure (unless keeping
+going)"""
+        scheduler = Scheduler(self._plan, self._priorities)
+        running: Dict[asyncio.Future, Task] = {}
+        failures: List[Tuple[Task, BaseException]] = []
+        finished_keys: Set[TaskKey] = set()
+        self._lanes = list(range(self._jobs, 0, -1))
+        try:
+            while not scheduler.finished():
+                while len(failures) == 0 or self._keep_going:
+                    task = self._next_task(scheduler)
+                    if task is None:
+                        break
+                    logger.debug("Starting %s", task.name)
+                    running[asyncio.ensure_future(self._run_task_async(task))] = task
+                if len(running) == 0:
+                    break
+                finished, _ = await asyncio.wait(
+                    running,
+                    timeout=self._waiting_timeout(scheduler),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for future in finished:
+                    task = running.pop(future)
+                    self._budget.release(task.resources)
+                    exc = future.exception()
+                    if exc is None:
+                        scheduler.done(task)
+                        finished_keys.add(task.key)
+                        continue
+                    logger.error("Task %s failed: %s", task.name, exc)
+                    failures.append((task, exc))
+        except asyncio.CancelledError:
+            for future in running:
+                future.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            raise
+        self._raise_failures(failures, finished_keys)
+
+    async def _run_task_async(self, task: Task) -> None:
+        if self._already_done(task):
+            return
+        loop = asyncio.get_running_loop()
+        up_to_date, fingerprint = await loop.run_in_executor(
+            None, self._check_up_to_date, task
+        )
+        if up_to_date:
+            self._record_success(task, fingerprint, None)
+            return
+        self._record_start(task)
+        lane = self._lanes.pop()
+        start = time.monotonic()
+        try:
+            with self._span(task, "task", lane):
+                ran = await self._execute_async(task, lane)
+        except BaseException as exc:
+            self._record_failure(task, exc)
+            raise
+        finally:
+            self._lanes.append(lane)
+        self._record_success(
+            task, fingerprint, time.monotonic() - start if ran else None
+        )
+
+    async def _execute_async(self, task: Task, lane: int) -> bool:
+        """Whether the task ran, that is, its condition (if any) passed"""
+        if task.message is not None:
+            logger.info(task.message)
+        condition_passes = True
+        if task.run is not None:
+            if task.condition is not None:
+                tail = Tail()
+                with self._span(task, "condition", lane):
+                    returncode = await self._shell_async(
+                        task, task.condition, copies=[tail]
+                    )
+                if returncode != 0:
+                    logger.warning(
+                        "Condition (false) triggered: %s returned %s %s",
+                        task.condition,
+                        returncode,
+                        tail,
+                    )
+                    condition_passes = False
+            if condition_passes:
+                logger.debug("Running %s", task.run)
+                spool_file = None if self._spool is None else self._spool.open(task)
+                copies = [] if spool_file is None else [spool_file]
+                try:
+                    with self._span(task, "run", lane):
+                        returncode = await self._shell_async(
+                            task, task.run, stream=True, copies=copies
+                        )
+                finally:
+                    if spool_file is not None:
+                        spool_file.close()
+                if returncode != 0:
+                    raise subprocess.CalledProcessError(returncode, task.run)
+        if task.wait_until is not None:
+            await self._wait_until_async(task, task.wait_until, lane)
+        duration = task.get_sleep()
+        if duration is not None:
+            logger.debug("Sleeping for %s", duration)
+            with self._span(task, "sleep", lane):
+                await asyncio.sleep(duration)
+        return condition_passes
+
+    async def _wait_until_async(self, task: Task, probe: Probe, lane: int) -> None:
+        """Same as Executor._wait_until, sleeping on the event loop so other tasks
+keep running meanwhile"""
+        deadline = time.monotonic() + probe.timeout
+        with self._span(task, "wait_until", lane) as details:
+            for attempt, delay in enumerate(probe.delays(), 1):
+                details["attempts"] = attempt
+                tail = Tail()
+                returncode = await self._shell_async(task, probe.command, copies=[tail])
+                if returncode == 0:
+                    logger.debug(
+                        "Probe of %s passed after %s attempt(s)", task.name, attempt
+                    )
+                    return
+                logger.debug("Probe of %s returned %s %s", task.name, returncode, tail)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Exception(
+                        f"Task {task.name} gave up waiting until {probe.command} "
+                        f"after {probe.timeout}s: {tail}"
+                    )
+                await asyncio.sleep(min(delay, remaining))
+
+    async def _shell_async(
+        self,
+        task: Task,
+        command: str,
+        stream: bool = False,
+        copies: Optional[List[Any]] = None,
+    ) -> int:
+        """Runs the command in its own process group. When streaming, output is
+shown prefixed with the task name. Either way, it is also copied (unprefixed,
+stderr merged into stdout) to the copies, and never accumulated"""
+        copies = copies or []
+        stdout, stderr = (self._stdout, self._stderr) if stream else (None, None)
+        process = await asyncio.create_subprocess_shell(
+            command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        try:
+            prefix = f"[{task.name}] ".encode("utf-8")
+            await asyncio.gather(
+                self._pump(process.stdout, stdout, prefix, copies),
+                self._pump(process.stderr, stderr, prefix, copies),
+            )
+            return await process.wait()
+        except asyncio.CancelledError:
+            await self._kill(process)
+            raise
+
+    @staticmethod
+    async def _pump(
+        stream: Optional[asyncio.StreamReader],
+        output: Optional[BinaryIO],
+        prefix: bytes,
+        copies: List[Any],
+    ) -> None:
+        """Copies stream to output a line at a time, and to the copies as it
+comes. Lines longer than CHUNK are split, so memory use does not depend on what
+the child prints"""
+        if stream is None:
+            return
+        pending = b""
+        while True:
+            chunk = await stream.read(CHUNK)
+            if not chunk:
+                break
+            for copy in copies:
+                copy.write(chunk)
+            if output is None:
+                continue
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            if len(pending) >= CHUNK:
+                lines.append(pending)
+                pending = b""
+            if len(lines) > 0:
+                output.write(b"".join(prefix + line + b"\n" for line in lines))
+                output.flush()
+        if output is not None and len(pending) > 0:
+            output.write(prefix + pending + b"\n")
+            output.flush()
+
+    @staticmethod
+    async def _kill(process: asyncio.subprocess.Process, grace: float = 2.0) -> None:
+        """Terminates the whole process group of the child, killing it if it does
+not finish in time"""
+        for sent in [signal.SIGTERM, signal.SIGKILL]:
+            try:
+                os.killpg(process.pid, sent)
+            except ProcessLookupError:
+                break
+            try:
+                await asyncio.wait_for(process.wait(), grace)
+                break
+            except asyncio.TimeoutError:
+                continue
+        logger.debug("Killed process group %s", process.pid)
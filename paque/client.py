@@ -0,0 +1,106 @@
+import json
+import os
+import socket
+import struct
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from paque.state import STATE_DIR
+
+# Thin client for `paque --daemon`: it only imports what is needed to talk to the
+# daemon, everything else (parsing, planning, running) happens there
+
+FRAME = struct.Struct(">cI")
+OUTPUT = b"o"
+LOG = b"l"
+EXIT = b"x"
+
+USAGE = "Usage: paquec [--dry-run | --list] [--jobs N] [--force] [TASK] [PATH]"
+
+
+def socket_path() -> str:
+    return os.path.join(os.getcwd(), STATE_DIR, "daemon.sock")
+
+
+def send_frame(connection: socket.socket, kind: bytes, payload: bytes) -> None:
+    connection.sendall(FRAME.pack(kind, len(payload)) + payload)
+
+
+def _receive(connection: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise EOFError("Connection closed by the daemon")
+        data += chunk
+    return data
+
+
+def read_frames(connection: socket.socket) -> Iterator[Tuple[bytes, bytes]]:
+    """Frames sent by the daemon, up to (and including) the exit status"""
+    while True:
+        kind, size = FRAME.unpack(_receive(connection, FRAME.size))
+        yield kind, _receive(connection, size)
+        if kind == EXIT:
+            return
+
+
+def parse_arguments(argv: List[str]) -> Dict[str, Any]:
+    request: Dict[str, Any] = {"command": "run", "jobs": None, "force": False}
+    positional: List[str] = []
+    arguments = iter(argv)
+    for argument in arguments:
+        if argument == "--dry-run":
+            request["command"] = "dry-run"
+        elif argument == "--list":
+            request["command"] = "list"
+        elif argument == "--force":
+            request["force"] = True
+        elif argument in ("--jobs", "-j"):
+            request["jobs"] = int(next(arguments, "0"))
+            if request["jobs"] < 1:
+                raise ValueError("The number of jobs should be at least 1")
+        elif argument.startswith("-"):
+            raise ValueError(f"Unknown option {argument}")
+        else:
+            positional.append(argument)
+    if len(positional) > 2:
+        raise ValueError("Too many arguments")
+    if request["command"] != "list" and len(positional) == 0:
+        raise ValueError("Missing argument 'TASK'")
+    request["task"] = positional[0] if len(positional) > 0 else None
+    request["path"] = positional[1] if len(positional) > 1 else None
+    return request
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    try:
+        request = parse_arguments(sys.argv[1:] if argv is None else argv)
+    except ValueError as exc:
+        print(f"{USAGE}\n\nError: {exc}", file=sys.stderr)
+        return 2
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path())
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(
+            "No paque daemon running here, start one with paque --daemon",
+            file=sys.stderr,
+        )
+        return 2
+    with connection:
+        connection.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        for kind, payload in read_frames(connection):
+            if kind == OUTPUT:
+                sys.stdout.buffer.write(payload)
+                sys.stdout.buffer.flush()
+            elif kind == LOG:
+                sys.stderr.buffer.write(payload)
+                sys.stderr.buffer.flush()
+            elif kind == EXIT:
+                return int(payload)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import json
+import logging
+import os
+import socket
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from paque.artifacts import DEFAULT_MAX_BYTES, ArtifactStore
+from paque.client import EXIT, LOG, OUTPUT, send_frame
+from paque.executor import Executor
+from paque.fingerprint import FingerprintStore
+from paque.history import History
+from paque.parser import Paquefile
+from paque.planner import Planner
+from paque.state import state_path
+from paque.task import Task
+
+logger = logging.getLogger("paque.daemon")
+
+FileKey = Tuple[int, int, int]
+
+
+class _Connection:
+    """A client connection, that frames can be sent to from several threads (when
+tasks run in parallel)"""
+
+    def __init__(self, connection: socket.socket) -> None:
+        self._connection = connection
+        self._lock = threading.Lock()
+
+    def send(self, kind: bytes, payload: bytes) -> None:
+        with self._lock:
+            send_frame(self._connection, kind, payload)
+
+
+class _OutputStream:
+    """Binary stream the output of commands is written to, sent to the client"""
+
+    def __init__(self, connection: _Connection) -> None:
+        self._connection = connection
+
+    def write(self, data: bytes) -> int:
+        self._connection.send(OUTPUT, bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+class _LogHandler(logging.Handler):
+    """Sends the log messages of a request to its client"""
+
+    def __init__(self, connection: _Connection) -> None:
+        super().__init__()
+        self._connection = connection
+        self.setFormatter(logging.Formatter("%(levelname)s - %(message)s"))
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self._connection.send(LOG, f"{self.format(record)}\n".encode("utf-8"))
+        except OSError:
+            pass
+
+
+class Daemon:
+    """Serves run, dry-run and list requests from paquec (see paque.client) over
+a Unix socket in the state folder. Parsed tasks and plans are kept in memory for
+each paquefile, and dropped once the file (or a file it includes) changes, so a
+request for a known plan only costs running it. Requests are served one at a
+time. With artifacts, runs save and restore outputs there (see
+paque.artifacts)"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        jobs: int = 1,
+        force: bool = False,
+        artifacts: Optional[str] = None,
+        artifacts_max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        self._path = path if path is not None else state_path("daemon.sock")
+        self._jobs = jobs
+        self._force = force
+        self._artifacts = artifacts
+        self._artifacts_max_bytes = artifacts_max_bytes
+        # For each paquefile: when it was loaded, its tasks and the plans made
+        self._paquefiles: Dict[
+            str, Tuple[FileKey, Paquefile, Dict[str, List[Task]]]
+        ] = {}
+
+    @staticmethod
+    def _file_key(paquefile: str) -> FileKey:
+        stat = os.stat(paquefile)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _load(self, paquefile: str) -> Tuple[FileKey, Paquefile, Dict[str, List[Task]]]:
+        paquefile = os.path.abspath(paquefile)
+        key = self._file_key(paquefile)
+        loaded = self._paquefiles.get(paquefile)
+        if loaded is None or loaded[0] != key or loaded[1].changed():
+            logger.debug("Loading %s", paquefile)
+            loaded = (key, Paquefile(paquefile), {})
+            self._paquefiles[paquefile] = loaded
+        return loaded
+
+    def tasks(self, paquefile: str) -> Paquefile:
+        return self._load(paquefile)[1]
+
+    def plan(self, paquefile: str, task: str) -> List[Task]:
+        _, tasks, plans = self._load(paquefile)
+        if task not in plans:
+            plans[task] = Planner(tasks).plan(task)
+        return plans[task]
+
+    def _listen(self) -> socket.socket:
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self._path)
+            raise Exception(f"A paque daemon is already listening on {self._path}")
+        except (FileNotFoundError, ConnectionRefusedError):
+            pass
+        finally:
+            probe.close()
+        if os.path.exists(self._path):
+            os.unlink(self._path)  # Left behind by a daemon that did not exit cleanly
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self._path)
+        server.listen()
+        return server
+
+    def serve_forever(self) -> None:
+        server = self._listen()
+        logger.info("Listening on %s", self._path)
+        try:
+            while True:
+                connection, _ = server.accept()
+                with connection:
+                    self.handle(connection)
+        finally:
+            server.close()
+            os.unlink(self._path)
+
+    @staticmethod
+    def _read_request(connection: socket.socket) -> Dict[str, Any]:
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = connection.recv(1 << 16)
+            if not chunk:
+                break
+            data += chunk
+        return json.loads(data)
+
+    def handle(self, connection: socket.socket) -> None:
+        client = _Connection(connection)
+        handler = _LogHandler(client)
+        root = logging.getLogger("paque")
+        root.addHandler(handler)
+        status = 0
+        try:
+            self._respond(self._read_request(connection), client)
+        except (Exception, SystemExit) as exc:  # The planner exits on unknown tasks
+            logger.error("Request failed: %s", exc)
+            status = 1
+        finally:
+            root.removeHandler(handler)
+        try:
+            client.send(EXIT, str(status).encode("utf-8"))
+        except OSError:
+            logger.debug("Client went away before the end of its request")
+
+    def _respond(self, request: Dict[str, Any], client: _Connection) -> None:
+        from paque.paque import get_paquefile
+
+        paquefile = get_paquefile(request.get("path"))
+        command = request.get("command")
+        if command == "list":
+            names = "".join(f"{name}\n" for name in self.tasks(paquefile))
+            client.send(OUTPUT, names.encode("utf-8"))
+            return
+        plan = self.plan(paquefile, request["task"])
+        if command == "dry-run":
+            Executor(plan).dry_run()
+            return
+        if command != "run":
+            raise Exception(f"Unknown request {command}")
+        fingerprints = None
+        if any(FingerprintStore.tracks(step) for step in plan):
+            fingerprints = FingerprintStore(
+                force=bool(self._force or request.get("force"))
+            )
+        Executor(
+            plan,
+            jobs=request.get("jobs") or self._jobs,
+            fingerprints=fingerprints,
+            output=_OutputStream(client),
+            history=History(),
+            artifacts=(
+                None
+                if self._artifacts is None or fingerprints is None
+                else ArtifactStore(
+                    self._artifacts, max_bytes=self._artifacts_max_bytes
+                )
+            ),
+        ).run()
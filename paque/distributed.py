@@ -0,0 +1,360 @@
+import json
+import logging
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from paque.executor import Executor
+from paque.scheduler import Scheduler
+from paque.task import Task
+
+logger = logging.getLogger("paque.distributed")
+
+HEARTBEAT_INTERVAL = 1.0
+HEARTBEAT_TIMEOUT = 10.0
+TICK = 0.1
+
+
+def parse_address(address: str) -> Tuple[int, Any]:
+    """unix:PATH (or anything with a /) is a Unix socket, HOST:PORT is TCP"""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:") :]
+    if "/" in address:
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(":")
+    if host == "" or not port.isdigit():
+        raise Exception(f"Invalid address {address}, expected HOST:PORT or unix:PATH")
+    return socket.AF_INET, (host, int(port))
+
+
+class _Channel:
+    """Newline delimited JSON messages over a connected socket. Sending is safe
+from several threads"""
+
+    def __init__(self, connection: socket.socket) -> None:
+        self.connection = connection
+        self._buffer = b""
+        self._lock = threading.Lock()
+
+    def send(self, message: Dict[str, Any]) -> None:
+        data = json.dumps(message).encode("utf-8") + b"\n"
+        with self._lock:
+            self.connection.sendall(data)
+
+    def receive(self) -> List[Dict[str, Any]]:
+        """Reads once from the socket, returning the messages completed by it.
+Raises EOFError once the other end has closed the connection"""
+        chunk = self.connection.recv(1 << 16)
+        if not chunk:
+            raise EOFError("Connection closed")
+        *lines, self._buffer = (self._buffer + chunk).split(b"\n")
+        return [json.loads(line) for line in lines if len(line) > 0]
+
+
+class _RemoteWorker:
+    def __init__(self, channel: _Channel) -> None:
+        self.channel = channel
+        self.name = "unknown worker"
+        self.slots = 0  # Nothing is sent to it until it says hello
+        self.running: Dict[int, Task] = {}
+        self.last_seen = time.monotonic()
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class Coordinator:
+    """Runs a plan on the workers (see Worker) connected to address, sending each
+of them as many ready tasks as it has slots. Workers send heartbeats: a worker
+that disconnects or stays silent for longer than heartbeat_timeout is dropped,
+and the tasks it was running are sent to another worker, up to retries times.
+The output of the tasks is streamed back, and shown prefixed with their name.
+Like the executors, the first failure stops sending new tasks, waits for the
+ones running and is raised"""
+
+    def __init__(
+        self,
+        plan: List[Task],
+        address: str,
+        heartbeat_timeout: float = HEARTBEAT_TIMEOUT,
+        retries: int = 2,
+        output: Optional[BinaryIO] = None,
+    ) -> None:
+        self._plan = plan
+        self._address = address
+        self._heartbeat_timeout = heartbeat_timeout
+        self._retries = retries
+        self._output = output if output is not None else sys.stdout.buffer
+        self._scheduler = Scheduler(plan)
+        self._ids = {task.key: index for index, task in enumerate(plan)}
+        self._workers: Dict[socket.socket, _RemoteWorker] = {}
+        self._attempts: Dict[int, int] = {}
+        self._pending_output: Dict[int, bytes] = {}
+        self._failure: Optional[Exception] = None
+
+    def _listen(self) -> socket.socket:
+        family, address = parse_address(self._address)
+        server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            if os.path.exists(address):
+                os.unlink(address)
+        else:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(address)
+        server.listen()
+        return server
+
+    def _fail(self, failure: Exception) -> None:
+        logger.error("%s", failure)
+        if self._failure is None:
+            self._failure = failure
+
+    def _running(self) -> int:
+        return sum(len(worker.running) for worker in self._workers.values())
+
+    def _dispatch(self) -> None:
+        while self._failure is None and self._scheduler.has_ready():
+            available = [
+                worker
+                for worker in self._workers.values()
+                if len(worker.running) < worker.slots
+            ]
+            if len(available) == 0:
+                return
+            worker = min(available, key=lambda worker: len(worker.running))
+            task = self._scheduler.pop_ready()
+            task_id = self._ids[task.key]
+            worker.running[task_id] = task
+            logger.info(">>> Running task %s on %s", task.name, worker)
+            try:
+                worker.channel.send(
+                    {"type": "run", "id": task_id, "task": task.to_dict()}
+                )
+            except OSError as exc:
+                self._lose(worker, f"can't send to it ({exc})")
+
+    def _lose(self, worker: _RemoteWorker, reason: str) -> None:
+        """Drops the worker, handing its tasks out again"""
+        logger.warning("Lost %s: %s", worker, reason)
+        connection = worker.channel.connection
+        self._selector.unregister(connection)
+        del self._workers[connection]
+        connection.close()
+        for task_id, task in worker.running.items():
+            self._attempts[task_id] = self._attempts.get(task_id, 0) + 1
+            if self._attempts[task_id] > self._retries:
+                self._fail(Exception(f"Task {task.name} lost too many workers"))
+            else:
+                logger.info("Task %s will run again", task.name)
+                self._scheduler.retry(task)
+
+    def _show(self, task_id: int, data: bytes, final: bool = False) -> None:
+        """Output of a task, shown a line at a time prefixed with its name"""
+        lines = (self._pending_output.pop(task_id, b"") + data).split(b"\n")
+        pending = lines.pop()
+        if final and len(pending) > 0:
+            lines.append(pending)
+        elif len(pending) > 0:
+            self._pending_output[task_id] = pending
+        if len(lines) > 0:
+            prefix = f"[{self._plan[task_id].name}] ".encode("utf-8")
+            self._output.write(b"".join(prefix + line + b"\n" for line in lines))
+            self._output.flush()
+
+    def _handle(self, worker: _RemoteWorker, message: Dict[str, Any]) -> None:
+        kind = message.get("type")
+        if kind == "hello":
+            worker.name = message.get("name", worker.name)
+            worker.slots = int(message.get("slots", 1))
+            logger.info("%s joined with %s slot(s)", worker, worker.slots)
+        elif kind == "output":
+            self._show(message["id"], message["data"].encode("utf-8"))
+        elif kind == "result":
+            task = worker.running.pop(message["id"])
+            self._show(message["id"], b"", final=True)
+            if message["status"] == 0:
+                self._scheduler.done(task)
+            else:
+                self._fail(
+                    Exception(
+                        f"Task {task.name} failed on {worker}: {message['error']}"
+                    )
+                )
+
+    def _check_heartbeats(self) -> None:
+        now = time.monotonic()
+        for worker in list(self._workers.values()):
+            if now - worker.last_seen > self._heartbeat_timeout:
+                self._lose(worker, f"no heartbeat for {self._heartbeat_timeout}s")
+
+    def run(self) -> None:
+        server = self._listen()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(server, selectors.EVENT_READ)
+        logger.info("Waiting for workers on %s", self._address)
+        try:
+            while not self._scheduler.finished():
+                self._dispatch()
+                if self._failure is not None and self._running() == 0:
+                    break
+                for key, _ in self._selector.select(timeout=TICK):
+                    if key.fileobj is server:
+                        connection, _ = server.accept()
+                        self._selector.register(connection, selectors.EVENT_READ)
+                        self._workers[connection] = _RemoteWorker(_Channel(connection))
+                        continue
+                    worker = self._workers[key.fileobj]  # type: ignore
+                    try:
+                        messages = worker.channel.receive()
+                    except (EOFError, OSError) as exc:
+                        self._lose(worker, str(exc))
+                        continue
+                    worker.last_seen = time.monotonic()
+                    for message in messages:
+                        self._handle(worker, message)
+                self._check_heartbeats()
+        finally:
+            for worker in self._workers.values():
+                try:
+                    worker.channel.send({"type": "shutdown"})
+                except OSError:
+                    pass
+                worker.channel.connection.close()
+            self._selector.close()
+            server.close()
+            family, address = parse_address(self._address)
+            if family == socket.AF_UNIX and os.path.exists(address):
+                os.unlink(address)
+        if self._failure is not None:
+            raise self._failure
+
+
+class _OutputMessages:
+    """Binary stream sending what is written to it to the coordinator"""
+
+    def __init__(self, channel: _Channel, task_id: int) -> None:
+        self._channel = channel
+        self._task_id = task_id
+
+    def write(self, data: bytes) -> int:
+        text = bytes(data).decode("utf-8", errors="replace")
+        self._channel.send({"type": "output", "id": self._task_id, "data": text})
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+class Worker:
+    """Connects to a Coordinator and runs the tasks it sends, up to slots at the
+same time, until it is told to shut down or the coordinator goes away.
+
+Once the coordinator goes away (or drops this worker for missing heartbeats),
+the tasks running are killed, since the coordinator hands them to other workers.
+A worker that can not tell (say, cut off by the network) keeps running them
+until it can, so a task may run more than once, at the same time"""
+
+    def __init__(
+        self,
+        address: str,
+        slots: int = 1,
+        name: Optional[str] = None,
+        heartbeat_interval: float = HEARTBEAT_INTERVAL,
+        connect_timeout: float = 30.0,
+    ) -> None:
+        self._address = address
+        self._slots = slots
+        self._name = (
+            name if name is not None else f"{socket.gethostname()}:{os.getpid()}"
+        )
+        self._heartbeat_interval = heartbeat_interval
+        self._connect_timeout = connect_timeout
+        self._lock = threading.Lock()
+        self._executors: Dict[int, Executor] = {}
+        self._abandoned = False
+
+    def _connect(self) -> socket.socket:
+        """The coordinator may not be listening yet"""
+        family, address = parse_address(self._address)
+        deadline = time.monotonic() + self._connect_timeout
+        while True:
+            connection = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                connection.connect(address)
+                return connection
+            except OSError as exc:
+                connection.close()
+                if time.monotonic() > deadline:
+                    raise Exception(f"Can't connect to {self._address}: {exc}")
+                time.sleep(TICK)
+
+    def _beat(self, channel: _Channel, stop: threading.Event) -> None:
+        while not stop.wait(self._heartbeat_interval):
+            try:
+                channel.send({"type": "heartbeat"})
+            except OSError:
+                return
+
+    def _run(self, channel: _Channel, task_id: int, task: Task) -> None:
+        result: Dict[str, Any] = {"type": "result", "id": task_id, "status": 0}
+        executor = Executor(
+            [task], output=_OutputMessages(channel, task_id), process_groups=True
+        )
+        with self._lock:
+            if self._abandoned:
+                return
+            self._executors[task_id] = executor
+        try:
+            executor.run()
+        except Exception as exc:
+            result.update(status=1, error=str(exc))
+        finally:
+            with self._lock:
+                del self._executors[task_id]
+        try:
+            channel.send(result)
+        except OSError as exc:
+            logger.warning("Can't report %s to the coordinator: %s", task.name, exc)
+
+    def _abandon(self) -> None:
+        """Kills the tasks running and skips the ones not started yet"""
+        with self._lock:
+            self._abandoned = True
+            executors = list(self._executors.values())
+        for executor in executors:
+            executor.cancel()
+
+    def run(self) -> None:
+        connection = self._connect()
+        channel = _Channel(connection)
+        channel.send({"type": "hello", "name": self._name, "slots": self._slots})
+        logger.info("Connected to %s as %s", self._address, self._name)
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._beat, args=(channel, stop), daemon=True
+        )
+        heartbeat.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self._slots) as pool:
+                while not stop.is_set():
+                    try:
+                        messages = channel.receive()
+                    except (EOFError, OSError):
+                        logger.info("The coordinator went away")
+                        self._abandon()
+                        break
+                    for message in messages:
+                        if message["type"] == "shutdown":
+                            logger.info("Shutting down")
+                            stop.set()
+                        elif message["type"] == "run":
+                            task = Task.from_dict(message["task"])
+                            pool.submit(self._run, channel, message["id"], task)
+        finally:
+            stop.set()
+            connection.close()
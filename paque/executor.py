@@ -1,14 +1,102 @@
 import logging
-import subprocess
+import os
+import signal
+import sys
+import threading
 import time
-from typing import Any, List
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from io import BufferedReader
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    ContextManager,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    cast,
+)
+
+from paque.artifacts import ArtifactStore
+from paque.fingerprint import FingerprintStore
+from paque.history import History
+from paque.journal import Journal
+from paque.probe import Probe
+from paque.resources import LOAD_CHECK_INTERVAL, Budget
+from paque.scheduler import Scheduler
+from paque.spool import LogSpool, Tail
+from paque.task import Task, TaskKey
+from paque.trace import Tracer, usage_details
+
+if TYPE_CHECKING:  # It imports subprocess, which dry runs do not need
+    from paque.shellpool import ShellPool
 
 logger = logging.getLogger("paque.executor")
 
+CHUNK = 1 << 16
+
 
 class Executor:
-    def __init__(self, plan: List[Any]) -> None:
+    def __init__(
+        self,
+        plan: List[Any],
+        jobs: int = 1,
+        fingerprints: Optional[FingerprintStore] = None,
+        tracer: Optional[Tracer] = None,
+        spool: Optional[LogSpool] = None,
+        shell_pool: Optional["ShellPool"] = None,
+        output: Optional[Any] = None,
+        budget: Optional[Budget] = None,
+        history: Optional[History] = None,
+        journal: Optional[Journal] = None,
+        keep_going: bool = False,
+        artifacts: Optional[ArtifactStore] = None,
+        process_groups: bool = False,
+    ) -> None:
+        """Commands inherit our stdout and stderr, unless there is an output (a
+binary stream) to copy both to. Running tasks in parallel, they share the budget
+(by default, one cpu slot per job). With a history, how long each task takes is
+recorded, and ready tasks on the longest remaining path start first. With a
+journal, tasks are recorded as they start and finish, and the ones that finished
+in the run being resumed are skipped. Keeping going, a failure does not stop the
+tasks not depending on it, and every failure is reported at the end. With an
+artifact store (and fingerprints), the outputs of tasks are saved once they run,
+and restored instead of running tasks whose fingerprint matches a saved run. With
+process groups, each command runs in its own, so cancel can kill it together with
+everything it started"""
         self._plan = plan
+        if jobs < 1:
+            raise Exception("The number of jobs should be at least 1")
+        self._jobs = jobs
+        self._fingerprints = fingerprints
+        self._tracer = tracer
+        self._spool = spool
+        self._shell_pool = shell_pool
+        self._output = output
+        self._budget = budget if budget is not None else Budget(jobs)
+        self._history = history
+        self._priorities: Optional[Dict[TaskKey, float]] = None
+        self._journal = journal
+        self._keep_going = keep_going
+        self._artifacts = artifacts
+        self._process_groups = process_groups
+        self._groups_lock = threading.Lock()
+        self._running_groups: Set[int] = set()
+        self._cancelled = False
+
+    def cancel(self) -> None:
+        """Kills the commands running in their own process group, and keeps new
+ones from starting, so the run fails"""
+        with self._groups_lock:
+            self._cancelled = True
+            for group in self._running_groups:
+                try:
+                    os.killpg(group, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                logger.debug("Killed process group %s", group)
 
     def dry_run(self) -> None:
         logger.debug("The plan: %s", self._plan)
@@ -19,33 +107,360 @@ class Executor:
             )
             for msg, log in msgs:
                 logger.info("%s: %s", msg, log)
+            if task.wait_until is not None:
+                logger.info("wait_until: %s", task.wait_until.command)
 
     def run(self) -> None:
         logger.info("Running plan")
+        prediction = self._predict()
+        start = time.monotonic()
+        success = False
+        try:
+            self._run_plan()
+            success = True
+        finally:
+            if self._journal is not None:
+                self._journal.close(success)
+            if self._fingerprints is not None:
+                self._fingerprints.save()
+            if self._history is not None:
+                self._history.save()
+            if self._artifacts is not None:
+                self._artifacts.prune()
+            if self._tracer is not None:
+                self._tracer.log_summary(self._plan)
+        if prediction is not None:
+            logger.info(
+                ">>> Took %.1fs, estimated %.1fs", time.monotonic() - start, prediction
+            )
+
+    def _predict(self) -> Optional[float]:
+        """From how long tasks took before: prioritizes the ones with the longest
+path to the end of the plan, and estimates how long the plan will take"""
+        if self._history is None:
+            return None
+        estimates = self._history.estimates(self._plan)
+        if estimates is None:
+            return None
+        self._priorities = History.remaining(self._plan, estimates)
+        prediction = History.predict(estimates, self._priorities, self._jobs)
+        logger.info(">>> Estimated time: %.1fs", prediction)
+        return prediction
+
+    def _run_plan(self) -> None:
+        if self._jobs == 1:
+            self._run_sequential()
+        else:
+            self._run_parallel()
+
+    def _run_sequential(self) -> None:
+        """Runs the tasks one at a time, in plan order. Keeping going, the tasks
+depending (even indirectly) on a failed one are not run"""
+        failures: List[Tuple[Task, BaseException]] = []
+        blocked: Set[TaskKey] = set()
         for task in self._plan:
-            message = task.message
-            if message is not None:
-                logger.info(message)
-            run = task.run
-            condition = task.condition
-            if run is not None:
-                condition_passes = True
-                if condition is not None:
-                    try:
-                        subprocess.run(
-                            condition, shell=True, check=True, capture_output=True
+            if any(key in blocked for key in task.dependency_keys):
+                blocked.add(task.key)
+                continue
+            try:
+                self._run_task(task)
+            except Exception as exc:
+                if not self._keep_going:
+                    raise
+                logger.error("Task %s failed: %s", task.name, exc)
+                failures.append((task, exc))
+                blocked.add(task.key)
+        self._raise_failures(failures, {task.key for task in self._plan} - blocked)
+
+    def _raise_failures(
+        self, failures: List[Tuple[Task, BaseException]], finished: Set[TaskKey]
+    ) -> None:
+        """A single failure is raised as is, unless keeping going. Then what did
+not run because of the failures is logged, and all of them are raised together"""
+        if len(failures) == 0:
+            return
+        if not self._keep_going:
+            raise failures[0][1]
+        failed = {task.key for task, _ in failures}
+        not_run = [
+            task.name
+            for task in self._plan
+            if task.key not in finished and task.key not in failed
+        ]
+        if len(not_run) > 0:
+            logger.error("Not run, depending on failed tasks: %s", not_run)
+        raise Exception(
+            "{} task(s) failed: {}".format(
+                len(failures), ", ".join(task.name for task, _ in failures)
+            )
+        )
+
+    def _next_task(self, scheduler: Scheduler) -> Optional[Task]:
+        """The first ready task that fits in what is left of the budget"""
+        budget = self._budget
+        if not scheduler.has_ready() or budget.full():
+            return None
+        task = scheduler.pop_ready_if(lambda task: budget.fits(task.resources))
+        if task is not None:
+            budget.acquire(task.resources)
+        return task
+
+    def _waiting_timeout(self, scheduler: Scheduler) -> Optional[float]:
+        """Tasks held back by the load average are not waiting for any task to
+finish, the load is looked at again after a while"""
+        if self._budget.load_average is not None and scheduler.has_ready():
+            return LOAD_CHECK_INTERVAL
+        return None
+
+    def _run_parallel(self) -> None:
+        """Runs every task as soon as all its dependencies have finished and it
+fits in the budget (by default, at most self._jobs at the same time). On the
+first failure no more tasks are started (unless keeping going, then only the
+ones depending on it are not), the ones already running are drained and the
+failure is raised"""
+        scheduler = Scheduler(self._plan, self._priorities)
+        running: Dict[Future, Task] = {}
+        failures: List[Tuple[Task, BaseException]] = []
+        finished_keys: Set[TaskKey] = set()
+        with ThreadPoolExecutor(max_workers=self._jobs) as pool:
+            while not scheduler.finished():
+                while len(failures) == 0 or self._keep_going:
+                    task = self._next_task(scheduler)
+                    if task is None:
+                        break
+                    logger.debug("Starting %s", task.name)
+                    running[pool.submit(self._run_task, task)] = task
+                if len(running) == 0:
+                    break
+                finished, _ = wait(
+                    running,
+                    timeout=self._waiting_timeout(scheduler),
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in finished:
+                    task = running.pop(future)
+                    self._budget.release(task.resources)
+                    exc = future.exception()
+                    if exc is None:
+                        scheduler.done(task)
+                        finished_keys.add(task.key)
+                        continue
+                    logger.error("Task %s failed: %s", task.name, exc)
+                    failures.append((task, exc))
+                    if len(failures) == 1 and not self._keep_going and running:
+                        logger.info(
+                            "Waiting for %s running task(s) to finish", len(running)
                         )
-                    except Exception as exc:
-                        logger.warning("Condition (false) triggered: %s", exc)
-                        condition_passes = False
-                if condition_passes:
-                    logger.debug("Running %s", run)
-                    subprocess.run(run, shell=True, check=True)
-                else:
+        self._raise_failures(failures, finished_keys)
+
+    def _check_up_to_date(self, task: Task) -> Tuple[bool, Optional[str]]:
+        """Whether the task can be skipped, and its fingerprint to record once it
+has run"""
+        if self._fingerprints is None:
+            return False, None
+        fingerprint = self._fingerprints.fingerprint(task)
+        if self._fingerprints.up_to_date(task, fingerprint):
+            logger.info("Task %s is up to date", task.name)
+            return True, fingerprint
+        if self._restore_outputs(task, fingerprint):
+            self._fingerprints.record(task, fingerprint)
+            return True, fingerprint
+        return False, fingerprint
+
+    def _restore_outputs(self, task: Task, fingerprint: str) -> bool:
+        if self._artifacts is None or task.outputs is None:
+            return False
+        if self._fingerprints is None or self._fingerprints.force:
+            return False
+        return self._artifacts.restore(task, fingerprint)
+
+    def _already_done(self, task: Task) -> bool:
+        """Whether the task finished in the run being resumed"""
+        if self._journal is None or not self._journal.completed(task):
+            return False
+        logger.info("Task %s already finished, resuming", task.name)
+        self._journal.finished(task)
+        return True
+
+    def _record_start(self, task: Task) -> None:
+        if self._journal is not None:
+            self._journal.started(task)
+
+    def _record_failure(self, task: Task, exc: BaseException) -> None:
+        if self._journal is not None:
+            self._journal.finished(task, exc)
+
+    def _record_success(
+        self, task: Task, fingerprint: Optional[str], duration: Optional[float]
+    ) -> None:
+        """Without a duration, the task did not run: it was up to date, or its
+condition did not pass"""
+        if duration is not None:
+            if self._fingerprints is not None and fingerprint is not None:
+                self._fingerprints.record(task, fingerprint)
+                if self._artifacts is not None and task.outputs is not None:
+                    self._artifacts.save(task, fingerprint)
+            if self._history is not None:
+                self._history.record(task, duration)
+        if self._journal is not None:
+            self._journal.finished(task)
+
+    def _run_task(self, task: Task) -> None:
+        if self._already_done(task):
+            return
+        up_to_date, fingerprint = self._check_up_to_date(task)
+        if up_to_date:
+            self._record_success(task, fingerprint, None)
+            return
+        self._record_start(task)
+        start = time.monotonic()
+        try:
+            with self._span(task, "task"):
+                ran = self._execute(task)
+        except BaseException as exc:
+            self._record_failure(task, exc)
+            raise
+        self._record_success(
+            task, fingerprint, time.monotonic() - start if ran else None
+        )
+
+    def _span(
+        self, task: Task, phase: str, lane: Optional[int] = None
+    ) -> ContextManager[Dict[str, Any]]:
+        if self._tracer is None:
+            return nullcontext({})
+        return self._tracer.span(task, phase, lane)
+
+    def _shell(self, command: str, outputs: Optional[List[Any]] = None) -> Any:
+        """Runs the command in a shell, waiting for it with wait4 to get the
+resource usage of the child (which is returned). Raises CalledProcessError like
+subprocess.run with check=True would. With outputs, stdout and stderr are
+merged and copied to each of them a chunk at a time, instead of inherited.
+
+With a shell pool, the command is sent to one of its shells instead, and there
+is no resource usage to return"""
+        # Only needed when actually running, dry runs do not pay for it
+        import subprocess
+
+        if self._shell_pool is not None:
+            returncode = self._shell_pool.run(command, outputs, cwd=os.getcwd())
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, command)
+            return None
+
+        pipe = subprocess.PIPE if outputs is not None else None
+        stderr = subprocess.STDOUT if outputs is not None else None
+        with self._groups_lock:
+            if self._cancelled:
+                raise Exception(f"Cancelled before running {command}")
+            process = subprocess.Popen(
+                command,
+                shell=True,
+                stdout=pipe,
+                stderr=stderr,
+                start_new_session=self._process_groups,
+            )
+            if self._process_groups:
+                self._running_groups.add(process.pid)
+        try:
+            if process.stdout is not None:
+                stdout = cast(BufferedReader, process.stdout)
+                for chunk in iter(lambda: stdout.read1(CHUNK), b""):
+                    for output in outputs or []:
+                        output.write(chunk)
+                        output.flush()
+                stdout.close()
+            _, status, usage = os.wait4(process.pid, 0)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            with self._groups_lock:
+                self._running_groups.discard(process.pid)
+        if os.WIFSIGNALED(status):
+            returncode = -os.WTERMSIG(status)
+        else:
+            returncode = os.WEXITSTATUS(status)
+        process.returncode = returncode
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command)
+        return usage
+
+    def _condition_passes(self, task: Task, condition: str) -> bool:
+        """Only the tail of what the condition prints is kept, to explain why it
+did not pass"""
+        tail = Tail()
+        with self._span(task, "condition") as details:
+            try:
+                details.update(usage_details(self._shell(condition, [tail])))
+            except Exception as exc:
+                logger.warning("Condition (false) triggered: %s %s", exc, tail)
+                return False
+        return True
+
+    def _wait_until(self, task: Task, probe: Probe) -> None:
+        """Runs the probe until it succeeds, backing off between attempts. Only
+the thread running this task waits"""
+        deadline = time.monotonic() + probe.timeout
+        with self._span(task, "wait_until") as details:
+            for attempt, delay in enumerate(probe.delays(), 1):
+                details["attempts"] = attempt
+                tail = Tail()
+                try:
+                    self._shell(probe.command, [tail])
                     logger.debug(
-                        "Not running %s due to condition %s not passing", run, condition
+                        "Probe of %s passed after %s attempt(s)", task.name, attempt
                     )
-            duration = task.get_sleep()
-            if duration is not None:
-                logger.debug("Sleeping for %s", duration)
+                    return
+                except Exception as exc:
+                    if self._cancelled:
+                        raise
+                    logger.debug("Probe of %s failed: %s %s", task.name, exc, tail)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Exception(
+                        f"Task {task.name} gave up waiting until {probe.command} "
+                        f"after {probe.timeout}s: {tail}"
+                    )
+                time.sleep(min(delay, remaining))
+
+    def _run_command(self, task: Task, run: str) -> None:
+        outputs = None if self._output is None else [self._output]
+        spool_file = None
+        if self._spool is not None:
+            spool_file = self._spool.open(task)
+            outputs = [self._output or sys.stdout.buffer, spool_file]
+        try:
+            with self._span(task, "run") as details:
+                details.update(usage_details(self._shell(run, outputs)))
+        finally:
+            if spool_file is not None:
+                spool_file.close()
+
+    def _execute(self, task: Task) -> bool:
+        """Whether the task ran, that is, its condition (if any) passed"""
+        message = task.message
+        if message is not None:
+            logger.info(message)
+        run = task.run
+        condition = task.condition
+        condition_passes = True
+        if run is not None:
+            if condition is not None:
+                condition_passes = self._condition_passes(task, condition)
+            if condition_passes:
+                logger.debug("Running %s", run)
+                self._run_command(task, run)
+            else:
+                logger.debug(
+                    "Not running %s due to condition %s not passing", run, condition
+                )
+        if task.wait_until is not None:
+            self._wait_until(task, task.wait_until)
+        duration = task.get_sleep()
+        if duration is not None:
+            logger.debug("Sleeping for %s", duration)
+            with self._span(task, "sleep"):
                 time.sleep(duration)
+        return condition_passes
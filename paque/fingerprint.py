@@ -0,0 +1,143 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from paque.state import state_path
+from paque.task import Task, TaskKey
+
+logger = logging.getLogger("paque.fingerprint")
+
+FileEntry = Tuple[int, int, str]
+
+
+class FingerprintStore:
+    """Remembers a fingerprint of each task that has run: the interpolated run and
+condition, the content of its inputs and the fingerprints of its dependencies.
+A task declaring inputs or outputs whose fingerprint has not changed (and whose
+outputs exist) does not need to run again. Since fingerprints include the ones
+of the dependencies, any change invalidates everything downstream.
+
+File contents are only rehashed when their modification time or size change"""
+
+    def __init__(self, path: Optional[str] = None, force: bool = False) -> None:
+        self._path = path if path is not None else state_path("fingerprints.json")
+        self._force = force
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, str] = {}
+        self._files: Dict[str, FileEntry] = {}
+        self._current: Dict[str, str] = {}
+        self._load()
+
+    @staticmethod
+    def _id(key: TaskKey) -> str:
+        """Tasks are stored under their name with sorted arguments, so the order
+they are written in does not matter"""
+        return Task.id_of(key)
+
+    @property
+    def force(self) -> bool:
+        return self._force
+
+    @staticmethod
+    def tracks(task: Task) -> bool:
+        return task.inputs is not None or task.outputs is not None
+
+    def _load(self) -> None:
+        try:
+            with open(self._path) as store:
+                stored = json.load(store)
+            self._tasks = stored["tasks"]
+            self._files = {
+                path: tuple(entry)  # type: ignore
+                for path, entry in stored["files"].items()
+            }
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as exc:
+            logger.warning(
+                "Ignoring unreadable fingerprint store %s: %s", self._path, exc
+            )
+
+    def save(self) -> None:
+        with self._lock:
+            stored = {"tasks": self._tasks, "files": self._files}
+            temporary = self._path + ".tmp"
+            with open(temporary, "w") as store:
+                json.dump(stored, store)
+            os.replace(temporary, self._path)
+
+    def _file_digest(self, path: str) -> str:
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._files.get(path)
+        if (
+            cached is not None
+            and cached[0] == stat.st_mtime_ns
+            and cached[1] == stat.st_size
+        ):
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as contents:
+            for chunk in iter(lambda: contents.read(1 << 20), b""):
+                digest.update(chunk)
+        with self._lock:
+            self._files[path] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+        return digest.hexdigest()
+
+    @staticmethod
+    def expand(patterns: Optional[Sequence[str]]) -> List[str]:
+        """Files matched by a list of globs, sorted and without duplicates"""
+        if patterns is None:
+            return []
+        matched: Set[str] = set()
+        for pattern in patterns:
+            matched.update(
+                path
+                for path in glob.glob(pattern, recursive=True)
+                if os.path.isfile(path)
+            )
+        return sorted(matched)
+
+    def fingerprint(self, task: Task) -> str:
+        """Computed once the dependencies of the task have finished, since they
+may be the ones producing its inputs"""
+        dependencies: List[Tuple[str, Optional[str]]] = []
+        for key in task.dependency_keys:
+            dependency = self._id(key)
+            with self._lock:
+                known = self._current.get(dependency, self._tasks.get(dependency))
+            dependencies.append((dependency, known))
+        description = {
+            "run": task.run,
+            "condition": task.condition,
+            "inputs": [
+                [path, self._file_digest(path)] for path in self.expand(task.inputs)
+            ],
+            "outputs": task.outputs,
+            "depends": sorted(dependencies, key=lambda item: item[0]),
+        }
+        encoded = json.dumps(description, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _outputs_exist(self, task: Task) -> bool:
+        return all(
+            len(glob.glob(pattern, recursive=True)) > 0
+            for pattern in task.outputs or []
+        )
+
+    def up_to_date(self, task: Task, fingerprint: str) -> bool:
+        with self._lock:
+            self._current[self._id(task.key)] = fingerprint
+            previous = self._tasks.get(self._id(task.key))
+        if self._force or not self.tracks(task):
+            return False
+        return previous == fingerprint and self._outputs_exist(task)
+
+    def record(self, task: Task, fingerprint: str) -> None:
+        with self._lock:
+            self._current[self._id(task.key)] = fingerprint
+            self._tasks[self._id(task.key)] = fingerprint
@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+from paque.state import state_path
+from paque.task import Task, TaskKey
+
+logger = logging.getLogger("paque.history")
+
+# Weight of the last run in the estimate, the rest is what was estimated before
+SMOOTHING = 0.3
+
+
+class History:
+    """How long tasks took in previous runs, kept as an exponentially weighted
+moving average of each (by name, with sorted arguments) in the state folder.
+It estimates how long is left from each task to the end of a plan, to start
+first the ready tasks on the longest path"""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self._path = path if path is not None else state_path("history.json")
+        self._lock = threading.Lock()
+        self._durations: Dict[str, float] = {}
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self._path) as store:
+                self._durations = {
+                    name: float(duration)
+                    for name, duration in json.load(store)["durations"].items()
+                }
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            logger.warning("Ignoring unreadable history %s: %s", self._path, exc)
+
+    def save(self) -> None:
+        with self._lock:
+            stored = {"durations": self._durations}
+            temporary = self._path + ".tmp"
+            with open(temporary, "w") as store:
+                json.dump(stored, store)
+            os.replace(temporary, self._path)
+
+    def estimate(self, task: Task) -> Optional[float]:
+        with self._lock:
+            return self._durations.get(Task.id_of(task.key))
+
+    def record(self, task: Task, duration: float) -> None:
+        task_id = Task.id_of(task.key)
+        with self._lock:
+            previous = self._durations.get(task_id)
+            if previous is None:
+                self._durations[task_id] = duration
+            else:
+                self._durations[task_id] = (
+                    SMOOTHING * duration + (1 - SMOOTHING) * previous
+                )
+
+    def estimates(self, plan: List[Task]) -> Optional[Dict[TaskKey, float]]:
+        """Estimated duration of each task of the plan. Tasks that never ran are
+assumed to take as long as the average of the ones that did. None if no task
+of the plan ever ran"""
+        known = {task.key: self.estimate(task) for task in plan}
+        durations = [duration for duration in known.values() if duration is not None]
+        if len(durations) == 0:
+            return None
+        average = sum(durations) / len(durations)
+        return {
+            key: average if duration is None else duration
+            for key, duration in known.items()
+        }
+
+    @staticmethod
+    def remaining(
+        plan: List[Task], estimates: Dict[TaskKey, float]
+    ) -> Dict[TaskKey, float]:
+        """Estimated time from the start of each task to the end of the plan: its
+duration plus the longest remaining time of the tasks depending on it. The plan
+is topologically sorted, so a single pass backwards is enough"""
+        dependents: Dict[TaskKey, List[TaskKey]] = {task.key: [] for task in plan}
+        for task in plan:
+            for key in task.dependency_keys:
+                if key in dependents:
+                    dependents[key].append(task.key)
+        remaining: Dict[TaskKey, float] = {}
+        for task in reversed(plan):
+            after = [remaining[dependent] for dependent in dependents[task.key]]
+            remaining[task.key] = estimates[task.key] + max(after, default=0.0)
+        return remaining
+
+    @staticmethod
+    def predict(
+        estimates: Dict[TaskKey, float], remaining: Dict[TaskKey, float], jobs: int
+    ) -> float:
+        """Wall time of the plan: at least its critical path, and at least all the
+work split between the jobs"""
+        critical = max(remaining.values(), default=0.0)
+        return max(critical, sum(estimates.values()) / jobs)
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from paque.state import state_path
+from paque.task import Task
+
+logger = logging.getLogger("paque.journal")
+
+
+def instance_fingerprint(task: Task) -> str:
+    """Of the task as it runs (after argument substitution), so a resumed run
+does not skip tasks whose definition changed since"""
+    encoded = json.dumps(task.to_dict(), sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class Journal:
+    """Append only record of a run, one JSON line per task starting or finishing
+(finishing ones are fsync'd, so they survive a crash), in the state folder.
+Each run appends a begin marker, unless resuming: then the tasks that finished
+after the last marker (with the same definition) are skipped, and that run goes
+on. Earlier runs are kept, and are never looked at. A run that succeeded has
+nothing to resume"""
+
+    def __init__(self, path: Optional[str] = None, resume: bool = False) -> None:
+        self._path = path if path is not None else state_path("journal.jsonl")
+        self._lock = threading.Lock()
+        self._completed: Dict[str, str] = {}
+        if resume:
+            self._load()
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        self._fd = os.open(self._path, flags, 0o644)
+        if not resume:
+            self._append({"event": "begin"}, sync=True)
+
+    def _load(self) -> None:
+        try:
+            with open(self._path) as journal:
+                lines = journal.readlines()
+        except FileNotFoundError:
+            logger.info("No previous run to resume")
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:  # Torn write from a crash
+                continue
+            if entry.get("event") == "finish" and entry.get("status") == "ok":
+                self._completed[entry["task"]] = entry["fingerprint"]
+            elif entry.get("event") == "begin":
+                self._completed = {}
+            elif entry.get("event") == "end" and entry.get("status") == "ok":
+                self._completed = {}
+        logger.info("Resuming, %s task(s) already finished", len(self._completed))
+
+    def _append(self, entry: Dict[str, Any], sync: bool = False) -> None:
+        entry["time"] = time.time()
+        data = (json.dumps(entry) + "\n").encode("utf-8")
+        with self._lock:
+            os.write(self._fd, data)
+            if sync:
+                os.fsync(self._fd)
+
+    def completed(self, task: Task) -> bool:
+        """Whether the task finished in the run being resumed"""
+        previous = self._completed.get(Task.id_of(task.key))
+        return previous is not None and previous == instance_fingerprint(task)
+
+    def started(self, task: Task) -> None:
+        self._append({"event": "start", "task": Task.id_of(task.key)})
+
+    def finished(self, task: Task, error: Optional[BaseException] = None) -> None:
+        entry = {
+            "event": "finish",
+            "task": Task.id_of(task.key),
+            "fingerprint": instance_fingerprint(task),
+            "status": "ok" if error is None else "failed",
+        }
+        if error is not None:
+            entry["error"] = str(error)
+        self._append(entry, sync=True)
+
+    def close(self, success: bool) -> None:
+        self._append({"event": "end", "status": "ok" if success else "failed"}, True)
+        os.close(self._fd)
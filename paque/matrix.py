@@ -0,0 +1,94 @@
+import itertools
+import logging
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger("paque.matrix")
+
+
+class Axis(NamedTuple):
+    """An argument of a matrix, with its values or a command printing them (one
+per line)"""
+
+    name: str
+    values: Optional[Tuple[str, ...]] = None
+    command: Optional[str] = None
+
+
+class Matrix(NamedTuple):
+    """What a matrix section asks for: depending on an instance of task for each
+combination of the values of the axes. Instances get args too (the arguments of
+the task with the matrix). Only the axes are kept, the instances are generated
+when iterated over"""
+
+    task: str
+    axes: Tuple[Axis, ...]
+    args: Tuple[str, ...] = ()
+
+    def size(self) -> int:
+        size = 1
+        for axis in self.axes:
+            size *= len(axis.values or ())
+        return size
+
+    def instances(self) -> Iterator[Tuple[str, List[str]]]:
+        """Name and arguments of each instance, the last axis varying fastest"""
+        names = [axis.name for axis in self.axes]
+        for combination in itertools.product(
+            *(axis.values or () for axis in self.axes)
+        ):
+            yield self.task, list(self.args) + [
+                f"{name}:{value}" for name, value in zip(names, combination)
+            ]
+
+    def keys(self) -> Iterator[Tuple[str, Tuple[str, ...]]]:
+        for task, args in self.instances():
+            yield task, tuple(sorted(args))
+
+    def resolve(self, render: Callable[[str], str], args: List[str]) -> "Matrix":
+        """The matrix for an instance of the task it belongs to: values rendered
+with its arguments, commands run to get their values"""
+        axes = []
+        for axis in self.axes:
+            if axis.command is not None:
+                values = _values_of(render(axis.command))
+            else:
+                values = tuple(render(value) for value in axis.values or ())
+            axes.append(Axis(axis.name, values))
+        return Matrix(render(self.task), tuple(axes), tuple(args))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task": self.task,
+            "axes": [axis._asdict() for axis in self.axes],
+            "args": list(self.args),
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "Matrix":
+        axes = []
+        for axis in data["axes"]:
+            values = axis.get("values")
+            axes.append(
+                Axis(
+                    axis["name"],
+                    None if values is None else tuple(values),
+                    axis.get("command"),
+                )
+            )
+        return Matrix(data["task"], tuple(axes), tuple(data.get("args", ())))
+
+
+def _values_of(command: str) -> Tuple[str, ...]:
+    """Lines printed by the command, without blank ones"""
+    # Only needed for matrices with commands
+    import subprocess
+
+    logger.debug("Getting matrix values from %s", command)
+    try:
+        printed = subprocess.run(
+            command, shell=True, stdout=subprocess.PIPE, check=True
+        ).stdout
+    except subprocess.CalledProcessError as exc:
+        raise Exception(f"Matrix command {command} failed: {exc}")
+    lines = printed.decode("utf-8").splitlines()
+    return tuple(line.strip() for line in lines if len(line.strip()) > 0)
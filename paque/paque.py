@@ -2,16 +2,17 @@ import logging
 import os
 
 import click
-from colorlog import ColoredFormatter  # type: ignore
 
-from paque.executor import Executor
-from paque.parser import YAMLParser
-from paque.planner import Planner
+# Everything else (colorlog, yaml, the parser, planner and executor) is imported
+# only when needed: paque is often invoked many times in a row from scripts,
+# and for small tasks startup time dominates
 
 logger = logging.getLogger("paque")
 
 
 def configure_logger():
+    from colorlog import ColoredFormatter  # type: ignore
+
     formatter = ColoredFormatter(
         "%(log_color)s%(levelname)s - %(message)s",
         datefmt=None,
@@ -31,44 +32,236 @@ def configure_logger():
     logger.addHandler(handler)
 
 
+def check_shard(context, parameter, value):
+    if value is None:
+        return None
+    from paque.planfile import parse_shard
+
+    try:
+        return parse_shard(value)
+    except Exception as exc:
+        raise click.BadParameter(str(exc))
+
+
 def get_paquefile(paquefile):
-    def check_file(candidate: str):
-        try:
-            candidate_path = os.path.join(os.getcwd(), candidate)
-            with open(candidate_path) as _:
-                logger.debug("File found: %s", candidate_path)
-                return True
-        except IOError:
-            logger.debug("File not found: %s (IO failed)", candidate_path)
-            return False
-        logger.debug("File not found: %s (no exception?)", candidate_path)
-        return False
-
-    print(paquefile)
-    if paquefile is None:
+    def check_file(candidate: str) -> bool:
+        candidate_path = os.path.join(os.getcwd(), candidate)
+        found = os.path.isfile(candidate_path)
+        logger.debug("File %s: %s", "found" if found else "not found", candidate_path)
+        return found
 
+    if paquefile is None:
         candidates = ["paquefile", "paquefile.yaml"]
-        try:
-            indexer = list(map(check_file, candidates)).index(True)
-        except ValueError:
-            indexer = None
-        if indexer is None:
-            raise Exception(
-                "No file provided and neither paquefile, paquefile.yaml are available"
-            )
-        return candidates[indexer]
+        for candidate in candidates:
+            if check_file(candidate):
+                return candidate
+        raise Exception(
+            "No file provided and neither paquefile, paquefile.yaml are available"
+        )
     if check_file(paquefile):
         return paquefile
+    raise Exception(f"File {paquefile} not found")
 
 
 @click.command()
-@click.argument("task", required=True)
-@click.argument("path", default="paquefile.yaml", required=False)
+@click.argument("task", required=False)
+@click.argument("path", required=False)
 @click.option(
     "--dry-run", default=False, is_flag=True, help="Dry run, logging the plan",
 )
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of tasks to run at the same time",
+)
+@click.option(
+    "--memory",
+    type=click.IntRange(min=1),
+    help="MB of memory tasks running at the same time can ask for (default: all)",
+)
+@click.option(
+    "--load-average",
+    "-l",
+    type=click.FloatRange(min=0),
+    help="Don't start tasks while the load average is at least this (like make -l)",
+)
+@click.option(
+    "--async",
+    "use_async",
+    default=False,
+    is_flag=True,
+    help="Run tasks from an asyncio event loop, prefixing their output with their name",
+)
+@click.option(
+    "--shell-workers",
+    default=False,
+    is_flag=True,
+    help="Send commands to long lived shells (one per job) instead of starting one each",
+)
+@click.option(
+    "--force",
+    default=False,
+    is_flag=True,
+    help="Run tasks with inputs or outputs even if they are up to date",
+)
+@click.option(
+    "--no-cache",
+    default=False,
+    is_flag=True,
+    help="Parse the paquefile even if it has not changed since the last run",
+)
+@click.option(
+    "--list",
+    "list_tasks",
+    default=False,
+    is_flag=True,
+    help="List the tasks available in the paquefile",
+)
+@click.option(
+    "--trace",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write timings and resource usage of each task as a Chrome trace",
+)
+@click.option(
+    "--profile",
+    type=click.Path(file_okay=False, writable=True),
+    help="Write where paque itself spends time and memory (by phase) to a folder",
+)
+@click.option(
+    "--spool",
+    default=False,
+    is_flag=True,
+    help="Also keep the output of each task in .paque/logs/",
+)
+@click.option(
+    "--spool-max-bytes",
+    default=10 * 1024 * 1024,
+    type=click.IntRange(min=1),
+    help="Size at which task log files are rotated",
+)
+@click.option(
+    "--watch",
+    default=False,
+    is_flag=True,
+    help="Keep running the parts of the plan affected by changes to inputs or the paquefile",
+)
+@click.option(
+    "--daemon",
+    default=False,
+    is_flag=True,
+    help="Serve requests from paquec, keeping parsed paquefiles and plans in memory",
+)
+@click.option(
+    "--plan-out",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the plan (as JSON) to run later with --from-plan, instead of running it",
+)
+@click.option(
+    "--dot-out",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the plan as a Graphviz graph, instead of running it",
+)
+@click.option(
+    "--from-plan",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Run a plan written with --plan-out, without reading the paquefile",
+)
+@click.option(
+    "--shard",
+    metavar="I/N",
+    callback=check_shard,
+    help="Only run the I-th of N parts of the plan",
+)
+@click.option(
+    "--only",
+    multiple=True,
+    metavar="TASK",
+    help="Only run this task of the plan (and its dependencies), can be repeated",
+)
+@click.option(
+    "--resume",
+    default=False,
+    is_flag=True,
+    help="Skip the tasks that finished in the last run, if it did not succeed",
+)
+@click.option(
+    "--keep-going",
+    default=False,
+    is_flag=True,
+    help="On failure, keep running the tasks not depending on the failed ones",
+)
+@click.option(
+    "--artifacts",
+    metavar="DIR",
+    envvar="PAQUE_ARTIFACTS",
+    help="Save the outputs of tasks in DIR (which can be shared), and restore them "
+    "instead of running tasks matching a saved run",
+)
+@click.option(
+    "--artifacts-max-bytes",
+    # paque.artifacts.DEFAULT_MAX_BYTES, inline so startup does not import it
+    default=1 << 30,
+    type=click.IntRange(min=0),
+    help="Size over which the least recently used artifacts are evicted",
+)
+@click.option(
+    "--artifacts-stats",
+    default=False,
+    is_flag=True,
+    help="Show how much the artifacts in --artifacts take",
+)
+@click.option(
+    "--artifacts-prune",
+    default=False,
+    is_flag=True,
+    help="Evict artifacts in --artifacts until they fit in --artifacts-max-bytes",
+)
+@click.option(
+    "--coordinator",
+    metavar="ADDRESS",
+    help="Run the plan on the workers connecting to HOST:PORT or unix:PATH",
+)
+@click.option(
+    "--worker",
+    metavar="ADDRESS",
+    help="Run tasks sent by the coordinator at ADDRESS, as many at a time as --jobs",
+)
 @click.option("--debug", help="Set log level to debug", is_flag=True)
-def paque(task, path, dry_run, debug):
+def paque(
+    task,
+    path,
+    dry_run,
+    jobs,
+    memory,
+    load_average,
+    use_async,
+    shell_workers,
+    force,
+    no_cache,
+    list_tasks,
+    trace,
+    profile,
+    spool,
+    spool_max_bytes,
+    watch,
+    daemon,
+    plan_out,
+    dot_out,
+    from_plan,
+    shard,
+    only,
+    resume,
+    keep_going,
+    artifacts,
+    artifacts_max_bytes,
+    artifacts_stats,
+    artifacts_prune,
+    coordinator,
+    worker,
+    debug,
+):
     """Paque simplifies running simple workflows you want to run. It offers a few
 features of `make`, but removing most of its power. It runs on a `paquefile` or
 `paquefile.yaml` (or just pass the name of the file)
@@ -79,19 +272,231 @@ features of `make`, but removing most of its power. It runs on a `paquefile` or
         logger.setLevel(logging.DEBUG)
     else:
         logger.setLevel(logging.INFO)
-    paquefile = get_paquefile(path)
-    parser = YAMLParser(paquefile)
-    planner = Planner(parser.parse())
+    profiler = None
+    if profile is not None:
+        from paque.profiling import Profiler
+
+        profiler = Profiler()
+        click.get_current_context().call_on_close(lambda: profiler.write(profile))
+
+    def phase(name):
+        if profiler is None:
+            from contextlib import nullcontext
+
+            return nullcontext()
+        return profiler.phase(name)
+
+    if daemon:
+        from paque.daemon import Daemon
+
+        # Tasks and how to run them come with each request from paquec
+        ignored = [
+            flag
+            for flag, given in [
+                ("--dry-run", dry_run),
+                ("--list", list_tasks),
+                ("--memory", memory is not None),
+                ("--load-average", load_average is not None),
+                ("--async", use_async),
+                ("--shell-workers", shell_workers),
+                ("--no-cache", no_cache),
+                ("--trace", trace is not None),
+                ("--profile", profile is not None),
+                ("--spool", spool),
+                ("--watch", watch),
+                ("--plan-out", plan_out is not None),
+                ("--dot-out", dot_out is not None),
+                ("--from-plan", from_plan is not None),
+                ("--shard", shard is not None),
+                ("--only", len(only) > 0),
+                ("--resume", resume),
+                ("--keep-going", keep_going),
+                ("--artifacts-stats", artifacts_stats),
+                ("--artifacts-prune", artifacts_prune),
+                ("--coordinator", coordinator is not None),
+                ("--worker", worker is not None),
+            ]
+            if given
+        ]
+        if len(ignored) > 0:
+            raise click.UsageError(
+                "--daemon can't be used with {}".format(", ".join(ignored))
+            )
+        try:
+            Daemon(
+                jobs=jobs,
+                force=force,
+                artifacts=artifacts,
+                artifacts_max_bytes=artifacts_max_bytes,
+            ).serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+    if worker is not None:
+        from paque.distributed import Worker
+
+        try:
+            Worker(worker, slots=jobs).run()
+        except KeyboardInterrupt:
+            pass
+        return
+    if artifacts_stats or artifacts_prune:
+        if artifacts is None:
+            raise click.UsageError("Which artifacts? Missing --artifacts")
+        from paque.artifacts import ArtifactStore
+
+        store = ArtifactStore(artifacts, max_bytes=artifacts_max_bytes)
+        if artifacts_prune:
+            evicted, removed = store.prune()
+            click.echo(f"Evicted {evicted} entries, removed {removed} bytes")
+        for name, value in store.stats().items():
+            click.echo(f"{name}: {value}")
+        return
+    if task is None and not list_tasks and from_plan is None:
+        raise click.UsageError("Missing argument 'TASK'")
+    if from_plan is not None and (watch or list_tasks):
+        raise click.UsageError("--from-plan can't be used with --watch or --list")
+    if watch and (shard is not None or len(only) > 0):
+        raise click.UsageError("--watch can't be used with --shard or --only")
+    if use_async and shell_workers:
+        raise click.UsageError("--shell-workers can't be used with --async")
+    if watch and (dry_run or list_tasks):
+        raise click.UsageError("--watch can't be used with --dry-run or --list")
+    if coordinator is not None and (use_async or shell_workers or watch):
+        raise click.UsageError(
+            "--coordinator can't be used with --async, --shell-workers or --watch"
+        )
+    if resume and (watch or coordinator is not None):
+        raise click.UsageError("--resume can't be used with --watch or --coordinator")
+    if keep_going and coordinator is not None:
+        raise click.UsageError("--keep-going can't be used with --coordinator")
+    paquefile = None
+    if from_plan is None:
+        from paque.parser import Paquefile
+        from paque.planner import Planner
+
+        paquefile = get_paquefile(path)
+        with phase("parse"):
+            tasks = Paquefile(paquefile, cache=not no_cache)
+            names = list(tasks) if list_tasks else []
+        if list_tasks:
+            for name in names:
+                click.echo(name)
+            return
+
+    def make_plan():
+        with phase("plan"):
+            if from_plan is not None:
+                from paque.planfile import read_plan
+
+                plan = read_plan(from_plan)
+                logger.info(">>> Plan read from %s", from_plan)
+            else:
+                plan = Planner(tasks).plan(task)
+            if len(only) > 0 or shard is not None:
+                from paque.planfile import select, shard as shard_of
+
+                if len(only) > 0:
+                    plan = select(plan, only)
+                if shard is not None:
+                    plan = shard_of(plan, *shard)
+                logger.info(">>> Running %s", [step.name for step in plan])
+        return plan
+
+    if plan_out is not None or dot_out is not None:
+        from paque.planfile import write_dot, write_plan
+
+        try:
+            plan = make_plan()
+            if plan_out is not None:
+                write_plan(plan, task, plan_out)
+                logger.info("Plan written to %s", plan_out)
+            if dot_out is not None:
+                write_dot(plan, dot_out)
+                logger.info("Graph written to %s", dot_out)
+        except Exception as exc:
+            logger.exception(exc)
+        return
+    from paque.executor import Executor
+
     if dry_run:
         try:
-            Executor(planner.plan(task)).dry_run()
+            plan = make_plan()
+            with phase("execute"):
+                Executor(plan).dry_run()
         except Exception as exc:
             logger.exception(exc)
     else:
+        from paque.artifacts import ArtifactStore
+        from paque.fingerprint import FingerprintStore
+        from paque.history import History
+        from paque.journal import Journal
+        from paque.resources import Budget, physical_memory
+        from paque.spool import LogSpool
+        from paque.trace import Tracer
+
+        tracer = Tracer() if trace is not None else None
+        shell_pool = None
+        if shell_workers:
+            from paque.shellpool import ShellPool
+
+            shell_pool = ShellPool(jobs)
+        engine = Executor
+        if use_async:
+            from paque.async_executor import AsyncExecutor
+
+            engine = AsyncExecutor
+
+        def execute(plan):
+            fingerprints = None
+            if any(FingerprintStore.tracks(step) for step in plan):
+                fingerprints = FingerprintStore(force=force)
+            executor = engine(
+                plan,
+                jobs=jobs,
+                fingerprints=fingerprints,
+                tracer=tracer,
+                spool=LogSpool(max_bytes=spool_max_bytes) if spool else None,
+                shell_pool=shell_pool,
+                budget=Budget(
+                    jobs,
+                    memory=memory if memory is not None else physical_memory(),
+                    load_average=load_average,
+                ),
+                history=History(),
+                # Watching, each run is a new one, there is nothing to resume
+                journal=None if watch else Journal(resume=resume),
+                keep_going=keep_going,
+                artifacts=(
+                    None
+                    if artifacts is None or fingerprints is None
+                    else ArtifactStore(artifacts, max_bytes=artifacts_max_bytes)
+                ),
+            )
+            with phase("execute"):
+                executor.run()
+
         try:
-            Executor(planner.plan(task)).run()
+            if coordinator is not None:
+                from paque.distributed import Coordinator
+
+                Coordinator(make_plan(), coordinator).run()
+            elif watch:
+                from paque.watch import Watch
+
+                Watch(paquefile, task, execute).run()
+            else:
+                execute(make_plan())
+        except KeyboardInterrupt:
+            if not watch:
+                raise
         except Exception as exc:
             logger.exception(exc)
+        finally:
+            if tracer is not None:
+                tracer.write(trace)
+            if shell_pool is not None:
+                shell_pool.close()
 
 
 if __name__ == "__main__":
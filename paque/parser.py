@@ -1,13 +1,56 @@
+import hashlib
+import json
 import logging
+import os
+import pickle
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader  # type: ignore
+
+from paque.matrix import Axis, Matrix
+from paque.probe import Probe
+from paque.resources import Resources
+from paque.state import state_path
 from paque.task import Section, Task
 
+# Bump whenever Task (or what the parser builds) changes shape, so stale caches
+# are ignored
+CACHE_VERSION = 6
+
 logger = logging.getLogger("paque.Task")
 
+SECTIONS = frozenset(
+    [
+        "run",
+        "condition",
+        "message",
+        "sleep",
+        "depends",
+        "inputs",
+        "outputs",
+        "wait_until",
+        "resources",
+        "matrix",
+    ]
+)
+
+PROBE_SETTINGS = frozenset(["timeout", "interval", "max_interval"])
+
+RESOURCES = frozenset(["cpu", "memory", "locks"])
+
+# Top level key (with a dictionary instead of a list of sections) mapping
+# namespaces to the paquefiles included under them
+INCLUDE = "include"
+
+FileKey = Tuple[int, int]
+
 
 class Parser(ABC):
     """If you want a different parser, suit yourself. The expected API is a
@@ -33,7 +76,27 @@ dictionary of Dict[str, Task], with keys being the names of the tasks"""
         pass
 
     @abstractmethod
-    def _get_depends(self, task_def) -> Optional[List[Task]]:
+    def _get_depends(self, task_def) -> Optional[List[str]]:
+        pass
+
+    @abstractmethod
+    def _get_inputs(self, task_def) -> Optional[List[str]]:
+        pass
+
+    @abstractmethod
+    def _get_outputs(self, task_def) -> Optional[List[str]]:
+        pass
+
+    @abstractmethod
+    def _get_wait_until(self, task_def) -> Optional[Probe]:
+        pass
+
+    @abstractmethod
+    def _get_resources(self, task_def) -> Optional[Resources]:
+        pass
+
+    @abstractmethod
+    def _get_matrix(self, task_def) -> Optional[List[Matrix]]:
         pass
 
     @abstractmethod
@@ -44,26 +107,43 @@ dictionary of Dict[str, Task], with keys being the names of the tasks"""
 class YAMLParser(Parser):
     """Specific parser for YAML files"""
 
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, cache: bool = True):
         self.filename = filename
+        self._cache = cache
+        # Namespace -> paquefile, relative to the working directory
+        self.includes: Dict[str, str] = {}
 
     @staticmethod
-    def _find_section(dic, section: str) -> Section:
-        """Only allows one section with the same name (that's the 0 at the end).
-        Casting specific sections to specific types is done explicitly in _build_tasks
+    def _index_sections(task_name: str, task_def) -> Dict[str, Section]:
+        """A task is a list of single-key dictionaries (one per section). Index it
+once, only allowing known sections and each of them at most once. Casting
+specific sections to specific types is done explicitly in _build_tasks
 
         """
-        values = list(filter(lambda x: section in x.keys(), dic))
-        if len(values) == 0:
-            return None
-        return values[0][section]
+        if not isinstance(task_def, list):
+            raise Exception(f"Task {task_name} should be a list of sections")
+        sections: Dict[str, Section] = {}
+        for item in task_def:
+            if not isinstance(item, dict):
+                raise Exception(f"Task {task_name} has a malformed section: {item}")
+            for section, value in item.items():
+                if section not in SECTIONS:
+                    raise Exception(f"Unknown section {section} in task {task_name}")
+                if section in sections:
+                    raise Exception(f"Duplicate section {section} in task {task_name}")
+                sections[section] = value
+        return sections
+
+    @staticmethod
+    def _find_section(sections: Dict[str, Section], section: str) -> Section:
+        return sections.get(section)
 
     def _get_run(self, task_def) -> Optional[str]:
         _run = self._find_section(task_def, "run")
         if _run is None:
             return None
         if isinstance(_run, List):
-            if all([isinstance(run_item, str) for run_item in _run]):
+            if all(isinstance(run_item, str) for run_item in _run):
                 return "\n".join(_run)
         if isinstance(_run, str):
             return _run
@@ -74,7 +154,7 @@ class YAMLParser(Parser):
         if _condition is None:
             return None
         if isinstance(_condition, List):
-            if all([isinstance(condition_item, str) for condition_item in _condition]):
+            if all(isinstance(condition_item, str) for condition_item in _condition):
                 return "\n".join(_condition)
         if isinstance(_condition, str):
             return _condition
@@ -96,23 +176,137 @@ this can only fail when running (or dry-running )the plan"""
             "Sleep section should only contain integers or strings (to be interpolated by arguments)"
         )
 
-    def _get_depends(self, task_def) -> Optional[List[Task]]:
+    def _get_depends(self, task_def) -> Optional[List[str]]:
         _depends = self._find_section(task_def, "depends")
         if _depends is None:
             return None
         if isinstance(_depends, List):
-            if all([isinstance(dependency, str) for dependency in _depends]):
-                return [Task(name=name) for name in _depends]
+            if all(isinstance(dependency, str) for dependency in _depends):
+                return _depends
         raise Exception(
             "Depends section should only contain an array of strings (if only one dependency, break it as an array)"
         )
 
+    def _get_paths(self, task_def, section: str) -> Optional[List[str]]:
+        """Inputs and outputs are paths or globs, as a string or list of strings"""
+        _paths = self._find_section(task_def, section)
+        if _paths is None:
+            return None
+        if isinstance(_paths, List):
+            if all(isinstance(path, str) for path in _paths):
+                return _paths
+        if isinstance(_paths, str):
+            return [_paths]
+        raise Exception(
+            f"{section.capitalize()} section should only contain a string or list of strings"
+        )
+
+    def _get_inputs(self, task_def) -> Optional[List[str]]:
+        return self._get_paths(task_def, "inputs")
+
+    def _get_outputs(self, task_def) -> Optional[List[str]]:
+        return self._get_paths(task_def, "outputs")
+
+    def _get_wait_until(self, task_def) -> Optional[Probe]:
+        """A probe command (string or list of strings, like run), or a dictionary
+with the command as probe, and optionally timeout, interval and max_interval in
+seconds"""
+        _wait_until = self._find_section(task_def, "wait_until")
+        if _wait_until is None:
+            return None
+        settings: Dict[str, Any] = {}
+        if isinstance(_wait_until, dict):
+            settings = dict(_wait_until)
+            _wait_until = settings.pop("probe", None)
+            for setting, value in settings.items():
+                if setting not in PROBE_SETTINGS:
+                    raise Exception(f"Unknown wait_until setting {setting}")
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise Exception(f"Wait_until {setting} should be a number")
+                if value <= 0:
+                    raise Exception(f"Wait_until {setting} should be positive")
+        if isinstance(_wait_until, List):
+            if all(isinstance(probe_item, str) for probe_item in _wait_until):
+                return Probe("\n".join(_wait_until), **settings)
+        if isinstance(_wait_until, str):
+            return Probe(_wait_until, **settings)
+        raise Exception(
+            "Wait_until section should contain a probe command (string or list of strings)"
+        )
+
+    def _get_resources(self, task_def) -> Optional[Resources]:
+        """A dictionary with cpu (slots, 1 by default), memory (in MB) and locks (a
+name or list of names)"""
+        _resources = self._find_section(task_def, "resources")
+        if _resources is None:
+            return None
+        if not isinstance(_resources, dict):
+            raise Exception(
+                "Resources section should be a dictionary with cpu, memory or locks"
+            )
+        for resource, value in _resources.items():
+            if resource not in RESOURCES:
+                raise Exception(f"Unknown resource {resource}")
+            if resource == "locks":
+                continue
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise Exception(f"Resource {resource} should be an integer")
+        cpu = _resources.get("cpu", 1)
+        memory = _resources.get("memory", 0)
+        if cpu < 1 or memory < 0:
+            raise Exception(
+                "Resources should ask for at least 1 cpu and no negative memory"
+            )
+        locks = _resources.get("locks", [])
+        if isinstance(locks, str):
+            locks = [locks]
+        if not isinstance(locks, List) or not all(
+            isinstance(lock, str) for lock in locks
+        ):
+            raise Exception("Locks should be a string or list of strings")
+        return Resources(cpu, memory, tuple(locks))
+
+    @staticmethod
+    def _get_axis(name, values) -> Axis:
+        if isinstance(values, dict) and list(values) == ["command"]:
+            if isinstance(values["command"], str):
+                return Axis(name, command=values["command"])
+        if isinstance(values, List) and all(
+            isinstance(value, (str, int, float)) and not isinstance(value, bool)
+            for value in values
+        ):
+            return Axis(name, values=tuple(str(value) for value in values))
+        raise Exception(
+            f"Matrix argument {name} should be a list of values or a command"
+        )
+
+    def _get_matrix(self, task_def) -> Optional[List[Matrix]]:
+        """A dictionary (or a list of them) with the task to depend on, and for each
+of its arguments a list of values or a command printing them"""
+        _matrix = self._find_section(task_def, "matrix")
+        if _matrix is None:
+            return None
+        matrices = _matrix if isinstance(_matrix, List) else [_matrix]
+        parsed = []
+        for matrix in matrices:
+            if not isinstance(matrix, dict) or not isinstance(matrix.get("task"), str):
+                raise Exception("Matrix section should say which task to depend on")
+            axes = [
+                self._get_axis(name, values)
+                for name, values in matrix.items()
+                if name != "task"
+            ]
+            if len(axes) == 0:
+                raise Exception("Matrix section should have at least one argument")
+            parsed.append(Matrix(matrix["task"], tuple(axes)))
+        return parsed
+
     def _get_message(self, task_def) -> Optional[str]:
         _message = self._find_section(task_def, "message")
         if _message is None:
             return None
         if isinstance(_message, List):
-            if all([isinstance(message_item, str) for message_item in _message]):
+            if all(isinstance(message_item, str) for message_item in _message):
                 return "\n".join(_message)
         if isinstance(_message, str):
             return _message
@@ -120,22 +314,262 @@ this can only fail when running (or dry-running )the plan"""
             "Message section should only contain a string or list of strings"
         )
 
+    def _get_includes(self, include) -> Dict[str, str]:
+        """Paths are relative to the folder of the including paquefile"""
+        folder = os.path.dirname(self.filename)
+        includes = {}
+        for namespace, path in include.items():
+            if not isinstance(namespace, str) or not isinstance(path, str):
+                raise Exception("Include should map namespaces to paquefiles")
+            if ":" in namespace or " " in namespace:
+                raise Exception(f"Namespace {namespace} can't contain : or spaces")
+            includes[namespace] = os.path.normpath(os.path.join(folder, path))
+        return includes
+
     def _build_tasks(self, parsed_yaml: Dict[str, Any]) -> Dict[str, Task]:
         task_dict = {}
-        for task_name, task_def in parsed_yaml.items():
+        self.includes = {}
+        for task_name, raw_task_def in parsed_yaml.items():
+            if task_name == INCLUDE and isinstance(raw_task_def, dict):
+                self.includes = self._get_includes(raw_task_def)
+                continue
+            task_def = self._index_sections(task_name, raw_task_def)
             run: Optional[str] = self._get_run(task_def)
             sleep: Optional[str] = self._get_sleep(task_def)
             message: Optional[str] = self._get_message(task_def)
-            depends: Optional[List[Task]] = self._get_depends(task_def)
+            depends: Optional[List[str]] = self._get_depends(task_def)
             condition: Optional[str] = self._get_condition(task_def)
-            task = Task(task_name, run, depends, message, sleep, condition)
+            inputs: Optional[List[str]] = self._get_inputs(task_def)
+            outputs: Optional[List[str]] = self._get_outputs(task_def)
+            wait_until: Optional[Probe] = self._get_wait_until(task_def)
+            resources: Optional[Resources] = self._get_resources(task_def)
+            matrix: Optional[List[Matrix]] = self._get_matrix(task_def)
+            task = Task(
+                task_name,
+                run,
+                depends,
+                message,
+                sleep,
+                condition,
+                inputs,
+                outputs,
+                wait_until,
+                resources,
+                matrix,
+            )
             task_dict[task_name] = task
         return task_dict
 
+    def _cache_path(self, extension: str = "pickle") -> str:
+        key = hashlib.sha1(os.path.abspath(self.filename).encode("utf-8")).hexdigest()
+        return state_path("cache", f"{key}.{extension}")
+
+    def _load_cached(self, stat: os.stat_result) -> Optional[Dict[str, Task]]:
+        """The cache is valid if the file has the same size and modification time,
+or failing that, the same contents"""
+        try:
+            with open(self._cache_path(), "rb") as cache_file:
+                cached = pickle.load(cache_file)
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.debug("Ignoring unreadable cache for %s: %s", self.filename, exc)
+            return None
+        if cached.get("version") != CACHE_VERSION:
+            return None
+        if cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime_ns:
+            logger.debug("Cache hit for %s", self.filename)
+            self.includes = cached["includes"]
+            return cached["tasks"]
+        with open(self.filename, "rb") as data:
+            digest = hashlib.sha256(data.read()).hexdigest()
+        if cached["digest"] != digest:
+            return None
+        logger.debug("Cache hit for %s (same contents)", self.filename)
+        self.includes = cached["includes"]
+        self._store_cached(stat, digest, cached["tasks"])
+        return cached["tasks"]
+
+    def _store_cached(
+        self, stat: os.stat_result, digest: str, tasks: Dict[str, Task]
+    ) -> None:
+        cached = {
+            "version": CACHE_VERSION,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "digest": digest,
+            "tasks": tasks,
+            "includes": self.includes,
+        }
+        cache_path = self._cache_path()
+        temporary = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "wb") as cache_file:
+                pickle.dump(cached, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, cache_path)
+        except OSError as exc:
+            logger.debug("Could not cache %s: %s", self.filename, exc)
+
     def parse(self) -> Dict[str, Task]:
-        data = open(self.filename, "r")
+        stat = os.stat(self.filename)
+        if self._cache:
+            cached = self._load_cached(stat)
+            if cached is not None:
+                return cached
+        with open(self.filename, "rb") as data:
+            content = data.read()
         try:
-            loaded = yaml.safe_load(data)
+            loaded = yaml.load(content, Loader=SafeLoader)
         except Exception as e:
             raise Exception("Could not load the YAML file: %s", e)
-        return self._build_tasks(loaded)
+        tasks = self._build_tasks(loaded)
+        if self._cache:
+            self._store_cached(stat, hashlib.sha256(content).hexdigest(), tasks)
+        return tasks
+
+    def index(self) -> Tuple[List[str], Dict[str, str]]:
+        """Names of the tasks in the file and what it includes. They are cached
+apart from the tasks, so listing many included files stays cheap"""
+        stat = os.stat(self.filename)
+        file_key = [stat.st_mtime_ns, stat.st_size]
+        index_path = self._cache_path("index.json")
+        if self._cache:
+            try:
+                with open(index_path) as index_file:
+                    index = json.load(index_file)
+                if index["version"] == CACHE_VERSION and index["file"] == file_key:
+                    return index["names"], index["includes"]
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+        names = list(self.parse())
+        if self._cache:
+            index = {
+                "version": CACHE_VERSION,
+                "file": file_key,
+                "names": names,
+                "includes": self.includes,
+            }
+            try:
+                with open(index_path, "w") as index_file:
+                    json.dump(index, index_file)
+            except OSError as exc:
+                logger.debug("Could not index %s: %s", self.filename, exc)
+        return names, self.includes
+
+
+def _file_key(filename: str) -> FileKey:
+    stat = os.stat(filename)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Paquefile(Mapping):
+    """The tasks of a paquefile, and those of the paquefiles it includes under
+their namespace (as namespace:task, their dependencies and matrices get the
+namespace too). An included paquefile is only parsed once one of its tasks is
+asked for, so a plan only pays for the files it reaches. Listing every task uses
+the cached index of each file instead of its tasks.
+
+Tasks already parsed (and what they include) can be passed in, instead of
+parsing filename"""
+
+    def __init__(
+        self,
+        filename: str,
+        cache: bool = True,
+        tasks: Optional[Dict[str, Task]] = None,
+        includes: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.filename = filename
+        self._cache = cache
+        self._file_key = _file_key(filename)
+        if tasks is None:
+            parser = YAMLParser(filename, cache=cache)
+            tasks = parser.parse()
+            includes = parser.includes
+        self._tasks = tasks
+        self._includes = includes or {}
+        self._included: Dict[str, "Paquefile"] = {}
+        self._namespaced: Dict[str, Task] = {}
+
+    def _include(self, namespace: str) -> "Paquefile":
+        included = self._included.get(namespace)
+        if included is None:
+            path = self._includes[namespace]
+            if not os.path.isfile(path):
+                raise Exception(f"File {path} included as {namespace} not found")
+            logger.debug("Loading %s for namespace %s", path, namespace)
+            included = Paquefile(path, cache=self._cache)
+            self._included[namespace] = included
+        return included
+
+    def __getitem__(self, name: str) -> Task:
+        task = self._tasks.get(name)
+        if task is not None:
+            return task
+        task = self._namespaced.get(name)
+        if task is not None:
+            return task
+        namespace, separator, local_name = name.partition(":")
+        if separator == "" or namespace not in self._includes:
+            raise KeyError(name)
+        task = self._include(namespace)[local_name]
+        task = task.replace(
+            name=f"{namespace}:{task.name}",
+            depends=(
+                None
+                if task.depends is None
+                else [f"{namespace}:{dependency}" for dependency in task.depends]
+            ),
+            matrix=(
+                None
+                if task.matrix is None
+                else [
+                    matrix._replace(task=f"{namespace}:{matrix.task}")
+                    for matrix in task.matrix
+                ]
+            ),
+        )
+        self._namespaced[name] = task
+        return task
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._tasks
+        for namespace, path in self._includes.items():
+            for name in _indexed_names(path, self._cache, {self._path()}):
+                yield f"{namespace}:{name}"
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def _path(self) -> str:
+        return os.path.abspath(self.filename)
+
+    def files(self) -> List[str]:
+        """Absolute paths of this file and of the included files loaded so far"""
+        paths = [self._path()]
+        for included in self._included.values():
+            paths.extend(included.files())
+        return paths
+
+    def changed(self) -> bool:
+        """Whether this file, or any included file loaded so far, changed since
+it was loaded"""
+        try:
+            if _file_key(self.filename) != self._file_key:
+                return True
+        except FileNotFoundError:
+            return True
+        return any(included.changed() for included in self._included.values())
+
+
+def _indexed_names(filename: str, cache: bool, seen: Set[str]) -> Iterator[str]:
+    path = os.path.abspath(filename)
+    if path in seen:
+        raise Exception(f"{filename} includes itself")
+    if not os.path.isfile(filename):
+        raise Exception(f"Included file {filename} not found")
+    names, includes = YAMLParser(filename, cache=cache).index()
+    yield from names
+    for namespace, included in includes.items():
+        for name in _indexed_names(included, cache, seen | {path}):
+            yield f"{namespace}:{name}"
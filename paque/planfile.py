@@ -0,0 +1,119 @@
+import json
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from paque.task import Task, TaskKey
+
+# Bump whenever what is written changes shape
+PLAN_VERSION = 1
+
+
+def plan_data(plan: List[Task], target: str) -> Dict[str, Any]:
+    """The plan as plain data: every task fully instantiated (in plan order), and
+the edges between them as [dependency, dependent] indexes in the plan"""
+    index = {task.key: position for position, task in enumerate(plan)}
+    edges = [
+        [index[key], position]
+        for position, task in enumerate(plan)
+        for key in task.dependency_keys
+        if key in index
+    ]
+    return {
+        "version": PLAN_VERSION,
+        "target": target,
+        "tasks": [task.to_dict() for task in plan],
+        "edges": edges,
+    }
+
+
+def write_plan(plan: List[Task], target: str, path: str) -> None:
+    with open(path, "w") as plan_file:
+        json.dump(plan_data(plan, target), plan_file, indent=1)
+
+
+def read_plan(path: str) -> List[Task]:
+    """The plan written by write_plan, ready to run without the paquefile"""
+    with open(path) as plan_file:
+        data = json.load(plan_file)
+    if data.get("version") != PLAN_VERSION:
+        raise Exception(
+            f"Plan {path} was written by another version of paque, plan it again"
+        )
+    return [Task.from_dict(task) for task in data["tasks"]]
+
+
+def _quote(text: str) -> str:
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def to_dot(plan: List[Task]) -> str:
+    """Graphviz graph of the plan, with an edge from each dependency to what
+depends on it. Tasks running a command are boxes"""
+    lines = ["digraph plan {", "  rankdir=LR;"]
+    names = {task.key: task.name for task in plan}
+    for task in plan:
+        shape = "box" if task.run is not None else "ellipse"
+        lines.append(f"  {_quote(task.name)} [shape={shape}];")
+    for task in plan:
+        for key in task.dependency_keys:
+            if key in names:
+                lines.append(f"  {_quote(names[key])} -> {_quote(task.name)};")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def write_dot(plan: List[Task], path: str) -> None:
+    with open(path, "w") as dot_file:
+        dot_file.write(to_dot(plan))
+
+
+def _with_dependencies(plan: List[Task], selected: Set[TaskKey]) -> List[Task]:
+    """The selected tasks and everything they need, in plan order. The plan is
+topologically sorted, so one pass backwards finds all of it"""
+    needed = set(selected)
+    for task in reversed(plan):
+        if task.key in needed:
+            needed.update(task.dependency_keys)
+    return [task for task in plan if task.key in needed]
+
+
+def select(plan: List[Task], names: Iterable[str]) -> List[Task]:
+    """Only the named tasks (and their dependencies)"""
+    selected = {Task.key_of(name) for name in names}
+    missing = selected - {task.key for task in plan}
+    if len(missing) > 0:
+        raise Exception(
+            "Not in the plan: {}".format(
+                ", ".join(sorted(Task.id_of(key) for key in missing))
+            )
+        )
+    return _with_dependencies(plan, selected)
+
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """I/N, the I-th (from 1) of N shards"""
+    index, separator, count = text.partition("/")
+    if separator == "" or not index.isdigit() or not count.isdigit():
+        raise Exception(f"Invalid shard {text}, expected I/N (like 1/4)")
+    if not 1 <= int(index) <= int(count):
+        raise Exception(f"Invalid shard {text}, I should be between 1 and N")
+    return int(index), int(count)
+
+
+def _does_work(task: Task) -> bool:
+    """Tasks that neither run, wait nor sleep only group others"""
+    return task.run is not None or task.wait_until is not None or task.sleep is not None
+
+
+def shard(plan: List[Task], index: int, count: int) -> List[Task]:
+    """The part of the plan shard index (from 1) of count runs. The last tasks
+doing some work (those no other working task needs) are dealt to the shards in
+turns, in plan order, and each shard also runs what they depend on. Tasks only
+grouping others are left out. Dependencies shared between shards run in each of
+them"""
+    needed: Set[TaskKey] = set()
+    for task in reversed(plan):
+        if task.key in needed or _does_work(task):
+            needed.update(task.dependency_keys)
+    last = [task for task in plan if _does_work(task) and task.key not in needed]
+    selected = {task.key for task in last[index - 1 :: count]}
+    return [task for task in _with_dependencies(plan, selected) if _does_work(task)]
@@ -1,28 +1,26 @@
+import itertools
 import logging
 import sys
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Set, Tuple, Union
 
-from paque.task import Task
+from paque.task import Task, TaskKey, Template
 
 logger = logging.getLogger("paque.planner")
 
 
 class Planner:
-    def __init__(self, _tasks: Dict[str, Task]) -> None:
+    def __init__(self, _tasks: Mapping[str, Task]) -> None:
         self._tasks = _tasks
-        logger.debug(self._tasks)
         self._steps: List[Task] = []
+        self._templates: Dict[str, Template] = {}
 
     def find_dependencies(self, task: str) -> List[str]:
         if task in self._tasks.keys():
             dependencies = self._tasks[task].depends
             logger.debug("DEPENDENCIES: %s", dependencies)
-            if isinstance(dependencies, List):
-                return [d.name for d in dependencies if d is not None]
-            if isinstance(dependencies, Task):
-                return [dependencies.name]
             if dependencies is None:
                 return []
+            return list(dependencies)
         raise Exception("Task required, and not found", task)
 
     @staticmethod
@@ -30,64 +28,82 @@ class Planner:
         raw_dependency: str,
     ) -> Union[Tuple[str, List[str]], Tuple[str, None]]:
         if " " in raw_dependency:
-            dependency, *args = raw_dependency.split(" ")
-            return dependency, args
+            return Task.split_name(raw_dependency)
         return raw_dependency, None
 
     def _with_args(self, task_name: str, args: Optional[List[str]]) -> Task:
+        """Instance of the task with these arguments. Each task is compiled into a
+template once, and each instance of it is only created once"""
         logger.debug("Task to replace: %s", task_name)
-        try:
-            extracted = self._tasks[task_name]
-        except KeyError as exc:
-            logger.error("Task %s not found in file", task_name)
-            sys.exit(-1)
-        if args is not None:
-            extracted.with_args(args)
-        return extracted
+        template = self._templates.get(task_name)
+        if template is None:
+            try:
+                extracted = self._tasks[task_name]
+            except KeyError as exc:
+                logger.error("Task %s not found in file", task_name)
+                sys.exit(-1)
+            template = Template(extracted)
+            self._templates[task_name] = template
+        return template.instantiate(args)
 
-    def _remaining(self, dependencies: List[str]) -> List[str]:
-        done = {task.name for task in self._steps}
-        return sorted(set(dependencies).difference(done))
+    def _dependency_specs(
+        self, task: Task
+    ) -> Iterator[Tuple[str, Optional[List[str]]]]:
+        """Dependencies of an (already argument-replaced) task, as name and
+arguments, in the order they are planned: its depends (sorted), and then the
+instances of its matrices, generated as they are needed"""
+        depends = () if task.depends is None else sorted(set(task.depends))
+        return itertools.chain(
+            (self.dependency_and_arguments(dependency) for dependency in depends),
+            *(matrix.instances() for matrix in task.matrix or ()),
+        )
 
     def _plan(self, task_name: str, args: Optional[List[str]] = None) -> None:
-        initial_state = len(self._steps)
-        logger.debug("Already ran: %s", self._steps)
-        task = self._with_args(task_name, args)
-        initial_dependencies = self.find_dependencies(task_name)
-        dependencies = self._remaining(initial_dependencies)
-        if len(dependencies) == 0:
-            logger.debug("Can run %s(%s) with no dependencies left", task, args)
-            step = self._with_args(task_name, args)
-            if step not in self._steps:
-                logger.debug("Adding step: %s", step)
-                self._steps.append(self._with_args(task_name, args))
-            return
+        """Iterative depth first search: each dependency is planned (in sorted
+order) before the task depending on it, and every (task, arguments) node is
+expanded only once. A dependency that is still being expanded further up the
+stack is a cycle. Nodes are compared by key, ignoring the order of arguments"""
+        done: Set[TaskKey] = {step.key for step in self._steps}
+        visiting: Dict[TaskKey, int] = {}
+        stack: List[Tuple[TaskKey, Task, Iterator[Tuple[str, Any]]]] = []
 
-        logger.debug("Has dependencies, plan them: %s", dependencies)
-        for raw_dependency in dependencies:
-            dependency, new_args = self.dependency_and_arguments(raw_dependency)
-            logger.debug("Dependency %s has args %s", dependency, new_args)
-            self._plan(dependency, new_args)
+        def push(key: TaskKey, name: str, node_args: Optional[List[str]]) -> None:
+            task = self._with_args(name, node_args)
+            logger.debug("Expanding %s(%s)", name, node_args)
+            visiting[key] = len(stack)
+            stack.append((key, task, self._dependency_specs(task)))
 
-        if len(self._steps) > initial_state and len(self._remaining(dependencies)) != 0:
-            logger.debug("Process has progressed, recurse on same task")
-            self._plan(task_name, args)
-        if len(self._remaining(dependencies)) == 0:
-            logger.debug("We have parsed dependencies, fix and repeat on same task")
-            self._plan(task_name, args)
-        if len(self._steps) == initial_state:
-            logger.debug("We have stopped improving")
-            raise Exception("Could not find a plan to solve {}({})".format(task, args))
-        logger.debug("Final recursion")
-        self._plan(task_name, args)
+        if args is None:
+            task_name, args = self.dependency_and_arguments(task_name)
+        push((task_name, tuple(sorted(args or ()))), task_name, args)
+        while len(stack) > 0:
+            node, task, pending = stack[-1]
+            dependency = next(pending, None)
+            if dependency is not None:
+                name, new_args = dependency
+                key = (name, tuple(sorted(new_args or ())))
+                if key in done:
+                    continue
+                if key in visiting:
+                    cycle = [frame[1].name for frame in stack[visiting[key] :]]
+                    raise Exception(
+                        "Dependency cycle found: {}".format(
+                            " -> ".join(cycle + [Task.id_of(key)])
+                        )
+                    )
+                logger.debug("Dependency %s has args %s", name, new_args)
+                push(key, name, new_args)
+                continue
+            stack.pop()
+            del visiting[node]
+            if task.key not in done:
+                logger.debug("Adding step: %s", task.name)
+                done.add(task.key)
+                self._steps.append(task)
 
     def plan(self, task: str) -> List[Task]:
         logger.info(">>> Planning execution for task %s", task)
         self._plan(task)
         abbreviated_plan = [task.name for task in self._steps]
         logger.info(">>> Plan requires %s", abbreviated_plan)
-        correct_steps = []
-        for step in self._steps:
-            correct_step = step.replace_dependencies_with(self._steps)
-            correct_steps.append(correct_step)
-        return correct_steps
+        return list(self._steps)
@@ -0,0 +1,21 @@
+import random
+from typing import Iterator, NamedTuple
+
+
+class Probe(NamedTuple):
+    """What a wait_until section asks for: run command until it succeeds, for at
+most timeout seconds, waiting from interval up to max_interval seconds between
+attempts"""
+
+    command: str
+    timeout: float = 60.0
+    interval: float = 0.5
+    max_interval: float = 10.0
+
+    def delays(self) -> Iterator[float]:
+        """How long to wait after each failed attempt: doubling every time (up to
+max_interval), with jitter so probes started together do not stay in step"""
+        delay = self.interval
+        while True:
+            yield random.uniform(delay / 2, delay)
+            delay = min(delay * 2, self.max_interval)
@@ -0,0 +1,122 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+logger = logging.getLogger("paque.profiling")
+
+# Calls worth counting on pathological paquefiles, by file and function. They
+# are read from the profiles, so the code being counted does not pay for it
+HOT_CALLS: List[Tuple[str, str, str]] = [
+    ("parsed tasks", "parser.py", "_build_tasks"),
+    ("planned nodes", "planner.py", "push"),
+    ("task lookups", "planner.py", "_with_args"),
+    ("instances", "task.py", "instantiate"),
+    ("task names split", "task.py", "split_name"),
+    ("task reprs", "task.py", "__repr__"),
+    ("hashes", "task.py", "__hash__"),
+    ("fingerprints", "fingerprint.py", "fingerprint"),
+    ("file hashes", "fingerprint.py", "_file_digest"),
+]
+
+
+class Profiler:
+    """Where paque itself spends its time and memory, by phase (parse, plan,
+execute...). Each phase gets its own cProfile profile, and the CPU time of this
+process (which does not include the commands run, they are children). Only the
+thread entering a phase is profiled, so running tasks in parallel the profile of
+execute only has the scheduling. Allocations are traced with tracemalloc.
+
+Templates are instantiated while planning, as each dependency is reached, so
+their time is part of plan (the instances count says how many there were)"""
+
+    def __init__(self, top: int = 20) -> None:
+        self._top = top
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._cpu: Dict[str, float] = {}
+        self._wall: Dict[str, float] = {}
+        self._peak: Dict[str, int] = {}
+        tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Profiles the block. Phases entered more than once add up"""
+        profile = self._profiles.setdefault(name, cProfile.Profile())
+        if hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+            tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._cpu[name] = self._cpu.get(name, 0.0) + time.process_time() - cpu
+            self._wall[name] = self._wall.get(name, 0.0) + time.perf_counter() - wall
+            _, peak = tracemalloc.get_traced_memory()
+            self._peak[name] = max(self._peak.get(name, 0), peak - base)
+
+    def counts(self) -> Dict[str, int]:
+        """Number of calls to each of HOT_CALLS, over all phases"""
+        counts = {label: 0 for label, _, _ in HOT_CALLS}
+        for profile in self._profiles.values():
+            stats = pstats.Stats(profile).stats  # type: ignore
+            for (path, _, function), (_, calls, _, _, _) in stats.items():
+                for label, filename, hot in HOT_CALLS:
+                    if function == hot and os.path.basename(path) == filename:
+                        counts[label] += calls
+        return counts
+
+    def report(self) -> str:
+        lines = [f"{'phase':<12}{'cpu s':>10}{'wall s':>10}{'peak KB':>12}"]
+        for name in self._profiles:
+            lines.append(
+                f"{name:<12}{self._cpu[name]:>10.3f}{self._wall[name]:>10.3f}"
+                f"{self._peak[name] // 1024:>12}"
+            )
+        lines.append("")
+        lines.append("calls:")
+        lines.extend(f"  {label}: {count}" for label, count in self.counts().items())
+        for name, profile in self._profiles.items():
+            printed = io.StringIO()
+            stats = pstats.Stats(profile, stream=printed)
+            stats.sort_stats("cumulative").print_stats(self._top)
+            lines.extend(["", f"{name}, by cumulative time:", printed.getvalue()])
+        lines.append(f"top {self._top} allocations still alive:")
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        lines.extend(
+            f"  {statistic}" for statistic in snapshot.statistics("lineno")[: self._top]
+        )
+        return "\n".join(lines) + "\n"
+
+    def write(self, folder: str) -> None:
+        """Writes the profile of each phase (as pstats files, for snakeviz and
+friends) and the report to folder, logging the summary"""
+        os.makedirs(folder, exist_ok=True)
+        for name, profile in self._profiles.items():
+            profile.dump_stats(os.path.join(folder, f"{name}.pstats"))
+        report = self.report()
+        tracemalloc.stop()
+        with open(os.path.join(folder, "report.txt"), "w") as report_file:
+            report_file.write(report)
+        for name in self._profiles:
+            logger.info(
+                ">>> %s: %.3fs cpu, %.3fs wall, %s KB peak",
+                name,
+                self._cpu[name],
+                self._wall[name],
+                self._peak[name] // 1024,
+            )
+        logger.info(
+            ">>> Calls: %s",
+            ", ".join(f"{label} {count}" for label, count in self.counts().items()),
+        )
+        logger.info("Profile written to %s", folder)
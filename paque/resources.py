@@ -0,0 +1,101 @@
+import logging
+import os
+import time
+from typing import Callable, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger("paque.resources")
+
+# How often the load average is looked at again while it holds tasks back
+LOAD_CHECK_INTERVAL = 1.0
+
+
+class Resources(NamedTuple):
+    """What a resources section asks for while the task runs: cpu slots (out of
+--jobs), memory in MB, and named locks no other running task can hold"""
+
+    cpu: int = 1
+    memory: int = 0
+    locks: Tuple[str, ...] = ()
+
+
+DEFAULT = Resources()
+
+
+def physical_memory() -> Optional[int]:
+    """In MB, if the system tells"""
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1 << 20)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class Budget:
+    """What the running tasks can use between them: cpu slots, memory (in MB, no
+limit if None) and locks. Nothing is ever held back while no task is running, so
+a task asking for more than there is still runs, on its own. With a
+load_average, like make -l, no task starts while the load of the system is at
+or above it, unless none is running"""
+
+    def __init__(
+        self,
+        cpu: int,
+        memory: Optional[int] = None,
+        load_average: Optional[float] = None,
+        getloadavg: Callable[[], Tuple[float, float, float]] = os.getloadavg,
+    ) -> None:
+        self.cpu = cpu
+        self.memory = memory
+        self.load_average = load_average
+        self._getloadavg = getloadavg
+        self._cpu_used = 0
+        self._memory_used = 0
+        self._locks: Set[str] = set()
+        self._running = 0
+        self._load_checked = 0.0
+        self._overloaded = False
+
+    def idle(self) -> bool:
+        return self._running == 0
+
+    def full(self) -> bool:
+        return not self.idle() and (self._cpu_used >= self.cpu or self.overloaded())
+
+    def overloaded(self) -> bool:
+        """Checked at most every LOAD_CHECK_INTERVAL, getloadavg is not free and
+the load average does not move faster than that anyway"""
+        if self.load_average is None:
+            return False
+        now = time.monotonic()
+        if now - self._load_checked >= LOAD_CHECK_INTERVAL:
+            self._load_checked = now
+            load = self._getloadavg()[0]
+            self._overloaded = load >= self.load_average
+            if self._overloaded:
+                logger.debug("Holding tasks back, load average is %s", load)
+        return self._overloaded
+
+    def fits(self, resources: Optional[Resources]) -> bool:
+        if self.idle():
+            return True
+        resources = resources or DEFAULT
+        if self._cpu_used + resources.cpu > self.cpu:
+            return False
+        if self.memory is not None and (
+            self._memory_used + resources.memory > self.memory
+        ):
+            return False
+        return self._locks.isdisjoint(resources.locks)
+
+    def acquire(self, resources: Optional[Resources]) -> None:
+        resources = resources or DEFAULT
+        self._running += 1
+        self._cpu_used += resources.cpu
+        self._memory_used += resources.memory
+        self._locks.update(resources.locks)
+
+    def release(self, resources: Optional[Resources]) -> None:
+        resources = resources or DEFAULT
+        self._running -= 1
+        self._cpu_used -= resources.cpu
+        self._memory_used -= resources.memory
+        self._locks.difference_update(resources.locks)
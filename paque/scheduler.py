@@ -0,0 +1,79 @@
+import heapq
+import logging
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from paque.task import Task, TaskKey
+
+logger = logging.getLogger("paque.scheduler")
+
+
+class Scheduler:
+    """Keeps track of which tasks of a plan can start, given the ones that have
+finished. The plan is expected to be topologically sorted (which is what the
+Planner returns), ready tasks are handed out in plan order, or with priorities,
+highest first (ties in plan order). Tasks are tracked by key, and dependencies
+outside of the plan are ignored"""
+
+    def __init__(
+        self, plan: List[Task], priorities: Optional[Dict[TaskKey, float]] = None
+    ) -> None:
+        self._tasks: Dict[TaskKey, Task] = {task.key: task for task in plan}
+        priorities = priorities or {}
+        self._order: Dict[TaskKey, Tuple[float, int]] = {
+            task.key: (-priorities.get(task.key, 0.0), i) for i, task in enumerate(plan)
+        }
+        self._pending: Dict[TaskKey, int] = {}
+        self._dependents: Dict[TaskKey, List[TaskKey]] = {task.key: [] for task in plan}
+        for task in plan:
+            dependencies = self._dependencies_in_plan(task)
+            self._pending[task.key] = len(dependencies)
+            for dependency in dependencies:
+                self._dependents[dependency].append(task.key)
+        self._ready: List[Tuple[Tuple[float, int], TaskKey]] = [
+            (self._order[key], key)
+            for key, pending in self._pending.items()
+            if pending == 0
+        ]
+        heapq.heapify(self._ready)
+        self._unfinished = len(plan)
+
+    def _dependencies_in_plan(self, task: Task) -> Set[TaskKey]:
+        return {key for key in task.dependency_keys if key in self._tasks}
+
+    def has_ready(self) -> bool:
+        return len(self._ready) > 0
+
+    def pop_ready(self) -> Task:
+        _, key = heapq.heappop(self._ready)
+        return self._tasks[key]
+
+    def pop_ready_if(self, fits: Callable[[Task], bool]) -> Optional[Task]:
+        """The first ready task (in plan order) that fits, if any"""
+        skipped = []
+        found = None
+        while len(self._ready) > 0:
+            item = heapq.heappop(self._ready)
+            if fits(self._tasks[item[1]]):
+                found = self._tasks[item[1]]
+                break
+            skipped.append(item)
+        for item in skipped:
+            heapq.heappush(self._ready, item)
+        return found
+
+    def retry(self, task: Task) -> None:
+        """Hands out again a task that had been handed out but did not finish"""
+        heapq.heappush(self._ready, (self._order[task.key], task.key))
+
+    def done(self, task: Task) -> None:
+        """Marks the task as finished, releasing the dependents that were only
+waiting for it"""
+        self._unfinished -= 1
+        for dependent in self._dependents[task.key]:
+            self._pending[dependent] -= 1
+            if self._pending[dependent] == 0:
+                logger.debug("%s is ready", self._tasks[dependent].name)
+                heapq.heappush(self._ready, (self._order[dependent], dependent))
+
+    def finished(self) -> bool:
+        return self._unfinished == 0
@@ -0,0 +1,146 @@
+import logging
+import os
+import queue
+import shlex
+import subprocess
+import sys
+import threading
+import uuid
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("paque.shellpool")
+
+CHUNK = 1 << 16
+
+
+class ShellWorker:
+    """A long lived shell, fed commands through its stdin. Each command runs in a
+subshell (so cd, exports or exit in one command do not affect the next) with
+stdin from /dev/null. Its exit status is printed after it, on its own line,
+behind a random sentinel that command output cannot predict"""
+
+    def __init__(self, shell: str = "/bin/sh") -> None:
+        self._process = subprocess.Popen(
+            [shell], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        self.broken = False
+
+    def _script(
+        self,
+        command: str,
+        sentinel: str,
+        cwd: Optional[str],
+        env: Optional[Dict[str, str]],
+        merge: bool,
+    ) -> bytes:
+        setup = []
+        if cwd is not None:
+            setup.append(f"cd {shlex.quote(cwd)}")
+        for key, value in (env or {}).items():
+            setup.append(f"export {key}={shlex.quote(value)}")
+        setup.append(f"eval {shlex.quote(command)}")
+        redirect = " 2>&1" if merge else ""
+        script = (
+            f"( {' && '.join(setup)}\n) </dev/null{redirect}\n"
+            f"printf '\\n{sentinel} %d\\n' \"$?\"\n"
+        )
+        return script.encode("utf-8")
+
+    def run(
+        self,
+        command: str,
+        outputs: Optional[List[Any]] = None,
+        cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+    ) -> int:
+        """Returns the exit status of the command. Its stdout (and stderr, merged,
+if there are outputs) is copied to the outputs, or to our stdout otherwise"""
+        sentinel = f"__paque_{uuid.uuid4().hex}__"
+        marker = f"\n{sentinel} ".encode("utf-8")
+        targets = outputs if outputs is not None else [sys.stdout.buffer]
+        stdin = self._process.stdin
+        stdout = self._process.stdout
+        assert stdin is not None and stdout is not None
+        try:
+            stdin.write(self._script(command, sentinel, cwd, env, outputs is not None))
+            stdin.flush()
+            buffer = b""
+            while True:
+                chunk = os.read(stdout.fileno(), CHUNK)
+                if not chunk:
+                    raise Exception("Shell worker exited unexpectedly")
+                buffer += chunk
+                found = buffer.find(marker)
+                if found >= 0:
+                    end = buffer.find(b"\n", found + len(marker))
+                    if end < 0:
+                        continue
+                    self._emit(targets, buffer[:found])
+                    return int(buffer[found + len(marker) : end])
+                # Everything but what could be the start of the marker is output
+                safe = max(len(buffer) - len(marker), 0)
+                self._emit(targets, buffer[:safe])
+                buffer = buffer[safe:]
+        except BaseException:
+            self.broken = True
+            raise
+
+    @staticmethod
+    def _emit(targets: List[Any], data: bytes) -> None:
+        if len(data) == 0:
+            return
+        for target in targets:
+            target.write(data)
+            target.flush()
+
+    def close(self) -> None:
+        if self._process.stdin is not None:
+            self._process.stdin.close()
+        if self.broken:
+            self._process.kill()
+        self._process.wait()
+
+
+class ShellPool:
+    """Up to size ShellWorker, started when first needed and reused afterwards,
+to avoid starting a new shell for each command"""
+
+    def __init__(self, size: int, shell: str = "/bin/sh") -> None:
+        self._size = size
+        self._shell = shell
+        self._idle: "queue.Queue[ShellWorker]" = queue.Queue()
+        self._started = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> ShellWorker:
+        with self._lock:
+            if self._idle.empty() and self._started < self._size:
+                self._started += 1
+                logger.debug("Starting shell worker %s", self._started)
+                return ShellWorker(self._shell)
+        return self._idle.get()
+
+    def _release(self, worker: ShellWorker) -> None:
+        if not worker.broken:
+            self._idle.put(worker)
+            return
+        worker.close()
+        with self._lock:
+            self._started -= 1
+
+    def run(
+        self,
+        command: str,
+        outputs: Optional[List[Any]] = None,
+        cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+    ) -> int:
+        worker = self._acquire()
+        try:
+            return worker.run(command, outputs, cwd, env)
+        finally:
+            self._release(worker)
+
+    def close(self) -> None:
+        while not self._idle.empty():
+            self._idle.get().close()
@@ -0,0 +1,93 @@
+import logging
+import os
+import re
+from typing import Optional
+
+from paque.state import state_path
+from paque.task import Task
+
+logger = logging.getLogger("paque.spool")
+
+
+class Tail:
+    """Keeps only the last max_bytes written to it: enough to explain why a
+command failed, whatever it printed before"""
+
+    def __init__(self, max_bytes: int = 4096) -> None:
+        self._max_bytes = max_bytes
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data[-self._max_bytes :]
+        overflow = len(self._buffer) - self._max_bytes
+        if overflow > 0:
+            del self._buffer[:overflow]
+
+    def flush(self) -> None:
+        pass
+
+    def getvalue(self) -> bytes:
+        return bytes(self._buffer)
+
+    def __str__(self) -> str:
+        return self.getvalue().decode("utf-8", errors="replace")
+
+
+class SpoolFile:
+    """Log file of a single task, rotated (to .1, .2...) when it would grow over
+max_bytes"""
+
+    def __init__(self, path: str, max_bytes: int, backups: int) -> None:
+        self.path = path
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self._file = open(path, "ab")
+        self._size = self._file.tell()
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for index in range(self._backups - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        if self._backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "wb")
+        self._size = 0
+
+    def write(self, data: bytes) -> None:
+        if self._size > 0 and self._size + len(data) > self._max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._size += len(data)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class LogSpool:
+    """Keeps the output of each task in its own file under .paque/logs/"""
+
+    def __init__(
+        self,
+        folder: Optional[str] = None,
+        max_bytes: int = 10 * 1024 * 1024,
+        backups: int = 2,
+    ) -> None:
+        self._folder = (
+            folder if folder is not None else os.path.dirname(state_path("logs", ""))
+        )
+        os.makedirs(self._folder, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._backups = backups
+
+    def path(self, task: Task) -> str:
+        return os.path.join(self._folder, re.sub(r"[^\w.-]", "_", task.name) + ".log")
+
+    def open(self, task: Task) -> SpoolFile:
+        spool_file = SpoolFile(self.path(task), self._max_bytes, self._backups)
+        logger.debug("Output of %s spooled to %s", task.name, spool_file.path)
+        return spool_file
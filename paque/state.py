@@ -0,0 +1,11 @@
+import os
+
+STATE_DIR = ".paque"
+
+
+def state_path(*parts: str) -> str:
+    """Path inside the state folder paque keeps in the working directory (where
+the paquefile is looked for), creating the parent folders as needed"""
+    path = os.path.join(os.getcwd(), STATE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -1,116 +1,239 @@
 import logging
-from typing import Dict, List, Optional, Union
+import shlex
+from string import Formatter
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
-Section = Optional[Union[List[str], str, int]]
+from paque.matrix import Matrix
+from paque.probe import Probe
+from paque.resources import Resources
+
+Section = Optional[Union[List[str], str, int, Dict[str, Any]]]
+
+# A task is identified by the template it comes from and its arguments, sorted,
+# so "C a:1 b:2" and "C b:2 a:1" are the same task. Arguments with spaces are
+# quoted like in a shell: "C 'a:1 2' b:2"
+TaskKey = Tuple[str, Tuple[str, ...]]
 
 logger = logging.getLogger("paque.Task")
 
 
+class _Formatted(str):
+    """Text left to str.format when instantiating"""
+
+
+# A string that does not need formatting, or its parts as string.Formatter.parse
+# returns them
+Compiled = Union[
+    str, Tuple[Tuple[str, Optional[str], Optional[str], Optional[str]], ...]
+]
+
+FIELDS = (
+    "name",
+    "run",
+    "depends",
+    "message",
+    "sleep",
+    "condition",
+    "inputs",
+    "outputs",
+    "wait_until",
+    "resources",
+    "matrix",
+)
+
+
 class Task:
     """Task instance. Having it as a separate entity (instead of faking it with
 dictionaries inside of the Planner) means it's easier to test, debug and swap
-implementations. Obviously"""
+implementations. Obviously.
+
+Tasks are immutable values. Dependencies are referenced by name (what the
+paquefile says, after argument substitution), not by nested tasks. The key and
+hash are computed once, and the dependency keys the first time they are needed,
+so hashing and comparing tasks does not depend on how many tasks they depend on"""
+
+    __slots__ = FIELDS + ("key", "_hash", "_dependency_keys")
+
+    name: str
+    run: Optional[str]
+    depends: Optional[Tuple[str, ...]]
+    message: Optional[str]
+    sleep: Optional[str]
+    condition: Optional[str]
+    inputs: Optional[Tuple[str, ...]]
+    outputs: Optional[Tuple[str, ...]]
+    wait_until: Optional[Probe]
+    resources: Optional[Resources]
+    matrix: Optional[Tuple[Matrix, ...]]
+    key: TaskKey
+    _hash: int
+    _dependency_keys: Optional[Tuple[TaskKey, ...]]
 
     def __init__(
         self,
         name: str = "",
         run: Optional[str] = None,
-        depends: Optional[List["Task"]] = None,
+        depends: Optional[Sequence[Union["Task", str]]] = None,
         message: Optional[str] = None,
-        sleep: Optional[str] = None,
+        sleep: Optional[Union[str, int]] = None,
         condition: Optional[str] = None,
+        inputs: Optional[Sequence[str]] = None,
+        outputs: Optional[Sequence[str]] = None,
+        wait_until: Optional[Probe] = None,
+        resources: Optional[Resources] = None,
+        matrix: Optional[Sequence[Matrix]] = None,
     ):
-        self.name = name
-        self.run = run
-        self.depends = depends
-        self.message = message
-        self.sleep = sleep
-        self.condition = condition
+        """Dependencies can be given as tasks too, only their names are kept"""
+        if depends is not None:
+            depends = tuple(
+                dependency.name if isinstance(dependency, Task) else dependency
+                for dependency in depends
+                if dependency is not None
+            )
+        initialize = object.__setattr__
+        initialize(self, "name", name)
+        initialize(self, "run", run)
+        initialize(self, "depends", depends)
+        initialize(self, "message", message)
+        initialize(self, "sleep", None if sleep is None else str(sleep))
+        initialize(self, "condition", condition)
+        initialize(self, "inputs", None if inputs is None else tuple(inputs))
+        initialize(self, "outputs", None if outputs is None else tuple(outputs))
+        initialize(self, "wait_until", wait_until)
+        initialize(self, "resources", resources)
+        initialize(self, "matrix", None if matrix is None else tuple(matrix))
+        initialize(self, "key", self.key_of(name))
+        initialize(self, "_hash", hash(self.key))
+        initialize(self, "_dependency_keys", None)
+
+    @staticmethod
+    def split_name(name: str) -> Tuple[str, List[str]]:
+        """Template and arguments of the task with this name (or of the dependency
+written like this)"""
+        if "'" in name or '"' in name:
+            try:
+                template, *args = shlex.split(name)
+                return template, args
+            except ValueError:  # Not quoting after all, like in "msg:it's"
+                pass
+        template, *args = name.split(" ")
+        return template, args
+
+    @staticmethod
+    def key_of(name: str) -> TaskKey:
+        """Key of the task with this name (or of the dependency written like this)"""
+        if " " not in name:
+            return name, ()
+        template, args = Task.split_name(name)
+        return template, tuple(sorted(args))
+
+    @staticmethod
+    def id_of(key: TaskKey) -> str:
+        """The key as a string: the name of the template with sorted arguments"""
+        template, args = key
+        return " ".join((template,) + args)
+
+    @property
+    def dependency_keys(self) -> Tuple[TaskKey, ...]:
+        """Of the dependencies in depends, and of every instance of its matrices.
+Built the first time they are asked for, and kept"""
+        keys = self._dependency_keys
+        if keys is None:
+            keys = tuple(self.key_of(dependency) for dependency in self.depends or ())
+            for matrix in self.matrix or ():
+                keys += tuple(matrix.keys())
+            object.__setattr__(self, "_dependency_keys", keys)
+        return keys
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain data (that can be sent as JSON), from_dict builds the task back"""
+        data = {field: getattr(self, field) for field in FIELDS}
+        if self.wait_until is not None:
+            data["wait_until"] = self.wait_until._asdict()
+        if self.resources is not None:
+            data["resources"] = self.resources._asdict()
+        if self.matrix is not None:
+            data["matrix"] = [matrix.to_dict() for matrix in self.matrix]
+        return data
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "Task":
+        values = dict(data)
+        if values.get("wait_until") is not None:
+            values["wait_until"] = Probe(**values["wait_until"])
+        if values.get("resources") is not None:
+            resources = dict(values["resources"])
+            resources["locks"] = tuple(resources.get("locks", ()))
+            values["resources"] = Resources(**resources)
+        if values.get("matrix") is not None:
+            values["matrix"] = [Matrix.from_dict(matrix) for matrix in values["matrix"]]
+        return Task(**values)
+
+    def replace(self, **changes: Any) -> "Task":
+        """A new task, with some fields changed"""
+        values = {field: getattr(self, field) for field in FIELDS}
+        values.update(changes)
+        return Task(**values)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"Task is immutable, can't set {name}")
+
+    def __reduce__(self):
+        return Task, tuple(getattr(self, field) for field in FIELDS)
 
     def __repr__(self) -> str:
         """Why did you use emoji? Why not?"""
-        depends_if_then_runs = f"[{self.depends}] ({self.condition}?)-> {self.run}"
+        depends = None if self.depends is None else list(self.depends)
+        depends_if_then_runs = f"[{depends}] ({self.condition}?)-> {self.run}"
         says_sleeps = f"(🗣 {self.message},😴 {self.sleep})"
-        return f"Task({self.name}: {depends_if_then_runs} {says_sleeps}"
+        if self.wait_until is not None:
+            says_sleeps += f" (⏳ {self.wait_until.command})"
+        if self.inputs is None and self.outputs is None:
+            return f"Task({self.name}: {depends_if_then_runs} {says_sleeps}"
+        reads_writes = f"(📥 {self.inputs},📤 {self.outputs})"
+        return f"Task({self.name}: {depends_if_then_runs} {says_sleeps} {reads_writes}"
 
     def __lt__(self, other):
         if not isinstance(other, Task):
             return NotImplemented
-        return repr(self) < repr(other)
+        return self.key < other.key
 
     def __hash__(self):
-        return hash(repr(self))
+        return self._hash
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Task):
             return NotImplemented
-        return self.name == other.name and str(self) == str(other)
-
-    def replace_dependencies_with(self, steps: List["Task"]) -> "Task":
-        """Replace dependencies with fully processed dependencies. This is to ensure
-the final plan has all tasks as the final state requires. This is actually an
-advantage when faking it with dictionaries inside the Planner: you can do this
-by just replacements as you go. Not with a separate Task implementation with
-properties.
-
-        """
-        proper_dependencies = []
-        if self.depends is None:
-            return self
-        for dependency in self.depends:
-            done_step = [step for step in steps if step.name == dependency.name][0]
-            proper_dependencies.append(done_step)
-        self.depends = proper_dependencies
-        return self
+        if self is other:
+            return True
+        return (
+            self._hash == other._hash
+            and self.key == other.key
+            and self.run == other.run
+            and self.dependency_keys == other.dependency_keys
+            and self.message == other.message
+            and self.sleep == other.sleep
+            and self.condition == other.condition
+            and self.inputs == other.inputs
+            and self.outputs == other.outputs
+            and self.wait_until == other.wait_until
+            and self.resources == other.resources
+            and self.matrix == other.matrix
+        )
 
     @staticmethod
     def _args_dict(args: List[str]) -> Dict[str, str]:
         """Helper to convert arguments to dictionries for formatting/replacement"""
         args_dict = {}
         for arg in args:
-            key, value = arg.split(":")
+            key, value = arg.split(":", 1)
             args_dict[key] = value
         return args_dict
 
     def with_args(self, args: Optional[List[str]]) -> "Task":
-        """Replaces the properties of this task with the replacements after argument
-substitution"""
-
-        def interpolate(item):
-            try:
-                return item.format(**args_dict)
-            except KeyError as e:
-                raise Exception(f"Argument not found: {e}")
-
-        logger.debug("Task: %s", self)
-        logger.debug("args: %s", args)
-
-        if args is None:
-            return self
-
-        args_string = " ".join(args)
-
-        args_dict: Dict[str, str] = self._args_dict(args)
-        self.name = interpolate(self.name)
-        if args_string not in self.name:
-            self.name = self.name + " {}".format(args_string)
-        if self.run is not None:
-            self.run = interpolate(self.run)
-        if self.message is not None:
-            self.message = interpolate(self.message)
-        if self.sleep is not None:
-            self.sleep = interpolate(self.sleep)
-        if self.condition is not None:
-            self.condition = interpolate(self.condition)
-        if self.depends is not None:  # Depends can be an empty list instead of None!
-            self.depends = [
-                dependency.with_args(args)
-                for dependency in self.depends
-                if dependency is not None
-            ]
-
-        logger.debug("interpolated Task: %s", self)
-        return self
+        """A new task, with the properties of this one after argument substitution.
+The arguments are added to its name, and passed on to its dependencies"""
+        return Template(self).instantiate(args)
 
     def get_sleep(self) -> Optional[int]:
         """Sleep is special: it eventually needs to be an integer. We cast it at the
@@ -121,3 +244,149 @@ very end of the processes"""
             return int(self.sleep)
         except ValueError as v:
             raise Exception("Sleep should be an integer by this point %s", v)
+
+
+def _compile(text: str) -> Compiled:
+    """Parses the replacement fields of text once. Anything str.format would do
+more than looking arguments up by name (indexes, attributes, nested fields in
+the format spec) is left to str.format"""
+    parts = tuple(Formatter().parse(text))
+    if all(field is None for _, field, _, _ in parts):
+        return "".join(literal for literal, _, _, _ in parts)
+    for _, field, spec, _ in parts:
+        if field is not None and (not field.isidentifier() or "{" in (spec or "")):
+            return _Formatted(text)
+    return parts
+
+
+def _render(compiled: Compiled, args: Dict[str, str]) -> str:
+    pieces = []
+    try:
+        if isinstance(compiled, _Formatted):
+            return compiled.format(**args)
+        if isinstance(compiled, str):
+            return compiled
+        for literal, field, spec, conversion in compiled:
+            pieces.append(literal)
+            if field is None:
+                continue
+            value: Any = args[field]
+            if conversion == "q":  # Quoted for the shell
+                value = shlex.quote(value)
+            elif conversion is not None:
+                value = Formatter().convert_field(value, conversion)
+            pieces.append(format(value, spec or ""))
+    except KeyError as e:
+        raise Exception(f"Argument not found: {e}")
+    return "".join(pieces)
+
+
+def _render_optional(
+    compiled: Optional[Compiled], args: Dict[str, str]
+) -> Optional[str]:
+    return None if compiled is None else _render(compiled, args)
+
+
+def _render_all(
+    compiled: Optional[Tuple[Compiled, ...]], args: Dict[str, str]
+) -> Optional[List[str]]:
+    return None if compiled is None else [_render(item, args) for item in compiled]
+
+
+def _compile_all(texts: Optional[Tuple[str, ...]]) -> Optional[Tuple[Compiled, ...]]:
+    return None if texts is None else tuple(_compile(text) for text in texts)
+
+
+class Template:
+    """A task whose fields have been parsed for argument substitution, to create
+instances of it with different arguments without parsing them again. Instances
+are cached by their arguments, so asking twice for the same instance returns
+the same task"""
+
+    def __init__(self, task: Task) -> None:
+        self.task = task
+        self._name = _compile(task.name)
+        self._run = None if task.run is None else _compile(task.run)
+        self._message = None if task.message is None else _compile(task.message)
+        self._sleep = None if task.sleep is None else _compile(task.sleep)
+        self._condition = None if task.condition is None else _compile(task.condition)
+        self._depends = _compile_all(task.depends)
+        self._inputs = _compile_all(task.inputs)
+        self._outputs = _compile_all(task.outputs)
+        self._probe = (
+            None if task.wait_until is None else _compile(task.wait_until.command)
+        )
+        self._locks = (
+            None if task.resources is None else _compile_all(task.resources.locks)
+        )
+        self._instances: Dict[Tuple[str, ...], Task] = {}
+        self._resolved: Optional[Task] = None
+
+    def instantiate(self, args: Optional[List[str]]) -> Task:
+        if args is None and self.task.matrix is None:
+            return self.task
+        if args is None:
+            # Without arguments there is nothing to render, but matrices with
+            # commands still need their values
+            if self._resolved is None:
+                self._resolved = self.task.replace(
+                    matrix=[
+                        matrix.resolve(lambda text: text, [])
+                        for matrix in self.task.matrix or ()
+                    ]
+                )
+            return self._resolved
+        frozen = tuple(args)
+        instance = self._instances.get(frozen)
+        if instance is None:
+            instance = self._instantiate(args)
+            self._instances[frozen] = instance
+        return instance
+
+    def _instantiate(self, args: List[str]) -> Task:
+        args_string = " ".join(shlex.quote(arg) for arg in args)
+        args_dict = Task._args_dict(args)
+
+        def render(text):
+            return _render(_compile(text), args_dict)
+
+        def instance_name(compiled):
+            name = _render(compiled, args_dict)
+            if args_string not in name:
+                name = name + " {}".format(args_string)
+            return name
+
+        wait_until = self.task.wait_until
+        if wait_until is not None and self._probe is not None:
+            wait_until = wait_until._replace(command=_render(self._probe, args_dict))
+
+        task = Task(
+            instance_name(self._name),
+            run=_render_optional(self._run, args_dict),
+            # Depends can be an empty list instead of None!
+            depends=(
+                None
+                if self._depends is None
+                else [instance_name(dependency) for dependency in self._depends]
+            ),
+            message=_render_optional(self._message, args_dict),
+            sleep=_render_optional(self._sleep, args_dict),
+            condition=_render_optional(self._condition, args_dict),
+            inputs=_render_all(self._inputs, args_dict),
+            outputs=_render_all(self._outputs, args_dict),
+            wait_until=wait_until,
+            resources=(
+                None
+                if self.task.resources is None
+                else self.task.resources._replace(
+                    locks=tuple(_render_all(self._locks, args_dict) or ())
+                )
+            ),
+            matrix=(
+                None
+                if self.task.matrix is None
+                else [matrix.resolve(render, args) for matrix in self.task.matrix]
+            ),
+        )
+        logger.debug("interpolated Task: %s", task)
+        return task
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from paque.task import Task, TaskKey
+
+logger = logging.getLogger("paque.trace")
+
+
+def usage_details(usage: Any) -> Dict[str, Any]:
+    """What we keep of the rusage of a finished child (max RSS is in KB on Linux)"""
+    if usage is None:
+        return {}
+    return {
+        "user_s": round(usage.ru_utime, 6),
+        "sys_s": round(usage.ru_stime, 6),
+        "max_rss_kb": usage.ru_maxrss,
+    }
+
+
+class Tracer:
+    """Records how long each phase (condition, run, sleep) of each task takes,
+along with the resources used by the child process, as Chrome trace events.
+The resulting file can be opened in chrome://tracing or Perfetto"""
+
+    def __init__(self) -> None:
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._events: List[Dict[str, Any]] = []
+        self._lanes: Dict[int, int] = {}
+        self._durations: Dict[str, float] = {}
+
+    def _lane(self, lane: Optional[int]) -> int:
+        """Trace viewers show one row per thread id, renumber them from 1. Tasks
+that do not run in their own thread (like in the asyncio executor) pass their
+own lane number instead"""
+        ident = threading.get_ident() if lane is None else -lane
+        with self._lock:
+            if ident not in self._lanes:
+                self._lanes[ident] = len(self._lanes) + 1
+            return self._lanes[ident]
+
+    @contextmanager
+    def span(
+        self, task: Task, phase: str, lane: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Times the block. Anything added to the yielded dictionary ends up in
+the arguments of the event"""
+        details: Dict[str, Any] = {}
+        start = time.perf_counter()
+        try:
+            yield details
+        finally:
+            end = time.perf_counter()
+            event = {
+                "name": task.name,
+                "cat": phase,
+                "ph": "X",
+                "ts": round((start - self._start) * 1e6),
+                "dur": round((end - start) * 1e6),
+                "pid": os.getpid(),
+                "tid": self._lane(lane),
+                "args": dict(details, phase=phase),
+            }
+            with self._lock:
+                self._events.append(event)
+                if phase == "task":
+                    self._durations[task.name] = end - start
+
+    def write(self, path: str) -> None:
+        with self._lock:
+            lanes = [
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": lane,
+                    "args": {"name": f"worker {lane}"},
+                }
+                for lane in self._lanes.values()
+            ]
+            trace = {"traceEvents": lanes + self._events, "displayTimeUnit": "ms"}
+        with open(path, "w") as trace_file:
+            json.dump(trace, trace_file)
+        logger.info("Trace written to %s", path)
+
+    def critical_path(self, plan: List[Task]) -> Tuple[float, List[str]]:
+        """Longest chain of dependent tasks, weighted by how long each took. The
+plan is topologically sorted, so a single pass is enough"""
+        finish: Dict[TaskKey, float] = {}
+        previous: Dict[TaskKey, Any] = {}
+        names: Dict[TaskKey, str] = {}
+        for task in plan:
+            names[task.key] = task.name
+            slowest = None
+            for key in task.dependency_keys:
+                if key in finish and (slowest is None or finish[key] > finish[slowest]):
+                    slowest = key
+            previous[task.key] = slowest
+            waited = finish[slowest] if slowest is not None else 0.0
+            finish[task.key] = waited + self._durations.get(task.name, 0.0)
+        if len(finish) == 0:
+            return 0.0, []
+        last = max(finish, key=lambda key: finish[key])
+        path = []
+        current = last
+        while current is not None:
+            path.append(names[current])
+            current = previous[current]
+        return finish[last], list(reversed(path))
+
+    def log_summary(self, plan: List[Task], slowest: int = 5) -> None:
+        total, path = self.critical_path(plan)
+        on_path = set(path)
+        ranked = sorted(self._durations.items(), key=lambda item: -item[1])
+        logger.info(">>> Slowest tasks (* on the critical path)")
+        for name, duration in ranked[:slowest]:
+            marker = "*" if name in on_path else " "
+            logger.info("%s %8.3fs %s", marker, duration, name)
+        logger.info(
+            ">>> Critical path (%.3fs): %s",
+            total,
+            " -> ".join(
+                f"{name} ({self._durations.get(name, 0.0):.3f}s)" for name in path
+            ),
+        )
@@ -0,0 +1,402 @@
+import ctypes
+import ctypes.util
+import glob
+import logging
+import os
+import re
+import select
+import struct
+import sys
+import time
+from fnmatch import fnmatch
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import yaml
+
+from paque.parser import Paquefile, SafeLoader, YAMLParser
+from paque.planner import Planner
+from paque.task import Task, TaskKey
+
+logger = logging.getLogger("paque.watch")
+
+# Reported when changes were lost (the inotify queue overflowed): everything
+# has to be considered changed
+EVERYTHING = "*"
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+WATCHED_EVENTS = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+TOP_LEVEL_KEY = re.compile(r"^[^\s#\-].*:(\s|$)")
+ANCHOR_OR_ALIAS = re.compile(r"(^|[\s\[{,:])[&*]\w")
+
+
+class InotifyWatcher:
+    """Reports paths changed in the watched directories (not recursively), using
+inotify through ctypes"""
+
+    def __init__(self) -> None:
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories: Dict[int, str] = {}
+        self._watched: Set[str] = set()
+
+    def watch(self, directory: str) -> None:
+        directory = os.path.abspath(directory)
+        if directory in self._watched or not os.path.isdir(directory):
+            return
+        descriptor = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), WATCHED_EVENTS
+        )
+        if descriptor < 0:
+            logger.warning(
+                "Can't watch %s: %s", directory, os.strerror(ctypes.get_errno())
+            )
+            return
+        self._directories[descriptor] = directory
+        self._watched.add(directory)
+
+    def changes(self, timeout: Optional[float]) -> Set[str]:
+        """Waits up to timeout seconds (forever if None) for changes, returning
+whatever has changed since the last call"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        changed: Set[str] = set()
+        if len(readable) == 0:
+            return changed
+        while True:
+            try:
+                data = os.read(self._fd, 1 << 16)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                descriptor, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    changed.add(EVERYTHING)
+                    continue
+                directory = self._directories.get(descriptor)
+                if directory is None:
+                    continue
+                if mask & IN_IGNORED:  # The directory is gone
+                    del self._directories[descriptor]
+                    self._watched.discard(directory)
+                    continue
+                changed.add(os.path.join(directory, os.fsdecode(name)))
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Fallback for systems without inotify: compares modification times and sizes
+of the files in the watched directories every interval seconds"""
+
+    def __init__(self, interval: float = 0.5) -> None:
+        self._interval = interval
+        self._snapshots: Dict[str, Dict[str, Tuple[int, int]]] = {}
+
+    @staticmethod
+    def _snapshot(directory: str) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            pass
+        return snapshot
+
+    def watch(self, directory: str) -> None:
+        directory = os.path.abspath(directory)
+        if directory not in self._snapshots and os.path.isdir(directory):
+            self._snapshots[directory] = self._snapshot(directory)
+
+    def _poll(self) -> Set[str]:
+        changed: Set[str] = set()
+        for directory, before in self._snapshots.items():
+            after = self._snapshot(directory)
+            for path in before.keys() | after.keys():
+                if before.get(path) != after.get(path):
+                    changed.add(path)
+            self._snapshots[directory] = after
+        return changed
+
+    def changes(self, timeout: Optional[float]) -> Set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self._poll()
+            if len(changed) > 0:
+                return changed
+            if deadline is None:
+                time.sleep(self._interval)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return changed
+            time.sleep(min(self._interval, remaining))
+
+    def close(self) -> None:
+        self._snapshots.clear()
+
+
+def make_watcher() -> Any:
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as exc:
+            logger.debug("inotify not available, polling instead: %s", exc)
+    return PollingWatcher()
+
+
+def settle(watcher: Any, quiet: float) -> Set[str]:
+    """Changes until there have been none for quiet seconds, so that a burst of
+saves triggers a single run"""
+    changed: Set[str] = set()
+    while True:
+        more = watcher.changes(quiet)
+        if len(more) == 0:
+            return changed
+        changed |= more
+
+
+def split_definitions(text: str) -> List[str]:
+    """Splits a paquefile in the chunks of text defining each top level task.
+Comments and blank lines go with the task above them"""
+    chunks: List[List[str]] = []
+    for line in text.splitlines(keepends=True):
+        if TOP_LEVEL_KEY.match(line) or len(chunks) == 0:
+            chunks.append([])
+        chunks[-1].append(line)
+    return ["".join(chunk) for chunk in chunks]
+
+
+class DefinitionCache:
+    """Raw task definitions of a paquefile, loading again only the chunks of text
+(task definitions) that changed since the previous load. Files using anchors or
+aliases (which can cross definitions) are always loaded in full"""
+
+    def __init__(self) -> None:
+        self._chunks: Dict[str, Dict[str, Any]] = {}
+        self.definitions: Dict[str, Any] = {}
+
+    @staticmethod
+    def _load(text: str) -> Dict[str, Any]:
+        loaded = yaml.load(text, Loader=SafeLoader)
+        if loaded is None:
+            return {}
+        if not isinstance(loaded, dict):
+            raise Exception("A paquefile should be a dictionary of tasks")
+        return loaded
+
+    def _load_chunks(self, text: str) -> Dict[str, Any]:
+        chunks: Dict[str, Dict[str, Any]] = {}
+        definitions: Dict[str, Any] = {}
+        for chunk in split_definitions(text):
+            loaded = self._chunks.get(chunk)
+            if loaded is None:
+                loaded = self._load(chunk)
+            chunks[chunk] = loaded
+            for name, definition in loaded.items():
+                if name in definitions:
+                    raise Exception(f"Task {name} defined more than once")
+                definitions[name] = definition
+        self._chunks = chunks
+        return definitions
+
+    def load(self, text: str) -> Set[str]:
+        """Loads the text, returning the names of the tasks whose definition was
+added, removed or changed"""
+        if ANCHOR_OR_ALIAS.search(text):
+            self._chunks = {}
+            definitions = self._load(text)
+        else:
+            definitions = self._load_chunks(text)
+        changed = {
+            name
+            for name in definitions.keys() | self.definitions.keys()
+            if definitions.get(name) != self.definitions.get(name)
+        }
+        self.definitions = definitions
+        return changed
+
+
+def _matches(patterns: Optional[Sequence[str]], paths: Set[str]) -> bool:
+    """Like glob, but * also matches across directories, so this can only err on
+the side of running too much"""
+    if patterns is None:
+        return False
+    return any(
+        fnmatch(path, os.path.abspath(pattern))
+        for pattern in patterns
+        for path in paths
+    )
+
+
+def downstream(plan: List[Task], seeds: Set[str]) -> List[Task]:
+    """The tasks of the plan named in seeds or depending (even indirectly) on one
+of them, in plan order"""
+    affected: Set[TaskKey] = set()
+    for task in plan:
+        if task.name in seeds or not affected.isdisjoint(task.dependency_keys):
+            affected.add(task.key)
+    return [task for task in plan if task.key in affected]
+
+
+def _directories_for(pattern: str) -> Set[str]:
+    """Directories that need watching to notice changes to files matching the
+pattern: the part of it without wildcards, and everything below it if there are
+wildcards in directories too"""
+    parts = pattern.split(os.sep)
+    fixed: List[str] = []
+    for part in parts[:-1]:
+        if glob.has_magic(part):
+            break
+        fixed.append(part)
+    base = os.path.abspath(os.sep.join(fixed) or os.curdir)
+    if len(fixed) == len(parts) - 1:
+        return {base}
+    directories = {base}
+    for root, subdirectories, _ in os.walk(base):
+        subdirectories[:] = [name for name in subdirectories if name != ".paque"]
+        directories.update(os.path.join(root, name) for name in subdirectories)
+    return directories
+
+
+class Watch:
+    """Keeps the task graph of a paquefile in memory, running again only the part
+of the plan affected by each batch of changes: tasks with a changed input or
+definition, and everything downstream of them. Changes to the paquefile only
+load again the definitions that changed, changes to the paquefiles it includes
+load them again"""
+
+    def __init__(
+        self,
+        paquefile: str,
+        task: str,
+        execute: Callable[[List[Task]], None],
+        watcher: Optional[Any] = None,
+        quiet: float = 0.2,
+    ) -> None:
+        self._paquefile = os.path.abspath(paquefile)
+        self._task = task
+        self._execute = execute
+        self._watcher = watcher if watcher is not None else make_watcher()
+        self._quiet = quiet
+        self._parser = YAMLParser(paquefile, cache=False)
+        self._definitions = DefinitionCache()
+        self._tasks: Optional[Paquefile] = None
+        self._plan: List[Task] = []
+
+    def _load(self) -> Optional[List[Task]]:
+        """A new plan, if the paquefile can be loaded and planned"""
+        try:
+            with open(self._paquefile) as source:
+                changed = self._definitions.load(source.read())
+            logger.debug("Definitions changed: %s", sorted(changed))
+            tasks = self._parser._build_tasks(self._definitions.definitions)
+            self._tasks = Paquefile(
+                self._paquefile,
+                cache=False,
+                tasks=tasks,
+                includes=self._parser.includes,
+            )
+            return Planner(self._tasks).plan(self._task)
+        except (Exception, SystemExit) as exc:  # The planner exits on unknown tasks
+            logger.error("Can't plan %s, fix %s: %s", self._task, self._paquefile, exc)
+            return None
+
+    def _subscribe(self) -> None:
+        directories = {os.path.dirname(self._paquefile)}
+        if self._tasks is not None:  # Included paquefiles the plan reached
+            directories |= {os.path.dirname(path) for path in self._tasks.files()}
+        for task in self._plan:
+            for pattern in task.inputs or []:
+                directories |= _directories_for(pattern)
+        for directory in directories:
+            self._watcher.watch(directory)
+
+    def _run(self, tasks: List[Task]) -> None:
+        if len(tasks) == 0:
+            return
+        logger.info(">>> Running %s", [task.name for task in tasks])
+        try:
+            self._execute(tasks)
+        except Exception as exc:
+            logger.error("Run failed: %s", exc)
+
+    def start(self) -> None:
+        plan = self._load()
+        if plan is not None:
+            self._plan = plan
+        self._subscribe()
+        self._run(self._plan)
+
+    def step(self, changed: Set[str]) -> List[Task]:
+        """Handles a batch of changed paths, returning the tasks that ran"""
+        seeds: Set[str] = set()
+        if (
+            EVERYTHING in changed
+            or self._paquefile in changed
+            or (self._tasks is not None and self._tasks.changed())
+        ):
+            plan = self._load()
+            if plan is None:
+                return []
+            before = set(self._plan)
+            if EVERYTHING in changed:
+                seeds = {task.name for task in plan}
+            seeds |= {task.name for task in plan if task not in before}
+            self._plan = plan
+        seeds |= {task.name for task in self._plan if _matches(task.inputs, changed)}
+        affected = downstream(self._plan, seeds)
+        self._subscribe()
+        self._run(affected)
+        return affected
+
+    def _ignore_own_outputs(self, ran: List[Task]) -> Set[str]:
+        """Changes that happened while running, minus the outputs of the tasks
+that ran (which would otherwise trigger them again)"""
+        changed = self._watcher.changes(0)
+        return {
+            path
+            for path in changed
+            if not any(_matches(task.outputs, {path}) for task in ran)
+        }
+
+    def run(self) -> None:
+        """Runs until interrupted"""
+        self.start()
+        ran = self._plan
+        pending = self._ignore_own_outputs(ran)
+        try:
+            while True:
+                if len(pending) == 0:
+                    if len(ran) > 0:
+                        logger.info(">>> Watching for changes")
+                    pending = self._watcher.changes(None)
+                changed = pending | settle(self._watcher, self._quiet)
+                logger.debug("Changed: %s", sorted(changed))
+                ran = self.step(changed)
+                pending = self._ignore_own_outputs(ran)
+        finally:
+            self._watcher.close()
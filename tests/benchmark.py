@@ -0,0 +1,145 @@
+"""Times the parse, plan, dry run and run phases over synthetic paquefiles,
+emitting one JSON record per (shape, size, phase), to compare across commits:
+
+    python -m tests.benchmark --shapes wide,chain --sizes 100,1000 -o out.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from paque.executor import Executor
+from paque.parser import YAMLParser
+from paque.planner import Planner
+from tests.generators import SHAPES, dump
+
+PHASES = ["parse", "plan", "hash", "memory", "dry-run", "run"]
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _timed(function: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def bench(shape: str, size: int, phases: List[str], repeat: int = 1) -> List[Dict]:
+    """Every phase starts from a freshly parsed paquefile. Besides timing the
+phases, hash times putting every planned task in a set and looking it up, and
+memory records the bytes still allocated per planned task (its time is planning
+under tracemalloc)"""
+    target, tasks = SHAPES[shape](size)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "paquefile.yaml")
+        dump(tasks, path)
+
+        def parse():
+            return YAMLParser(path, cache=False).parse()
+
+        def plan():
+            return Planner(parse()).plan(target)
+
+        def hashing():
+            steps = plan()
+
+            def lookup():
+                seen = set(steps)
+                return all(step in seen for step in steps)
+
+            return lookup
+
+        retained: Dict[str, float] = {}
+
+        def memory():
+            tracemalloc.start()
+            try:
+                steps = plan()
+                allocated, _ = tracemalloc.get_traced_memory()
+                retained["bytes_per_task"] = allocated / len(steps)
+            finally:
+                tracemalloc.stop()
+
+        setups: Dict[str, Callable[[], Callable[[], Any]]] = {
+            "parse": lambda: parse,
+            "plan": lambda: Planner(parse()).plan,
+            "hash": hashing,
+            "memory": lambda: memory,
+            "dry-run": lambda: Executor(plan()).dry_run,
+            "run": lambda: Executor(plan()).run,
+        }
+        records = []
+        for phase in phases:
+            record: Dict[str, Any] = {"shape": shape, "size": size, "phase": phase}
+            try:
+                timings = []
+                for _ in range(repeat):
+                    function = setups[phase]()
+                    if phase == "plan":
+                        timings.append(_timed(lambda: function(target)))
+                    else:
+                        timings.append(_timed(function))
+                record["seconds"] = min(timings)
+                if phase == "memory":
+                    record.update(retained)
+            except Exception as exc:  # A failing phase is a result as well
+                record["seconds"] = None
+                record["error"] = repr(exc)
+            records.append(record)
+        return records
+
+
+def main(argv: List[str]) -> None:
+    arguments = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    arguments.add_argument("--shapes", default=",".join(SHAPES))
+    arguments.add_argument("--sizes", default="100,1000")
+    arguments.add_argument("--phases", default=",".join(PHASES))
+    arguments.add_argument("--repeat", type=int, default=3)
+    arguments.add_argument("-o", "--output", help="Defaults to stdout")
+    options = arguments.parse_args(argv)
+    logging.getLogger("paque").setLevel(logging.WARNING)
+    context = {"commit": _commit(), "python": platform.python_version()}
+    results = []
+    for shape in options.shapes.split(","):
+        for size in [int(size) for size in options.sizes.split(",")]:
+            for record in bench(shape, size, options.phases.split(","), options.repeat):
+                record.update(context)
+                results.append(record)
+                if record["seconds"] is None:
+                    outcome = record["error"]
+                else:
+                    outcome = "{:.4f}s".format(record["seconds"])
+                if "bytes_per_task" in record:
+                    outcome += " {:.0f} bytes/task".format(record["bytes_per_task"])
+                print(
+                    "{shape:>10} {size:>7} {phase:>8} ".format(**record) + outcome,
+                    file=sys.stderr,
+                )
+    output = json.dumps(results, indent=2)
+    if options.output is None:
+        print(output)
+    else:
+        with open(options.output, "w") as output_file:
+            output_file.write(output)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
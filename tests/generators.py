@@ -0,0 +1,96 @@
+"""Synthetic paquefiles of configurable shape and size, for benchmarks and
+scaling tests. Each generator returns the target task and the parsed YAML
+structure (what YAMLParser._build_tasks expects); dump writes it to a file.
+plan builds the plan of such a structure, as most tests need"""
+
+from typing import Any, Callable, Dict, List, Tuple
+
+import yaml
+from paque.parser import YAMLParser
+from paque.planner import Planner
+from paque.task import Task
+
+RawTasks = Dict[str, List[Dict[str, Any]]]
+
+NOOP = "true"
+
+
+def wide(size: int) -> Tuple[str, RawTasks]:
+    """One aggregate task depending on size independent ones, like precommit"""
+    tasks: RawTasks = {f"t{i}": [{"run": NOOP}] for i in range(size)}
+    tasks["all"] = [{"depends": [f"t{i}" for i in range(size)]}]
+    return "all", tasks
+
+
+def chain(size: int) -> Tuple[str, RawTasks]:
+    """t0 depends on t1, which depends on t2... down to t{size - 1}"""
+    tasks: RawTasks = {
+        f"t{i}": [{"run": NOOP}, {"depends": [f"t{i + 1}"]}] for i in range(size - 1)
+    }
+    tasks[f"t{size - 1}"] = [{"run": NOOP}]
+    return "t0", tasks
+
+
+def diamonds(size: int) -> Tuple[str, RawTasks]:
+    """A chain of diamonds: top{i} depends on left{i} and right{i}, which both
+depend on top{i + 1}. Around size tasks in total"""
+    count = max(size // 3, 1)
+    tasks: RawTasks = {}
+    for i in range(count):
+        below = [{"depends": [f"top{i + 1}"]}] if i < count - 1 else []
+        tasks[f"top{i}"] = [{"run": NOOP}, {"depends": [f"left{i}", f"right{i}"]}]
+        tasks[f"left{i}"] = [{"run": NOOP}] + below
+        tasks[f"right{i}"] = [{"run": NOOP}] + below
+    return "top0", tasks
+
+
+def arguments(size: int) -> Tuple[str, RawTasks]:
+    """One aggregate task depending on size instances of a template, each with
+different arguments (taskname folder:/x something:y)"""
+    tasks: RawTasks = {
+        "template": [
+            {"run": "true {folder} {something}"},
+            {"message": "Doing {something} on {folder}"},
+        ],
+        "all": [
+            {"depends": [f"template folder:/x{i} something:y{i}" for i in range(size)]}
+        ],
+    }
+    return "all", tasks
+
+
+# One task of a paquefile written as text, with every section the parser has to
+# handle, for parsing and caching benchmarks
+TASK = """task{i}:
+  - run:
+      - "echo {{arg}} {i}"
+      - "echo done"
+  - message: "Running task {i}"
+  - condition: "test -d /tmp"
+  - inputs: "src/{i}/*.py"
+  - depends:
+      - task{j} arg:value{i}
+"""
+
+
+def text(size: int) -> str:
+    """size tasks like TASK, each depending on the next one"""
+    return "".join(TASK.format(i=i, j=i + 1) for i in range(size))
+
+
+SHAPES: Dict[str, Callable[[int], Tuple[str, RawTasks]]] = {
+    "wide": wide,
+    "chain": chain,
+    "diamonds": diamonds,
+    "arguments": arguments,
+}
+
+
+def dump(tasks: RawTasks, path: str) -> None:
+    dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+    with open(path, "w") as paquefile:
+        yaml.dump(tasks, paquefile, Dumper=dumper, sort_keys=False)
+
+
+def plan(tasks: RawTasks, target: str) -> List[Task]:
+    return Planner(YAMLParser("none")._build_tasks(tasks)).plan(target)
@@ -0,0 +1,109 @@
+import os
+
+from paque.artifacts import DEFAULT_MAX_BYTES, ArtifactStore
+from paque.executor import Executor
+from paque.fingerprint import FingerprintStore
+from paque.paque import paque
+from paque.task import Task
+
+PAQUEFILE = """build:
+  - run: echo built >> log; cp input output
+  - inputs:
+      - input
+  - outputs:
+      - output
+"""
+
+
+def _output_task(name, folder):
+    return Task(name, outputs=[str(folder / f"{name}.out")])
+
+
+def test_outputs_are_saved_and_restored(tmp_path):
+    store = ArtifactStore(str(tmp_path / "store"))
+    output = tmp_path / "out" / "result"
+    output.parent.mkdir()
+    output.write_text("result")
+    os.chmod(output, 0o755)
+    task = Task("build", outputs=[str(output)])
+    assert not store.restore(task, "abc")
+    store.save(task, "abc")
+    output.unlink()
+    output.parent.rmdir()
+    assert store.restore(task, "abc")
+    assert output.read_text() == "result"
+    assert os.stat(output).st_mode & 0o777 == 0o755
+    assert store.stats()["objects"] == 1
+
+
+def test_identical_outputs_are_stored_once(tmp_path):
+    store = ArtifactStore(str(tmp_path / "store"))
+    for name in ["a", "b"]:
+        task = _output_task(name, tmp_path)
+        (tmp_path / f"{name}.out").write_text("same")
+        store.save(task, name)
+    stats = store.stats()
+    assert (stats["entries"], stats["objects"], stats["bytes"]) == (2, 1, 4)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    store = ArtifactStore(str(tmp_path / "store"), max_bytes=20)
+    tasks = {name: _output_task(name, tmp_path) for name in ["a", "b", "c"]}
+    for age, (name, task) in enumerate(tasks.items()):
+        (tmp_path / f"{name}.out").write_text(name * 10)
+        store.save(task, name)
+        entry = tmp_path / "store" / "entries" / f"{name}.json"
+        os.utime(entry, (1000 + age, 1000 + age))
+    assert store.restore(tasks["a"], "a")  # Now the most recently used
+    assert store.prune() == (1, 10)
+    assert not store.restore(tasks["b"], "b")
+    assert store.restore(tasks["c"], "c")
+    assert store.stats()["bytes"] == 20
+
+
+def test_matching_runs_are_restored_instead_of_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = ArtifactStore(str(tmp_path / "store"))
+    task = Task(
+        "build",
+        run="echo built >> log; cp input output",
+        inputs=["input"],
+        outputs=["output"],
+    )
+
+    def run(content):
+        (tmp_path / "input").write_text(content)
+        fingerprints = FingerprintStore(str(tmp_path / "fingerprints.json"))
+        Executor([task], fingerprints=fingerprints, artifacts=store).run()
+
+    run("first")
+    run("second")
+    run("first")  # As when switching back to a branch
+    assert (tmp_path / "output").read_text() == "first"
+    assert (tmp_path / "log").read_text() == "built\nbuilt\n"
+
+
+def test_cli(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "paquefile").write_text(PAQUEFILE)
+    (tmp_path / "input").write_text("data")
+    paque(["--artifacts", "store", "build"], standalone_mode=False)
+    (tmp_path / "output").unlink()
+    paque(["--artifacts", "store", "build"], standalone_mode=False)
+    assert (tmp_path / "output").read_text() == "data"
+    assert (tmp_path / "log").read_text() == "built\n"
+    capsys.readouterr()
+    paque(
+        ["--artifacts", "store", "--artifacts-prune", "--artifacts-max-bytes", "0"],
+        standalone_mode=False,
+    )
+    printed = capsys.readouterr().out
+    assert "Evicted 1 entries, removed 4 bytes" in printed
+    assert "entries: 0" in printed
+
+
+def test_cli_default_size_is_the_store_default():
+    (option,) = [
+        param for param in paque.params if param.name == "artifacts_max_bytes"
+    ]
+    assert option.default == DEFAULT_MAX_BYTES
@@ -0,0 +1,69 @@
+import asyncio
+import io
+import os
+import subprocess
+import time
+
+import pytest
+from paque.async_executor import AsyncExecutor
+from tests import generators
+
+
+def _executor(tasks, target, jobs):
+    executor = AsyncExecutor(generators.plan(tasks, target), jobs=jobs)
+    executor._stdout = io.BytesIO()
+    executor._stderr = io.BytesIO()
+    return executor
+
+
+def _alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            return stat.read().split(")")[-1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_output_is_prefixed_with_the_task_name():
+    tasks = {
+        "A": [{"run": "echo one; echo two >&2; printf three"}],
+        "B": [{"run": "echo four"}, {"depends": ["A"]}],
+    }
+    executor = _executor(tasks, "B", jobs=2)
+    executor.run()
+    assert executor._stdout.getvalue() == b"[A] one\n[A] three\n[B] four\n"
+    assert executor._stderr.getvalue() == b"[A] two\n"
+
+
+def test_many_children_run_concurrently():
+    tasks = {f"t{i}": [{"run": "sleep 0.5"}] for i in range(50)}
+    tasks["all"] = [{"depends": [f"t{i}" for i in range(50)]}]
+    start = time.monotonic()
+    _executor(tasks, "all", jobs=50).run()
+    assert time.monotonic() - start < 2
+
+
+def test_false_conditions_skip_and_failures_raise(tmp_path):
+    tasks = {
+        "skipped": [{"run": f"touch {tmp_path / 'ran'}"}, {"condition": "false"}],
+        "fails": [{"run": "exit 2"}, {"depends": ["skipped"]}],
+    }
+    with pytest.raises(subprocess.CalledProcessError):
+        _executor(tasks, "fails", jobs=1).run()
+    assert not (tmp_path / "ran").exists()
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="Needs /proc")
+def test_cancelling_kills_the_process_group(tmp_path):
+    pidfile = tmp_path / "pid"
+    tasks = {"A": [{"run": f"sleep 30 & echo $! > {pidfile}; wait"}]}
+    executor = _executor(tasks, "A", jobs=1)
+
+    async def cancelled():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(executor._schedule(), 0.5)
+
+    asyncio.run(cancelled())
+    pid = int(pidfile.read_text())
+    time.sleep(0.1)
+    assert not _alive(pid)
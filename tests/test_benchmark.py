@@ -0,0 +1,21 @@
+import pytest
+from paque.parser import YAMLParser
+from paque.planner import Planner
+from tests import benchmark, generators
+
+
+@pytest.mark.parametrize(
+    "shape,planned", [("wide", 11), ("chain", 10), ("diamonds", 9)]
+)
+def test_generated_paquefiles_plan(tmp_path, shape, planned):
+    target, tasks = generators.SHAPES[shape](10)
+    path = str(tmp_path / "paquefile.yaml")
+    generators.dump(tasks, path)
+    plan = Planner(YAMLParser(path, cache=False).parse()).plan(target)
+    assert len(plan) == planned
+
+
+def test_benchmark_records_every_phase():
+    records = benchmark.bench("diamonds", 6, benchmark.PHASES)
+    assert [record["phase"] for record in records] == benchmark.PHASES
+    assert all(record["seconds"] is not None for record in records)
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import click
+import pytest
+from paque import client
+from paque.daemon import Daemon
+from paque.paque import paque
+from paque.planner import Planner
+
+PAQUEFILE = """build:
+  - run: echo built
+  - depends:
+      - prepare
+prepare:
+  - run: echo prepared
+fails:
+  - run: exit 3
+"""
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "paquefile").write_text(PAQUEFILE)
+    server = Daemon()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    path = tmp_path / ".paque" / "daemon.sock"
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return server
+
+
+def test_requests_are_served(daemon, capfdbinary):
+    assert client.main(["--list"]) == 0
+    assert capfdbinary.readouterr().out == b"build\nprepare\nfails\n"
+    assert client.main(["build"]) == 0
+    assert capfdbinary.readouterr().out == b"prepared\nbuilt\n"
+    assert client.main(["fails"]) == 1
+    assert b"returned non-zero exit status 3" in capfdbinary.readouterr().err
+
+
+def test_plans_are_kept_until_the_paquefile_changes(daemon, tmp_path, monkeypatch):
+    plans = []
+    plan = Planner.plan
+    monkeypatch.setattr(
+        Planner, "plan", lambda self, task: plans.append(task) or plan(self, task)
+    )
+    assert client.main(["--dry-run", "build"]) == 0
+    assert client.main(["build"]) == 0
+    assert plans == ["build"]
+    (tmp_path / "paquefile").write_text(PAQUEFILE.replace("built", "rebuilt"))
+    assert client.main(["build"]) == 0
+    assert plans == ["build", "build"]
+
+
+def test_no_daemon(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert client.main(["build"]) == 2
+
+
+def test_run_options_are_refused(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(click.UsageError, match="--async, --keep-going"):
+        paque(["--daemon", "--async", "--keep-going"], standalone_mode=False)
@@ -0,0 +1,162 @@
+import io
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+from paque.distributed import Coordinator, Worker, parse_address
+from paque.planner import Planner
+from paque.probe import Probe
+from paque.task import Task
+
+
+def _plan(tasks, name):
+    return Planner({task.name: task for task in tasks}).plan(name)
+
+
+def _workers(address, count):
+    threads = [
+        threading.Thread(
+            target=Worker(
+                address, slots=2, name=f"w{index}", heartbeat_interval=0.05
+            ).run,
+            daemon=True,
+        )
+        for index in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+class _Coordinator(Coordinator):
+    """Remembers the workers that said hello. Others may still be trying to
+connect when the plan is done, and are never told to shut down"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.joined = set()
+
+    def _handle(self, worker, message):
+        super()._handle(worker, message)
+        if message.get("type") == "hello":
+            self.joined.add(worker.name)
+
+
+def test_parse_address():
+    assert parse_address("unix:/tmp/paque.sock") == (socket.AF_UNIX, "/tmp/paque.sock")
+    assert parse_address("./paque.sock") == (socket.AF_UNIX, "./paque.sock")
+    assert parse_address("localhost:8123") == (socket.AF_INET, ("localhost", 8123))
+    with pytest.raises(Exception):
+        parse_address("localhost")
+
+
+def test_tasks_are_sent_as_plain_data():
+    task = Task(
+        "A",
+        run="echo A",
+        depends=["B"],
+        inputs=["a.txt"],
+        wait_until=Probe("true", timeout=1.0),
+    )
+    assert Task.from_dict(json.loads(json.dumps(task.to_dict()))) == task
+
+
+def test_plan_runs_on_workers_in_order(tmp_path):
+    address = f"unix:{tmp_path / 'coordinator.sock'}"
+    log = tmp_path / "log"
+    tasks = [
+        Task("A", run=f"echo A >> {log}"),
+        Task("B", run=f"echo B >> {log}; echo from B", depends=["A"]),
+        Task("C", run=f"echo C >> {log}", depends=["A"]),
+        Task("D", run=f"echo D >> {log}", depends=["B", "C"]),
+    ]
+    output = io.BytesIO()
+    threads = _workers(address, 2)
+    coordinator = _Coordinator(_plan(tasks, "D"), address, output=output)
+    coordinator.run()
+    order = log.read_text().split()
+    assert order[0] == "A" and order[-1] == "D" and sorted(order) == list("ABCD")
+    assert output.getvalue() == b"[B] from B\n"
+    assert len(coordinator.joined) > 0
+    for index, thread in enumerate(threads):
+        if f"w{index}" in coordinator.joined:
+            thread.join(timeout=5)  # Told to shut down
+            assert not thread.is_alive()
+
+
+def test_failures_are_reported(tmp_path):
+    address = f"unix:{tmp_path / 'coordinator.sock'}"
+    tasks = [Task("A", run="exit 3"), Task("B", run="echo B", depends=["A"])]
+    (worker,) = _workers(address, 1)
+    with pytest.raises(Exception, match="Task A failed on w0"):
+        Coordinator(_plan(tasks, "B"), address, output=io.BytesIO()).run()
+    worker.join(timeout=5)  # Told to shut down
+    assert not worker.is_alive()
+
+
+def _unreliable_worker(address, silent):
+    """Takes a task and then either goes away or stops answering"""
+    _, path = parse_address(address)
+    deadline = time.monotonic() + 5
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    while True:
+        try:
+            connection.connect(path)
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+    connection.sendall(b'{"type": "hello", "name": "unreliable", "slots": 1}\n')
+    connection.recv(1 << 16)
+    if silent:
+        time.sleep(1)
+    connection.close()
+
+
+@pytest.mark.parametrize("silent", [False, True])
+def test_tasks_of_lost_workers_run_again(tmp_path, silent):
+    address = f"unix:{tmp_path / 'coordinator.sock'}"
+    log = tmp_path / "log"
+    tasks = [Task("A", run=f"echo A >> {log}")]
+    unreliable = threading.Thread(target=_unreliable_worker, args=(address, silent))
+    unreliable.start()
+    coordinator = Coordinator(
+        _plan(tasks, "A"), address, heartbeat_timeout=0.3, output=io.BytesIO()
+    )
+    coordinator_thread = threading.Thread(target=coordinator.run)
+    coordinator_thread.start()
+    while unreliable.is_alive() and len(coordinator._workers) == 0:
+        time.sleep(0.01)
+    time.sleep(0.1)  # The unreliable worker takes A before any other joins
+    _workers(address, 1)
+    coordinator_thread.join(timeout=5)
+    unreliable.join()
+    assert log.read_text() == "A\n"
+
+
+def test_tasks_are_killed_when_the_coordinator_goes_away(tmp_path):
+    path = str(tmp_path / "coordinator.sock")
+    started = tmp_path / "started"
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    worker = threading.Thread(target=Worker(f"unix:{path}", name="w0").run)
+    worker.start()
+    connection, _ = server.accept()
+    task = Task("slow", run=f"echo $$ > {started}; sleep 30")
+    message = {"type": "run", "id": 0, "task": task.to_dict()}
+    connection.sendall(json.dumps(message).encode("utf-8") + b"\n")
+    deadline = time.monotonic() + 5
+    while not started.exists() or started.stat().st_size == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    connection.close()
+    server.close()
+    worker.join(timeout=5)
+    assert not worker.is_alive()
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(started.read_text()), 0)
@@ -0,0 +1,42 @@
+import subprocess
+import time
+
+import pytest
+from paque.executor import Executor
+from tests import generators
+
+
+def test_independent_tasks_run_concurrently():
+    tasks = {
+        "A": [{"run": "sleep 0.3"}],
+        "B": [{"run": "sleep 0.3"}],
+        "C": [{"run": "sleep 0.3"}],
+        "all": [{"depends": ["A", "B", "C"]}],
+    }
+    start = time.monotonic()
+    Executor(generators.plan(tasks, "all"), jobs=3).run()
+    assert time.monotonic() - start < 0.8
+
+
+def test_dependencies_finish_before_dependents(tmp_path):
+    log = tmp_path / "log"
+    tasks = {
+        "slow": [{"run": f"sleep 0.2 && echo slow >> {log}"}],
+        "fast": [{"run": f"echo fast >> {log}"}],
+        "last": [{"run": f"echo last >> {log}"}, {"depends": ["slow", "fast"]}],
+    }
+    Executor(generators.plan(tasks, "last"), jobs=4).run()
+    assert log.read_text().split() == ["fast", "slow", "last"]
+
+
+def test_failure_drains_running_tasks_and_stops(tmp_path):
+    tasks = {
+        "fails": [{"run": "exit 3"}],
+        "slow": [{"run": f"sleep 0.3 && touch {tmp_path / 'slow'}"}],
+        "after": [{"run": f"touch {tmp_path / 'after'}"}, {"depends": ["fails"]}],
+        "all": [{"depends": ["after", "slow"]}],
+    }
+    with pytest.raises(subprocess.CalledProcessError):
+        Executor(generators.plan(tasks, "all"), jobs=2).run()
+    assert (tmp_path / "slow").exists()
+    assert not (tmp_path / "after").exists()
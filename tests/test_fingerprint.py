@@ -0,0 +1,88 @@
+import os
+
+import pytest
+from paque.async_executor import AsyncExecutor
+from paque.executor import Executor
+from paque.fingerprint import FingerprintStore
+from paque.parser import YAMLParser
+from paque.planner import Planner
+
+TASKS = {
+    "compile": [
+        {"run": "cat src/*.txt > build.out && echo compile >> log"},
+        {"inputs": "src/*.txt"},
+        {"outputs": "build.out"},
+    ],
+    "package": [
+        {"run": "cp build.out package.out && echo package >> log"},
+        {"inputs": ["build.out"]},
+        {"outputs": ["package.out"]},
+        {"depends": ["compile"]},
+    ],
+}
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.txt").write_text("a")
+    return tmp_path
+
+
+def _run(force=False):
+    plan = Planner(YAMLParser("none")._build_tasks(TASKS)).plan("package")
+    Executor(plan, fingerprints=FingerprintStore(force=force)).run()
+
+
+def _log(workdir):
+    return (workdir / "log").read_text().split()
+
+
+def test_up_to_date_tasks_are_skipped(workdir):
+    _run()
+    _run()
+    assert _log(workdir) == ["compile", "package"]
+
+
+def test_changed_inputs_invalidate_downstream(workdir):
+    _run()
+    (workdir / "src" / "a.txt").write_text("changed")
+    _run()
+    assert _log(workdir) == ["compile", "package"] * 2
+
+
+def test_missing_outputs_and_force_rerun(workdir):
+    _run()
+    os.remove(workdir / "package.out")
+    _run()
+    _run(force=True)
+    assert _log(workdir) == ["compile", "package", "package", "compile", "package"]
+
+
+@pytest.mark.parametrize("engine", [Executor, AsyncExecutor])
+def test_tasks_skipped_by_their_condition_are_not_recorded(workdir, engine):
+    tasks = {
+        "build": [
+            {"run": "echo build >> log"},
+            {"condition": "test -f go"},
+            {"inputs": ["src/a.txt"]},
+        ]
+    }
+    plan = Planner(YAMLParser("none")._build_tasks(tasks)).plan("build")
+    engine(plan, fingerprints=FingerprintStore()).run()
+    assert not (workdir / "log").exists()
+    (workdir / "go").touch()
+    engine(plan, fingerprints=FingerprintStore()).run()
+    engine(plan, fingerprints=FingerprintStore()).run()
+    assert _log(workdir) == ["build"]
+
+
+def test_unchanged_stat_skips_rehashing(workdir):
+    source = workdir / "src" / "a.txt"
+    store = FingerprintStore()
+    digest = store._file_digest(str(source))
+    stat = os.stat(source)
+    source.write_text("b")
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert store._file_digest(str(source)) == digest
@@ -0,0 +1,64 @@
+import logging
+
+import pytest
+from paque.executor import Executor
+from paque.history import History
+from paque.scheduler import Scheduler
+from paque.task import Task
+
+
+def _lopsided():
+    """A short task first in plan order, and a long chain that should start first"""
+    short = Task("short")
+    first = Task("first")
+    second = Task("second", depends=["first"])
+    return [short, first, second, Task("all", depends=["short", "second"])]
+
+
+def test_durations_are_averaged_and_kept(tmp_path):
+    path = str(tmp_path / "history.json")
+    history = History(path)
+    task = Task("build b:2 a:1")
+    history.record(task, 10.0)
+    history.record(task, 20.0)
+    assert history.estimate(task) == pytest.approx(13.0)
+    history.save()
+    assert History(path).estimate(Task("build a:1 b:2")) == pytest.approx(13.0)
+
+
+def test_remaining_time_follows_the_longest_path(tmp_path):
+    plan = _lopsided()
+    history = History(str(tmp_path / "history.json"))
+    assert history.estimates(plan) is None
+    for name, duration in [("short", 1.0), ("first", 3.0), ("second", 3.0)]:
+        history.record(Task(name), duration)
+    estimates = history.estimates(plan)
+    assert estimates[Task.key_of("all")] == pytest.approx(7 / 3)  # The average
+    remaining = History.remaining(plan, estimates)
+    assert remaining[Task.key_of("first")] == pytest.approx(3 + 3 + 7 / 3)
+    assert remaining[Task.key_of("short")] == pytest.approx(1 + 7 / 3)
+    assert History.predict(estimates, remaining, jobs=1) == pytest.approx(7 + 7 / 3)
+    assert History.predict(estimates, remaining, jobs=4) == pytest.approx(6 + 7 / 3)
+
+
+def test_scheduler_starts_the_longest_path_first():
+    plan = _lopsided()
+    priorities = {Task.key_of("first"): 6.0, Task.key_of("short"): 1.0}
+    scheduler = Scheduler(plan, priorities)
+    assert [scheduler.pop_ready().name, scheduler.pop_ready().name] == [
+        "first",
+        "short",
+    ]
+
+
+def test_executor_records_and_estimates(tmp_path, caplog):
+    path = str(tmp_path / "history.json")
+    plan = [Task("A", run="true"), Task("B", run="true", depends=["A"])]
+    Executor(plan, jobs=2, history=History(path)).run()
+    history = History(path)
+    assert history.estimate(plan[0]) is not None
+    assert history.estimate(plan[1]) is not None
+    with caplog.at_level(logging.INFO, logger="paque"):
+        Executor(plan, jobs=2, history=history).run()
+    assert "Estimated time" in caplog.text
+    assert "estimated" in caplog.text
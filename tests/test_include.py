@@ -0,0 +1,127 @@
+import os
+
+import pytest
+from paque.parser import Paquefile, YAMLParser
+from paque.planner import Planner
+
+ROOT = """include:
+  svc: services/svc/paquefile
+  broken: services/broken/paquefile
+all:
+  - depends:
+      - svc:deploy env:test
+"""
+
+SERVICE = """include:
+  lib: ../../lib/paquefile
+build:
+  - run: make
+  - depends:
+      - lib:compile
+deploy:
+  - run: deploy {env}
+  - depends:
+      - build
+"""
+
+LIBRARY = """compile:
+  - run: cc lib.c
+"""
+
+
+@pytest.fixture
+def paquefiles(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for path, contents in [
+        ("paquefile", ROOT),
+        ("services/svc/paquefile", SERVICE),
+        ("services/broken/paquefile", "broken: [: not yaml"),
+        ("lib/paquefile", LIBRARY),
+    ]:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as paquefile:
+            paquefile.write(contents)
+    return tmp_path
+
+
+def test_namespaced_tasks_are_planned(paquefiles):
+    plan = Planner(Paquefile("paquefile")).plan("all")
+    assert [task.name for task in plan] == [
+        "svc:lib:compile env:test",
+        "svc:build env:test",
+        "svc:deploy env:test",
+        "all",
+    ]
+    assert plan[2].run == "deploy test"
+    assert plan[2].depends == ("svc:build env:test",)
+
+
+def test_namespaced_matrices_are_planned(paquefiles):
+    with open("services/svc/paquefile", "a") as service:
+        service.write("all:\n  - matrix:\n      task: build\n      env: [a, b]\n")
+    with open("paquefile", "a") as root:
+        root.write("top:\n  - depends:\n      - svc:all\n")
+    plan = Planner(Paquefile("paquefile")).plan("top")
+    assert [task.name for task in plan] == [
+        "svc:lib:compile env:a",
+        "svc:build env:a",
+        "svc:lib:compile env:b",
+        "svc:build env:b",
+        "svc:all",
+        "top",
+    ]
+
+
+def test_only_reached_files_are_parsed(paquefiles, monkeypatch):
+    parsed = []
+    parse = YAMLParser.parse
+    monkeypatch.setattr(
+        YAMLParser, "parse", lambda self: parsed.append(self.filename) or parse(self)
+    )
+    tasks = Paquefile("paquefile", cache=False)
+    Planner(tasks).plan("svc:build")
+    assert parsed == ["paquefile", "services/svc/paquefile", "lib/paquefile"]
+    with pytest.raises(Exception, match="Could not load"):
+        tasks["broken:anything"]
+
+
+def test_listing_uses_the_cached_index(paquefiles, monkeypatch):
+    with open("services/broken/paquefile", "w") as broken:
+        broken.write("fixed:\n  - run: echo fixed\n")
+    names = list(Paquefile("paquefile"))
+    assert names == [
+        "all",
+        "svc:build",
+        "svc:deploy",
+        "svc:lib:compile",
+        "broken:fixed",
+    ]
+
+    def fail(self):
+        raise AssertionError(f"{self.filename} parsed again")
+
+    tasks = Paquefile("paquefile")
+    monkeypatch.setattr(YAMLParser, "parse", fail)
+    assert list(tasks) == names
+
+
+def test_changes_to_loaded_includes_are_noticed(paquefiles):
+    tasks = Paquefile("paquefile")
+    tasks["svc:build"]
+    assert not tasks.changed()
+    with open("lib/paquefile", "a") as library:
+        library.write("link:\n  - run: ld\n")
+    assert not tasks.changed()  # Not loaded yet, nothing to notice
+    tasks["svc:lib:compile"]
+    with open("services/svc/paquefile", "a") as service:
+        service.write("test:\n  - run: make test\n")
+    assert tasks.changed()
+
+
+def test_invalid_includes(paquefiles):
+    with pytest.raises(Exception, match="can't contain"):
+        YAMLParser("paquefile")._build_tasks({"include": {"a:b": "x"}})
+    with open("paquefile", "w") as root:
+        root.write("include:\n  gone: nowhere/paquefile\n")
+    with pytest.raises(Exception, match="not found"):
+        Paquefile("paquefile")["gone:build"]
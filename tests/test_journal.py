@@ -0,0 +1,107 @@
+import json
+
+import pytest
+from paque.async_executor import AsyncExecutor
+from paque.executor import Executor
+from paque.journal import Journal
+from paque.paque import paque
+from paque.task import Task
+
+PAQUEFILE = """first:
+  - run: echo first >> log
+second:
+  - run: echo second >> log; test -f fixed
+  - depends:
+      - first
+all:
+  - depends:
+      - second
+"""
+
+
+def _entries(path):
+    with open(path) as journal:
+        return [json.loads(line) for line in journal]
+
+
+def test_finished_tasks_are_recorded(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = Journal(path)
+    task = Task("build", run="make")
+    journal.started(task)
+    journal.finished(task)
+    journal.finished(Task("test"), Exception("broken"))
+    journal.close(False)
+    events = [(entry["event"], entry.get("status")) for entry in _entries(path)]
+    assert events == [
+        ("begin", None),
+        ("start", None),
+        ("finish", "ok"),
+        ("finish", "failed"),
+        ("end", "failed"),
+    ]
+    resumed = Journal(path, resume=True)
+    assert resumed.completed(task)
+    assert not resumed.completed(Task("test"))
+    assert not resumed.completed(Task("build", run="make all"))  # Changed since
+
+
+def test_torn_lines_and_successful_runs(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = Journal(str(path))
+    journal.finished(Task("build"))
+    journal.close(True)
+    assert not Journal(str(path), resume=True).completed(Task("build"))
+    journal = Journal(str(path))
+    journal.finished(Task("build"))
+    journal.close(False)
+    with open(path, "a") as torn:
+        torn.write('{"event": "fini')
+    assert Journal(str(path), resume=True).completed(Task("build"))
+
+
+def test_earlier_runs_are_kept_but_not_resumed(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = Journal(str(path))
+    journal.finished(Task("build"))
+    journal.close(False)
+    Journal(str(path)).close(False)
+    assert not Journal(str(path), resume=True).completed(Task("build"))
+    events = [entry["event"] for entry in _entries(path)]
+    assert events == ["begin", "finish", "end", "begin", "end"]
+
+
+@pytest.mark.parametrize(
+    "engine,jobs", [(Executor, 1), (Executor, 3), (AsyncExecutor, 3)]
+)
+def test_keep_going(tmp_path, engine, jobs):
+    log = tmp_path / "log"
+    plan = [
+        Task("broken", run="false"),
+        Task("blocked", run=f"echo blocked >> {log}", depends=["broken"]),
+        Task("other", run=f"echo other >> {log}"),
+        Task("later", run=f"echo later >> {log}", depends=["blocked"]),
+    ]
+    with pytest.raises(Exception, match="1 task.s. failed: broken"):
+        engine(plan, jobs=jobs, keep_going=True).run()
+    assert log.read_text() == "other\n"
+
+
+def test_without_keep_going_the_failure_is_raised(tmp_path):
+    import subprocess
+
+    plan = [Task("broken", run="false"), Task("other", run="true")]
+    with pytest.raises(subprocess.CalledProcessError):
+        Executor(plan).run()
+
+
+def test_cli_resumes_a_failed_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "paquefile").write_text(PAQUEFILE)
+    paque(["all"], standalone_mode=False)
+    assert (tmp_path / "log").read_text() == "first\nsecond\n"
+    (tmp_path / "fixed").write_text("")
+    paque(["--resume", "all"], standalone_mode=False)
+    assert (tmp_path / "log").read_text() == "first\nsecond\nsecond\n"
+    paque(["--resume", "all"], standalone_mode=False)  # Nothing left to resume
+    assert (tmp_path / "log").read_text().count("first") == 2
@@ -0,0 +1,143 @@
+import json
+
+import pytest
+from paque.executor import Executor
+from paque.matrix import Axis, Matrix
+from paque.parser import YAMLParser
+from paque.planner import Planner
+from paque.task import Task
+
+
+def _tasks(definitions):
+    return YAMLParser("none")._build_tasks(definitions)
+
+
+def test_matrix_section():
+    tasks = _tasks(
+        {
+            "all": [
+                {
+                    "matrix": {
+                        "task": "process",
+                        "folder": ["/x", "with space", 3],
+                        "mode": {"command": "ls"},
+                    }
+                }
+            ]
+        }
+    )
+    assert tasks["all"].matrix == (
+        Matrix(
+            "process",
+            (
+                Axis("folder", values=("/x", "with space", "3")),
+                Axis("mode", command="ls"),
+            ),
+        ),
+    )
+
+
+@pytest.mark.parametrize(
+    "matrix,error",
+    [
+        ({"folder": ["a"]}, "which task to depend on"),
+        ({"task": "p"}, "at least one argument"),
+        ({"task": "p", "folder": "a"}, "folder should be a list of values"),
+        ({"task": "p", "folder": {"cmd": "ls"}}, "folder should be a list of values"),
+    ],
+)
+def test_invalid_matrix(matrix, error):
+    with pytest.raises(Exception, match=error):
+        _tasks({"all": [{"matrix": matrix}]})
+
+
+def test_product_of_values_and_commands():
+    tasks = _tasks(
+        {
+            "process": [{"run": "process {folder!q} {mode}"}],
+            "all": [
+                {
+                    "matrix": {
+                        "task": "process",
+                        "folder": ["a b", "c"],
+                        "mode": {"command": "printf 'fast\\n\\nslow\\n'"},
+                    }
+                }
+            ],
+        }
+    )
+    plan = Planner(tasks).plan("all")
+    assert [task.run for task in plan] == [
+        "process 'a b' fast",
+        "process 'a b' slow",
+        "process c fast",
+        "process c slow",
+        None,
+    ]
+    assert plan[0].name == "process 'folder:a b' mode:fast"
+    assert plan[0].key == ("process", ("folder:a b", "mode:fast"))
+    assert plan[-1].depends is None
+    assert set(plan[-1].dependency_keys) == {task.key for task in plan[:-1]}
+
+
+def test_values_use_the_arguments_of_the_task():
+    tasks = _tasks(
+        {
+            "process": [{"run": "process {folder} for {env}"}],
+            "all": [{"matrix": {"task": "process", "folder": ["{env}/a", "{env}/b"]}}],
+            "release": [{"depends": ["all env:prod"]}],
+        }
+    )
+    plan = Planner(tasks).plan("release")
+    assert [task.run for task in plan[:2]] == [
+        "process prod/a for prod",
+        "process prod/b for prod",
+    ]
+
+
+def test_instances_are_generated_as_needed():
+    values = tuple(str(value) for value in range(500))
+    matrix = Matrix("process", (Axis("value", values=values),))
+    instances = matrix.instances()
+    assert next(instances) == ("process", ["value:0"])
+    assert matrix.size() == 500
+    tasks = {
+        "process": Task("process", run="true {value}"),
+        "all": Task("all", matrix=[matrix]),
+    }
+    plan = Planner(tasks).plan("all")
+    assert len(plan) == 501
+
+
+def test_dependents_wait_for_every_instance(tmp_path):
+    log = tmp_path / "log"
+    tasks = _tasks(
+        {
+            "process": [{"run": f"sleep 0.0{{value}}; echo {{value}} >> {log}"}],
+            "all": [
+                {"run": f"echo all >> {log}"},
+                {"matrix": {"task": "process", "value": [3, 1, 2]}},
+            ],
+        }
+    )
+    Executor(Planner(tasks).plan("all"), jobs=4).run()
+    lines = log.read_text().split()
+    assert sorted(lines[:3]) == ["1", "2", "3"]
+    assert lines[3] == "all"
+
+
+def test_quoted_names():
+    assert Task.key_of("process 'folder:a b' mode:x") == (
+        "process",
+        ("folder:a b", "mode:x"),
+    )
+    assert Task.key_of("say msg:it's") == ("say", ("msg:it's",))
+    assert Task._args_dict(["url:http://host"]) == {"url": "http://host"}
+
+
+def test_matrices_are_sent_as_plain_data():
+    task = Task(
+        "all",
+        matrix=[Matrix("process", (Axis("value", values=("a", "b")),), ("env:x",))],
+    )
+    assert Task.from_dict(json.loads(json.dumps(task.to_dict()))) == task
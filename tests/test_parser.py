@@ -1,3 +1,4 @@
+import pytest
 from paque.parser import YAMLParser
 from paque.task import Task
 
@@ -28,3 +29,16 @@ to just test it as part of the Planner tests, where it is used as well"""
         "A": task_a,
         "B": task_b,
     }
+
+
+@pytest.mark.parametrize(
+    "task_def,error",
+    [
+        ([{"run": "a"}, {"run": "b"}], "Duplicate section run in task A"),
+        ([{"runs": "a"}], "Unknown section runs in task A"),
+        ({"run": "a"}, "Task A should be a list of sections"),
+    ],
+)
+def test_reports_malformed_sections(task_def, error):
+    with pytest.raises(Exception, match=error):
+        YAMLParser("none")._build_tasks({"A": task_def})
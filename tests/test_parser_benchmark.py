@@ -0,0 +1,36 @@
+import time
+
+import pytest
+import yaml
+from paque import parser
+from paque.parser import YAMLParser
+from tests import generators
+
+
+def _best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+@pytest.mark.skipif(
+    parser.SafeLoader is yaml.SafeLoader, reason="PyYAML built without libyaml"
+)
+def test_benchmark_parse(tmp_path):
+    path = tmp_path / "paquefile.yaml"
+    path.write_text(generators.text(1000))
+    content = path.read_bytes()
+    yaml_parser = YAMLParser(str(path), cache=False)
+
+    pure_python = _best_of(
+        2, lambda: yaml_parser._build_tasks(yaml.load(content, Loader=yaml.SafeLoader))
+    )
+    libyaml = _best_of(2, yaml_parser.parse)
+    print(
+        f"\npure python loader: {pure_python * 1000:.1f}ms, "
+        f"parse: {libyaml * 1000:.1f}ms ({pure_python / libyaml:.1f}x)"
+    )
+    assert libyaml * 3 < pure_python
@@ -0,0 +1,48 @@
+import os
+import time
+
+import pytest
+from paque.parser import YAMLParser
+from tests import generators
+
+
+@pytest.fixture
+def paquefile(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "paquefile.yaml"
+    path.write_text(generators.text(1000))
+    return str(path)
+
+
+def test_cached_parse_is_the_same_as_a_fresh_one(paquefile):
+    assert YAMLParser(paquefile).parse() == YAMLParser(paquefile).parse()
+    assert YAMLParser(paquefile).parse() == YAMLParser(paquefile, cache=False).parse()
+
+
+def test_changes_invalidate_the_cache(paquefile):
+    YAMLParser(paquefile).parse()
+    with open(paquefile, "a") as appended:
+        appended.write('extra:\n  - run: "true"\n')
+    assert "extra" in YAMLParser(paquefile).parse()
+
+
+def test_touching_the_file_keeps_the_cache(paquefile, monkeypatch):
+    YAMLParser(paquefile).parse()
+    os.utime(paquefile, ns=(0, 0))
+
+    def fail(_):
+        raise AssertionError("YAML should not be loaded again")
+
+    monkeypatch.setattr("paque.parser.yaml.load", fail)
+    assert "task0" in YAMLParser(paquefile).parse()
+
+
+def test_benchmark_cold_and_warm_parse(paquefile):
+    start = time.perf_counter()
+    YAMLParser(paquefile).parse()
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    YAMLParser(paquefile).parse()
+    warm = time.perf_counter() - start
+    print(f"\ncold parse: {cold * 1000:.1f}ms, warm parse: {warm * 1000:.1f}ms")
+    assert warm < cold
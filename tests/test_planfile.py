@@ -0,0 +1,97 @@
+import json
+
+import pytest
+from paque.paque import paque
+from paque.planfile import parse_shard, read_plan, select, shard, to_dot, write_plan
+from paque.planner import Planner
+from paque.probe import Probe
+from paque.task import Task
+
+PAQUEFILE = """prepare:
+  - run: echo prepared >> log
+  - wait_until: test -f log
+process:
+  - run: echo {dataset} >> log
+  - depends:
+      - prepare
+all:
+  - depends:
+      - process dataset:a
+      - process dataset:b
+      - process dataset:c
+"""
+
+
+def _fan_out():
+    tasks = {
+        "prepare": Task("prepare", run="prepare {dataset}", wait_until=Probe("true")),
+        "process": Task("process", run="process {dataset}", depends=["prepare"]),
+        "all": Task(
+            "all",
+            depends=[f"process dataset:{dataset}" for dataset in ["a", "b", "c"]],
+        ),
+    }
+    return Planner(tasks).plan("all")
+
+
+def test_plans_are_written_and_read_back(tmp_path):
+    plan = _fan_out()
+    path = str(tmp_path / "plan.json")
+    write_plan(plan, "all", path)
+    assert read_plan(path) == plan
+    with open(path) as plan_file:
+        data = json.load(plan_file)
+    assert data["tasks"][1]["run"] == "process a"
+    assert data["edges"] == [[0, 1], [2, 3], [4, 5], [1, 6], [3, 6], [5, 6]]
+
+
+def test_plans_from_other_versions_are_refused(tmp_path):
+    path = tmp_path / "plan.json"
+    path.write_text('{"version": 0, "tasks": []}')
+    with pytest.raises(Exception, match="plan it again"):
+        read_plan(str(path))
+
+
+def test_dot():
+    dot = to_dot(_fan_out())
+    assert '"prepare dataset:a" [shape=box];' in dot
+    assert '"all" [shape=ellipse];' in dot
+    assert '"process dataset:b" -> "all";' in dot
+
+
+def test_select_keeps_dependencies():
+    names = [task.name for task in select(_fan_out(), ["process dataset:b"])]
+    assert names == ["prepare dataset:b", "process dataset:b"]
+    with pytest.raises(Exception, match="Not in the plan: process dataset:z"):
+        select(_fan_out(), ["process dataset:z"])
+
+
+def test_shards_split_the_work():
+    plan = _fan_out()
+    shards = [[task.name for task in shard(plan, index, 2)] for index in [1, 2]]
+    assert shards == [
+        [
+            "prepare dataset:a",
+            "process dataset:a",
+            "prepare dataset:c",
+            "process dataset:c",
+        ],
+        ["prepare dataset:b", "process dataset:b"],
+    ]
+    assert parse_shard("2/4") == (2, 4)
+    with pytest.raises(Exception, match="between 1 and N"):
+        parse_shard("5/4")
+
+
+def test_cli_runs_a_written_plan(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "paquefile").write_text(PAQUEFILE)
+    paque(
+        ["--plan-out", "plan.json", "--dot-out", "plan.dot", "all"],
+        standalone_mode=False,
+    )
+    assert not (tmp_path / "log").exists()
+    assert (tmp_path / "plan.dot").read_text().startswith("digraph")
+    (tmp_path / "paquefile").unlink()
+    paque(["--from-plan", "plan.json", "--shard", "2/3"], standalone_mode=False)
+    assert (tmp_path / "log").read_text() == "prepared\nb\n"
@@ -102,3 +102,19 @@ def test_planner_plan_with_several_weirdly_ordered_args():
         task_a,
         task_b,
     ]
+
+
+def test_planner_instantiates_a_template_several_times():
+    complex_plan = {
+        "all": [{"depends": ["build image:a", "build image:b"]}],
+        "build": [{"run": "docker build {image}"}, {"depends": ["base image:{image}"]}],
+        "base": [{"run": "pull {image}"}],
+    }
+    plan = Planner(YAMLParser("none")._build_tasks(complex_plan)).plan("all")
+    assert [(task.name, task.run) for task in plan] == [
+        ("base image:a", "pull a"),
+        ("build image:a", "docker build a"),
+        ("base image:b", "pull b"),
+        ("build image:b", "docker build b"),
+        ("all", None),
+    ]
@@ -0,0 +1,77 @@
+import gc
+import logging
+import time
+
+import pytest
+from paque.parser import YAMLParser
+from paque.planner import Planner
+from tests import generators
+
+
+@pytest.fixture(autouse=True)
+def quiet_planner():
+    """Other planner tests enable debug logging globally, which at these sizes
+would be most of what gets measured"""
+    logger = logging.getLogger("paque")
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    yield
+    logger.setLevel(level)
+
+
+def _generated(shape, size):
+    target, tasks = generators.SHAPES[shape](size)
+    return target, YAMLParser("none")._build_tasks(tasks)
+
+
+def _chain(size):
+    return _generated("chain", size)[1]
+
+
+def _time_plan(shape, size):
+    """Garbage collection passes over everything alive (like the test suite),
+which is noise here"""
+    target, tasks = _generated(shape, size)
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        plan = Planner(tasks).plan(target)
+        elapsed = time.perf_counter() - start
+    finally:
+        gc.enable()
+    assert len(plan) >= size
+    return elapsed
+
+
+def test_deep_chains_do_not_hit_the_recursion_limit():
+    tasks = _chain(20_000)
+    plan = Planner(tasks).plan("t0")
+    assert plan[0].name == "t19999"
+    assert plan[-1].name == "t0"
+
+
+@pytest.mark.parametrize("shape", ["chain", "arguments"])
+def test_plan_time_grows_roughly_linearly(shape):
+    small = min(_time_plan(shape, 10_000) for _ in range(3))
+    large = min(_time_plan(shape, 100_000) for _ in range(2))
+    # 10x more nodes, allow generous noise on top of linear growth
+    assert large < small * 30
+
+
+def test_every_instance_of_a_template_is_planned():
+    target, tasks = _generated("arguments", 5_000)
+    plan = Planner(tasks).plan(target)
+    assert len(plan) == 5_001
+    assert len({task.run for task in plan[:-1]}) == 5_000
+
+
+def test_cycles_are_reported():
+    tasks = YAMLParser("none")._build_tasks(
+        {
+            "A": [{"depends": ["B"]}],
+            "B": [{"depends": ["C"]}],
+            "C": [{"depends": ["A"]}],
+        }
+    )
+    with pytest.raises(Exception, match="cycle found: A -> B -> C -> A"):
+        Planner(tasks).plan("A")
@@ -0,0 +1,72 @@
+import time
+
+import pytest
+from paque.async_executor import AsyncExecutor
+from paque.executor import Executor
+from paque.parser import YAMLParser
+from paque.probe import Probe
+from tests import generators
+
+
+def test_delays_back_off_with_jitter():
+    delays = Probe("true", interval=1, max_interval=4).delays()
+    bounds = [(0.5, 1), (1, 2), (2, 4), (2, 4)]
+    for low, high in bounds:
+        assert low <= next(delays) <= high
+
+
+def test_wait_until_section():
+    tasks = YAMLParser("none")._build_tasks(
+        {
+            "A": [{"wait_until": "test -f ready"}],
+            "B": [{"wait_until": {"probe": ["a", "b"], "timeout": 5}}],
+        }
+    )
+    assert tasks["A"].wait_until == Probe("test -f ready")
+    assert tasks["B"].wait_until == Probe("a\nb", timeout=5)
+
+
+@pytest.mark.parametrize(
+    "wait_until,error",
+    [
+        ({"probe": "a", "every": 1}, "Unknown wait_until setting every"),
+        ({"probe": "a", "timeout": "1"}, "timeout should be a number"),
+        ({"timeout": 1}, "should contain a probe command"),
+    ],
+)
+def test_malformed_wait_until(wait_until, error):
+    with pytest.raises(Exception, match=error):
+        YAMLParser("none")._build_tasks({"A": [{"wait_until": wait_until}]})
+
+
+@pytest.mark.parametrize("engine", [Executor, AsyncExecutor])
+def test_waits_only_until_the_probe_passes(tmp_path, engine):
+    ready = tmp_path / "ready"
+    tasks = {
+        "service": [
+            {"run": f"(sleep 0.3 && touch {ready}) &"},
+            {"wait_until": {"probe": f"test -f {ready}", "interval": 0.05}},
+        ],
+        "client": [{"run": f"test -f {ready}"}, {"depends": ["service"]}],
+    }
+    start = time.monotonic()
+    engine(generators.plan(tasks, "client")).run()
+    assert time.monotonic() - start < 2
+
+
+@pytest.mark.parametrize("engine", [Executor, AsyncExecutor])
+def test_gives_up_after_the_timeout(engine):
+    tasks = {"never": [{"wait_until": {"probe": "false", "timeout": 0.3}}]}
+    with pytest.raises(Exception, match="gave up waiting until false after 0.3s"):
+        engine(generators.plan(tasks, "never")).run()
+
+
+def test_waiting_does_not_block_other_tasks(tmp_path):
+    ready = tmp_path / "ready"
+    tasks = {
+        "waits": [{"wait_until": {"probe": f"test -f {ready}", "interval": 0.05}}],
+        "readies": [{"run": f"sleep 0.2 && touch {ready}"}],
+        "all": [{"depends": ["waits", "readies"]}],
+    }
+    AsyncExecutor(generators.plan(tasks, "all"), jobs=2).run()
+    assert ready.exists()
@@ -0,0 +1,46 @@
+import pstats
+
+from paque.paque import paque
+from paque.planner import Planner
+from paque.profiling import Profiler
+from paque.task import Task
+
+PAQUEFILE = """process:
+  - run: echo {dataset} >> log
+all:
+  - depends:
+      - process dataset:a
+      - process dataset:b
+"""
+
+
+def test_calls_are_counted_by_phase():
+    tasks = {
+        "process": Task("process", run="process {dataset}"),
+        "all": Task("all", depends=[f"process dataset:{n}" for n in range(10)]),
+    }
+    profiler = Profiler()
+    with profiler.phase("plan"):
+        plan = Planner(tasks).plan("all")
+    counts = profiler.counts()
+    assert counts["planned nodes"] == 11
+    assert counts["instances"] == 11
+    assert counts["task reprs"] == 0
+    assert counts["hashes"] == 0  # Planning goes by task keys
+    with profiler.phase("execute"):
+        set(plan)
+    assert profiler.counts()["hashes"] == 11
+    assert profiler.report().startswith("phase")
+
+
+def test_cli_writes_a_profile(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "paquefile").write_text(PAQUEFILE)
+    paque(["--profile", "profile", "all"], standalone_mode=False)
+    assert (tmp_path / "log").read_text() == "a\nb\n"
+    for name in ["parse", "plan", "execute"]:
+        stats = pstats.Stats(str(tmp_path / "profile" / f"{name}.pstats"))
+        assert stats.total_calls > 0
+    report = (tmp_path / "profile" / "report.txt").read_text()
+    assert "planned nodes: 3" in report
+    assert "allocations still alive" in report
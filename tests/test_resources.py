@@ -0,0 +1,137 @@
+import time
+
+import pytest
+from paque.async_executor import AsyncExecutor
+from paque.executor import Executor
+from paque.parser import YAMLParser
+from paque.resources import Budget, Resources
+from paque.scheduler import Scheduler
+from paque.task import Task
+from tests import generators
+
+
+def _intervals(log):
+    """Start and end of each task, from the lines it logged"""
+    intervals = {}
+    for line in log.read_text().split("\n"):
+        if len(line) > 0:
+            event, name, moment = line.split()
+            intervals.setdefault(name, {})[event] = float(moment)
+    return intervals
+
+
+def _overlap(first, second):
+    return first["start"] < second["end"] and second["start"] < first["end"]
+
+
+def _logging(name, log, duration=0.2, **resources):
+    stamp = 'python3 -c "import time; print(time.time())"'
+    run = f"echo start {name} $({stamp}) >> {log}; sleep {duration}; echo end {name} $({stamp}) >> {log}"
+    definition = [{"run": run}]
+    if len(resources) > 0:
+        definition.append({"resources": resources})
+    return definition
+
+
+def test_resources_section():
+    tasks = YAMLParser("none")._build_tasks(
+        {
+            "A": [{"resources": {"cpu": 2, "memory": 512, "locks": "docker"}}],
+            "B": [{"resources": {"locks": ["db", "docker"]}}],
+            "C": [{"run": "true"}],
+        }
+    )
+    assert tasks["A"].resources == Resources(2, 512, ("docker",))
+    assert tasks["B"].resources == Resources(1, 0, ("db", "docker"))
+    assert tasks["C"].resources is None
+
+
+@pytest.mark.parametrize(
+    "resources,error",
+    [
+        ({"disk": 1}, "Unknown resource disk"),
+        ({"cpu": "2"}, "cpu should be an integer"),
+        ({"cpu": 0}, "at least 1 cpu"),
+        ({"locks": [1]}, "Locks should be a string"),
+        ("docker", "should be a dictionary"),
+    ],
+)
+def test_invalid_resources(resources, error):
+    with pytest.raises(Exception, match=error):
+        YAMLParser("none")._build_tasks({"A": [{"resources": resources}]})
+
+
+def test_locks_take_arguments():
+    tasks = {"A": Task("A", resources=Resources(locks=("db-{env}",)))}
+    instance = tasks["A"].with_args(["env:test"])
+    assert instance.resources == Resources(locks=("db-test",))
+
+
+def test_budget_packs_what_fits():
+    budget = Budget(4, memory=1000)
+    heavy = Resources(cpu=3, memory=800)
+    assert budget.fits(Resources(cpu=8, memory=2000))  # Nothing running
+    budget.acquire(heavy)
+    assert not budget.fits(Resources(cpu=2))
+    assert not budget.fits(Resources(memory=300))
+    assert budget.fits(Resources(memory=200, locks=("docker",)))
+    budget.acquire(Resources(memory=200, locks=("docker",)))
+    assert budget.full()
+    budget.release(heavy)
+    assert not budget.fits(Resources(locks=("docker",)))
+    assert budget.fits(Resources(locks=("db",)))
+
+
+def test_scheduler_skips_what_does_not_fit():
+    plan = [Task("A", resources=Resources(cpu=4)), Task("B"), Task("C")]
+    scheduler = Scheduler(plan)
+    assert scheduler.pop_ready_if(lambda task: task.resources is None).name == "B"
+    assert scheduler.pop_ready().name == "A"
+
+
+def test_budget_holds_back_on_load_average():
+    load = [4.0]
+    budget = Budget(4, load_average=2.0, getloadavg=lambda: (load[0], 0, 0))
+    assert not budget.full()  # Nothing running
+    budget.acquire(None)
+    assert budget.full()
+    budget.release(None)
+    budget.acquire(None)
+    load[0] = 1.0
+    assert budget.full()  # Not looked at again yet
+    budget._load_checked = 0.0
+    assert not budget.full()
+
+
+@pytest.mark.parametrize("engine", [Executor, AsyncExecutor])
+def test_tasks_sharing_a_lock_do_not_overlap(tmp_path, engine):
+    log = tmp_path / "log"
+    tasks = {
+        "A": _logging("A", log, locks="docker"),
+        "B": _logging("B", log, locks="docker"),
+        "C": _logging("C", log),
+        "all": [{"depends": ["A", "B", "C"]}],
+    }
+    engine(generators.plan(tasks, "all"), jobs=3).run()
+    intervals = _intervals(log)
+    assert not _overlap(intervals["A"], intervals["B"])
+    assert _overlap(intervals["A"], intervals["C"]) or _overlap(
+        intervals["B"], intervals["C"]
+    )
+
+
+def test_cpu_slots_limit_what_runs_together(tmp_path):
+    log = tmp_path / "log"
+    tasks = {
+        "A": _logging("A", log, cpu=2),
+        "B": _logging("B", log, cpu=2),
+        "C": _logging("C", log, cpu=8),
+        "all": [{"depends": ["A", "B", "C"]}],
+    }
+    start = time.monotonic()
+    Executor(generators.plan(tasks, "all"), jobs=3).run()
+    assert time.monotonic() - start >= 0.6
+    intervals = _intervals(log)
+    assert not _overlap(intervals["A"], intervals["B"])
+    assert not _overlap(intervals["A"], intervals["C"])
+    assert not _overlap(intervals["B"], intervals["C"])
@@ -0,0 +1,29 @@
+from paque.scheduler import Scheduler
+from paque.task import Task
+
+
+def _diamond():
+    task_d = Task("D")
+    task_b = Task("B", depends=[task_d])
+    task_c = Task("C", depends=[task_d])
+    task_a = Task("A", depends=[task_b, task_c])
+    return [task_d, task_b, task_c, task_a]
+
+
+def test_only_tasks_without_dependencies_are_ready():
+    scheduler = Scheduler(_diamond())
+    assert scheduler.pop_ready().name == "D"
+    assert not scheduler.has_ready()
+
+
+def test_finishing_releases_dependents_in_plan_order():
+    plan = _diamond()
+    scheduler = Scheduler(plan)
+    scheduler.done(scheduler.pop_ready())
+    assert [scheduler.pop_ready().name, scheduler.pop_ready().name] == ["B", "C"]
+    scheduler.done(plan[2])
+    assert not scheduler.has_ready()
+    scheduler.done(plan[1])
+    assert scheduler.pop_ready().name == "A"
+    scheduler.done(plan[3])
+    assert scheduler.finished()
@@ -0,0 +1,65 @@
+import io
+import subprocess
+import time
+
+import pytest
+from paque.executor import Executor
+from paque.parser import YAMLParser
+from paque.planner import Planner
+from paque.shellpool import ShellPool
+
+
+@pytest.fixture
+def pool():
+    shell_pool = ShellPool(2)
+    yield shell_pool
+    shell_pool.close()
+
+
+def _run(pool, command, **kwargs):
+    output = io.BytesIO()
+    returncode = pool.run(command, [output], **kwargs)
+    return returncode, output.getvalue()
+
+
+def test_commands_do_not_leak_into_each_other(pool):
+    assert _run(pool, "cd /; export LEAK=1; exit 3") == (3, b"")
+    assert _run(pool, 'echo "${LEAK:-none}"') == (0, b"none\n")
+
+
+def test_cwd_and_environment_per_command(pool, tmp_path):
+    command = 'pwd; echo "$GREETING"'
+    result = _run(pool, command, cwd=str(tmp_path), env={"GREETING": "a b"})
+    assert result == (0, f"{tmp_path}\na b\n".encode("utf-8"))
+
+
+def test_output_is_framed_exactly(pool):
+    assert _run(pool, "printf 'no newline'") == (0, b"no newline")
+    assert _run(pool, "printf '\\n\\n'; echo err >&2") == (0, b"\n\nerr\n")
+    assert _run(pool, "echo '__paque_fake__ 1'; cat") == (0, b"__paque_fake__ 1\n")
+
+
+def test_executor_uses_the_pool(pool, tmp_path):
+    tasks = {
+        "A": [{"run": f"echo a > {tmp_path / 'a'}"}],
+        "B": [{"run": "exit 4"}, {"depends": ["A"]}],
+    }
+    plan = Planner(YAMLParser("none")._build_tasks(tasks)).plan("B")
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        Executor(plan, shell_pool=pool).run()
+    assert error.value.returncode == 4
+    assert (tmp_path / "a").read_text() == "a\n"
+
+
+def test_benchmark_small_commands(pool):
+    commands = 200
+    start = time.perf_counter()
+    for _ in range(commands):
+        subprocess.run("true", shell=True, check=True)
+    spawned = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(commands):
+        pool.run("true", [])
+    pooled = time.perf_counter() - start
+    print(f"\n{commands} commands: {spawned:.3f}s spawned, {pooled:.3f}s pooled")
+    assert pooled < spawned
@@ -0,0 +1,66 @@
+import io
+import logging
+
+from paque.async_executor import AsyncExecutor
+from paque.executor import Executor
+from paque.spool import LogSpool, SpoolFile, Tail
+from paque.task import Task
+from tests import generators
+
+
+def test_tail_keeps_the_last_bytes():
+    tail = Tail(max_bytes=4)
+    for chunk in [b"ab", b"cdef", b"g"]:
+        tail.write(chunk)
+    assert tail.getvalue() == b"defg"
+
+
+def test_spool_files_rotate(tmp_path):
+    path = str(tmp_path / "task.log")
+    spool_file = SpoolFile(path, max_bytes=4, backups=2)
+    for chunk in [b"aaa", b"bbb", b"ccc", b"ddd"]:
+        spool_file.write(chunk)
+    spool_file.close()
+    rotated = [path, path + ".1", path + ".2"]
+    assert [open(name, "rb").read() for name in rotated] == [b"ddd", b"ccc", b"bbb"]
+    assert not (tmp_path / "task.log.3").exists()
+
+
+def test_condition_output_only_keeps_the_tail(caplog):
+    tasks = {
+        "A": [
+            {"run": "true"},
+            {"condition": "yes x | tr -d '\\n' | head -c 1000000; false"},
+        ]
+    }
+    with caplog.at_level(logging.WARNING, logger="paque"):
+        Executor(generators.plan(tasks, "A")).run()
+    warning = caplog.records[-1].getMessage()
+    assert warning.endswith("x" * 4096)
+    assert len(warning) < 5000
+
+
+def test_task_output_is_spooled(tmp_path, capfdbinary):
+    spool = LogSpool(str(tmp_path))
+    tasks = {"A": [{"run": "echo out; echo err >&2"}]}
+    Executor(generators.plan(tasks, "A"), spool=spool).run()
+    assert open(spool.path(Task("A")), "rb").read() == b"out\nerr\n"
+    assert capfdbinary.readouterr().out == b"out\nerr\n"
+
+
+def test_async_output_is_spooled(tmp_path):
+    spool = LogSpool(str(tmp_path))
+    plan = generators.plan({"A": [{"run": "echo out"}]}, "A")
+    executor = AsyncExecutor(plan, spool=spool)
+    executor._stdout = io.BytesIO()
+    executor.run()
+    assert open(spool.path(Task("A")), "rb").read() == b"out\n"
+    assert executor._stdout.getvalue() == b"[A] out\n"
+
+
+def test_output_is_spooled_under_the_state_folder_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    spool = LogSpool()
+    Executor(generators.plan({"A": [{"run": "echo out"}]}, "A"), spool=spool).run()
+    assert spool.path(Task("A")) == str(tmp_path / ".paque" / "logs" / "A.log")
+    assert (tmp_path / ".paque" / "logs" / "A.log").read_bytes() == b"out\n"
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("click")
+
+# Cumulative import time of the CLI module, in microseconds. Most of it is
+# click, keep it that way
+STARTUP_BUDGET_US = 150_000
+
+DEFERRED = ["yaml", "colorlog", "subprocess", "paque.parser", "paque.executor"]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENVIRONMENT = dict(os.environ, PYTHONPATH=ROOT)
+
+
+def _import_times(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=ENVIRONMENT,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_defers_heavy_imports():
+    times = _import_times("paque.paque")
+    assert [module for module in DEFERRED if module in times] == []
+    assert times["paque.paque"] < STARTUP_BUDGET_US
+
+
+def test_dry_run_does_not_import_subprocess(tmp_path):
+    (tmp_path / "paquefile.yaml").write_text('a:\n  - run: "true"\n')
+    code = (
+        "import sys\n"
+        "from paque.paque import paque\n"
+        "paque(['--dry-run', 'a'], standalone_mode=False)\n"
+        "assert 'subprocess' not in sys.modules\n"
+    )
+    subprocess.run(
+        [sys.executable, "-c", code], cwd=tmp_path, env=ENVIRONMENT, check=True
+    )
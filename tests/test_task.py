@@ -12,7 +12,26 @@ def test_double_interpolate_task_(parameter):
     dic = {"name": "C", parameter: "{arg1} {arg2}"}
     task = Task(**dic)
     args = ["arg1:argument_to_C", "arg2:argument_to_C_2"]
-    task.with_args(args)
+    task = task.with_args(args)
     print(task)
     assert getattr(task, parameter) == "argument_to_C argument_to_C_2"
     assert task.name == "C arg1:argument_to_C arg2:argument_to_C_2"
+
+
+def test_with_args_returns_a_new_task():
+    template = Task("C", run="{arg}", depends=["D arg:{arg}"])
+    task = template.with_args(["arg:x"])
+    assert template.run == "{arg}"
+    assert task.run == "x"
+    assert task.depends == ("D arg:x",)
+    with pytest.raises(AttributeError):
+        task.run = "y"
+
+
+def test_tasks_are_identified_by_template_and_sorted_arguments():
+    first = Task("C a:1 b:2", depends=[Task("D b:2 a:1")])
+    second = Task("C b:2 a:1", depends=["D a:1 b:2"])
+    assert first.key == ("C", ("a:1", "b:2"))
+    assert first == second
+    assert len({first, second}) == 1
+    assert first != Task("C a:1 b:2", run="other")
@@ -0,0 +1,49 @@
+import json
+
+from paque.executor import Executor
+from paque.parser import YAMLParser
+from paque.planner import Planner
+from paque.task import Task
+from paque.trace import Tracer
+
+
+def test_critical_path_follows_the_slowest_chain():
+    task_d = Task("D")
+    task_b = Task("B", depends=[task_d])
+    task_c = Task("C", depends=[task_d])
+    task_a = Task("A", depends=[task_b, task_c])
+    tracer = Tracer()
+    tracer._durations = {"D": 1.0, "B": 0.5, "C": 2.0, "A": 0.25}
+    assert tracer.critical_path([task_d, task_b, task_c, task_a]) == (
+        3.25,
+        ["D", "C", "A"],
+    )
+
+
+def test_trace_has_every_phase_with_resource_usage(tmp_path):
+    tasks = {
+        "A": [{"run": "true"}, {"condition": "true"}, {"sleep": 0}],
+        "B": [{"run": "true"}, {"depends": ["A"]}],
+    }
+    plan = Planner(YAMLParser("none")._build_tasks(tasks)).plan("B")
+    tracer = Tracer()
+    Executor(plan, jobs=2, tracer=tracer).run()
+    path = tmp_path / "trace.json"
+    tracer.write(str(path))
+    events = [
+        event
+        for event in json.loads(path.read_text())["traceEvents"]
+        if event["ph"] == "X"
+    ]
+    phases = sorted((event["name"], event["cat"]) for event in events)
+    assert phases == [
+        ("A", "condition"),
+        ("A", "run"),
+        ("A", "sleep"),
+        ("A", "task"),
+        ("B", "run"),
+        ("B", "task"),
+    ]
+    run = next(event for event in events if event["cat"] == "run")
+    assert {"user_s", "sys_s", "max_rss_kb"} <= set(run["args"])
+    assert run["args"]["max_rss_kb"] > 0
@@ -0,0 +1,135 @@
+from paque.watch import (
+    DefinitionCache,
+    InotifyWatcher,
+    PollingWatcher,
+    Watch,
+    split_definitions,
+)
+
+PAQUEFILE = """# Builds things
+A:
+  - run: echo A
+  - inputs: a/*.txt
+B:
+  - run: echo B
+  - depends:
+      - A
+C:
+  - run: echo C
+  - inputs: c.txt
+all:
+  - depends:
+      - B
+      - C
+"""
+
+
+class FakeWatcher:
+    def __init__(self):
+        self.directories = set()
+
+    def watch(self, directory):
+        self.directories.add(directory)
+
+    def changes(self, timeout):
+        return set()
+
+    def close(self):
+        pass
+
+
+def _watch(tmp_path, runs):
+    paquefile = tmp_path / "paquefile"
+    paquefile.write_text(PAQUEFILE)
+    return Watch(
+        str(paquefile),
+        "all",
+        lambda plan: runs.append([task.name for task in plan]),
+        watcher=FakeWatcher(),
+    )
+
+
+def test_split_definitions_by_top_level_task():
+    chunks = split_definitions(PAQUEFILE)
+    assert [chunk.split(":")[0] for chunk in chunks[1:]] == ["A", "B", "C", "all"]
+    assert "".join(chunks) == PAQUEFILE
+
+
+def test_only_changed_definitions_are_loaded_again(monkeypatch):
+    cache = DefinitionCache()
+    assert cache.load(PAQUEFILE) == {"A", "B", "C", "all"}
+    loaded = []
+    load = DefinitionCache._load
+    monkeypatch.setattr(
+        DefinitionCache,
+        "_load",
+        staticmethod(lambda text: loaded.append(text) or load(text)),
+    )
+    assert cache.load(PAQUEFILE.replace("echo B", "echo b")) == {"B"}
+    assert len(loaded) == 1
+    assert cache.definitions["B"][0] == {"run": "echo b"}
+
+
+def test_changed_inputs_run_only_downstream(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runs = []
+    watch = _watch(tmp_path, runs)
+    watch.start()
+    assert runs == [["A", "B", "C", "all"]]
+    watch.step({str(tmp_path / "c.txt")})
+    assert runs[-1] == ["C", "all"]
+    watch.step({str(tmp_path / "a" / "x.txt")})
+    assert runs[-1] == ["A", "B", "all"]
+    assert watch.step({str(tmp_path / "unrelated")}) == []
+
+
+def test_changed_paquefile_runs_changed_tasks(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runs = []
+    watch = _watch(tmp_path, runs)
+    watch.start()
+    paquefile = tmp_path / "paquefile"
+    paquefile.write_text(PAQUEFILE.replace("echo B", "echo b"))
+    watch.step({str(paquefile)})
+    assert runs[-1] == ["B", "all"]
+    paquefile.write_text(PAQUEFILE.replace("- A", "- Z"))
+    assert watch.step({str(paquefile)}) == []  # Z does not exist, nothing runs
+
+
+def test_changed_included_paquefile_runs_changed_tasks(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "paquefile").write_text(
+        "include:\n  svc: svc/paquefile\nall:\n  - depends:\n      - svc:B\n"
+    )
+    included = tmp_path / "svc" / "paquefile"
+    included.parent.mkdir()
+    included.write_text(PAQUEFILE)
+    runs = []
+    watcher = FakeWatcher()
+    watch = Watch(
+        str(tmp_path / "paquefile"),
+        "all",
+        lambda plan: runs.append([task.name for task in plan]),
+        watcher=watcher,
+    )
+    watch.start()
+    assert runs == [["svc:A", "svc:B", "all"]]
+    assert str(included.parent) in watcher.directories
+    included.write_text(PAQUEFILE.replace("echo B", "echo b, changed"))
+    watch.step({str(included)})
+    assert runs[-1] == ["svc:B", "all"]
+
+
+def test_watchers_report_changes(tmp_path):
+    watchers = [PollingWatcher(interval=0.05)]
+    try:
+        watchers.append(InotifyWatcher())
+    except (OSError, AttributeError):  # Not on Linux
+        pass
+    for watcher in watchers:
+        watcher.watch(str(tmp_path))
+        path = tmp_path / f"{type(watcher).__name__}.txt"
+        path.write_text("changed")
+        assert str(path) in watcher.changes(1)
+        assert watcher.changes(0.1) == set()
+        watcher.close()